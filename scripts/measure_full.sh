@@ -21,3 +21,6 @@ python3 gas-cost-estimator/src/instrumentation_measurement/measurements.py measu
 echo running Revm...
 python3 gas-cost-estimator/src/instrumentation_measurement/measurements.py measure --input_file gas-cost-estimator/src/stage4/pg_marginal_full5_c50_step5_shuffle.csv --evm revm --sample_size 10 > results_revm.csv
 
+
+# Alternatively, on a machine with enough cores, measure all the clients at once, each on its own cores:
+# python3 gas-cost-estimator/src/instrumentation_measurement/measurements.py measure --input_file gas-cost-estimator/src/stage4/pg_marginal_full5_c50_step5_shuffle.csv --evm evmone,geth,nethermind,ethereumjs,erigon,besu,revm --sample_size 10 --output_file "results_{evm}.csv"
@@ -0,0 +1,466 @@
+import csv
+import fire
+import math
+import sys
+
+import numpy
+
+from estimate_marginal import boxplot_outliers, format_number, group_ids, read_results
+
+"""
+The `measure_arguments` estimation of `measure_arguments_single.Rmd`, without R and without the report. For a quick
+feedback on the impact of the arguments, the numbers only:
+```
+python3 estimate_arguments.py estimate --env geth --programs pg_arguments_full.csv --results results_arguments_full_geth.csv
+```
+
+The same steps as in the notebook:
+- the results are joined with the programs by `program_id`, the arity of an opcode is the number of its arguments
+  and must be the same in all its programs
+- the outliers are removed by the boxplot rule in every (opcode, op_count) group, as in `estimate_marginal.py`
+- every opcode gets the notebook's `lm` model of its arity, e.g.
+  `measure_total_time_ns ~ op_count + arg0 + arg1 + arg0:op_count + arg1:op_count` for the binary ones, with
+  the `expensive` mode for the division and modulo opcodes and the discounted `arg0` for the BLS MSMs.
+  As `lm` does, the terms which are collinear with the preceding ones (e.g. of a constant argument) are dropped,
+  their coefficients are NA
+- the p-values are of the two-sided t-tests of the coefficients, an argument is impacting if its `op_count:argN`
+  coefficient has the p-value below 0.001 and is above 1% of the `op_count` one. Some arguments are impacting
+  by definition, e.g. the size of KECCAK256
+
+The models are not fitted one by one: the rows are sorted by opcode and the normal equations of all the opcodes are
+built with one pass over the rows per pair of terms, then pivoted and solved as a stack of small matrices.
+
+The output CSV has the columns of the notebook's `output_estimated_cost`. With `marginal_estimated_cost`, the
+opcode costs are compared with the marginal estimation, as in the notebook's "Verification against marginal
+estimations", and the comparison is printed to STDERR or written to `output_compare_marginal`.
+"""
+
+ESTIMATES_HEADER = ['opcode', 'intercept', 'intercept_p', 'estimate_marginal_ns', 'estimate_marginal_ns_p',
+                    'arg0_ns_raw', 'arg1_ns_raw', 'arg2_ns_raw', 'arg0_ns_p', 'arg1_ns_p', 'arg2_ns_p',
+                    'expensive_ns_raw', 'expensive_ns_p', 'has_impacting_arg0', 'has_impacting_arg1',
+                    'has_impacting_arg2', 'env', 'has_impacting']
+COMPARE_HEADER = ['opcode', 'opcode_cost(arguments)', 'opcode_cost(marginal)', 'rel diff']
+
+# the terms of the models, in the order of the `lm` coefficients
+TERMS = ['(Intercept)', 'op_count', 'arg0', 'arg1', 'arg2', 'expensive',
+         'op_count:arg0', 'op_count:arg1', 'op_count:arg2', 'op_count:expensive']
+INTERCEPT, OP_COUNT, EXPENSIVE = 0, 1, 5
+ARGS = [2, 3, 4]
+OP_COUNT_ARGS = [6, 7, 8]
+OP_COUNT_EXPENSIVE = 9
+
+DIV_OPCODES = ['DIV', 'MOD', 'SDIV', 'SMOD']
+EXPENSIVE_OPCODES = DIV_OPCODES + ['ADDMOD', 'MULMOD']
+P_VALUE_THRESH = 0.001
+IMPACT_RATIO = 0.01
+# `lm` drops a term if its norm, orthogonal to the preceding terms, is below `tol` of its norm
+LM_TOLERANCE = 1e-7
+# the arguments explicitly expressed in the current gas cost calculation
+IMPACTING_ARGS = {
+    'EXP': 1, 'KECCAK256': 1, 'CALLDATACOPY': 2, 'CODECOPY': 2, 'EXTCODECOPY': 2, 'RETURNDATACOPY': 2,
+    'MCOPY': 2, 'LOG0': 1, 'LOG1': 1, 'LOG2': 1, 'LOG3': 1, 'LOG4': 1, 'CREATE': 2, 'RETURN': 1, 'CREATE2': 2,
+    'REVERT': 1, 'BLS12_G1MSM': 0, 'BLS12_G2MSM': 0, 'BLS12_G1MSM_S': 0, 'BLS12_G2MSM_S': 0,
+    'BLS12_PAIRING_CHECK': 0,
+}
+
+# the discount (per mille) of the BLS MSMs for k = 1..128 pairs, there is no linear dependency on arg0
+BLS_G1MSM_DISCOUNT = [
+    1000, 949, 848, 797, 764, 750, 738, 728, 719, 712, 705, 698, 692, 687, 682, 677, 673, 669, 665, 661, 658, 654,
+    651, 648, 645, 642, 640, 637, 635, 632, 630, 627, 625, 623, 621, 619, 617, 615, 613, 611, 609, 608, 606, 604,
+    603, 601, 599, 598, 596, 595, 593, 592, 591, 589, 588, 586, 585, 584, 582, 581, 580, 579, 577, 576, 575, 574,
+    573, 572, 570, 569, 568, 567, 566, 565, 564, 563, 562, 561, 560, 559, 558, 557, 556, 555, 554, 553, 552, 551,
+    550, 549, 548, 547, 547, 546, 545, 544, 543, 542, 541, 540, 540, 539, 538, 537, 536, 536, 535, 534, 533, 532,
+    532, 531, 530, 529, 528, 528, 527, 526, 525, 525, 524, 523, 522, 522, 521, 520, 520, 519,
+]
+BLS_G2MSM_DISCOUNT = [
+    1000, 1000, 923, 884, 855, 832, 812, 796, 782, 770, 759, 749, 740, 732, 724, 717, 711, 704, 699, 693, 688, 683,
+    679, 674, 670, 666, 663, 659, 655, 652, 649, 646, 643, 640, 637, 634, 632, 629, 627, 624, 622, 620, 618, 615,
+    613, 611, 609, 607, 606, 604, 602, 600, 598, 597, 595, 593, 592, 590, 589, 587, 586, 584, 583, 582, 580, 579,
+    578, 576, 575, 574, 573, 571, 570, 569, 568, 567, 566, 565, 563, 562, 561, 560, 559, 558, 557, 556, 555, 554,
+    553, 552, 552, 551, 550, 549, 548, 547, 546, 545, 545, 544, 543, 542, 541, 541, 540, 539, 538, 537, 537, 536,
+    535, 535, 534, 533, 532, 532, 531, 530, 530, 529, 528, 528, 527, 526, 526, 525, 524, 524,
+]
+BLS_MSM_DISCOUNTS = {
+    'BLS12_G1MSM': BLS_G1MSM_DISCOUNT,
+    'BLS12_G1MSM_S': BLS_G1MSM_DISCOUNT,
+    'BLS12_G2MSM': BLS_G2MSM_DISCOUNT,
+    'BLS12_G2MSM_S': BLS_G2MSM_DISCOUNT,
+}
+# the reference opcode of the marginal estimation and the arg0 it was measured with
+MARGINAL_REFERENCES = {
+    'BLS12_G1MSM': ('BLS12_G1MSM_K2', 1.898),
+    'BLS12_G1MSM_S': ('BLS12_G1MSM_K2', 1.898),
+    'BLS12_G2MSM': ('BLS12_G2MSM_K2', 2),
+    'BLS12_G2MSM_S': ('BLS12_G2MSM_K2', 2),
+    'BLS12_PAIRING_CHECK': ('BLS12_PAIRING_CHECK', 2),
+}
+# the continued fraction of the incomplete beta function
+BETA_ITERATIONS = 10000
+BETA_EPSILON = 1e-15
+
+
+class ArgumentsEstimator(object):
+    """
+    Estimates the impact of the arguments on the cost of every opcode from the programs and the results of
+    `measurements.py`
+    """
+
+    def estimate(self, env="", programs="", results="", marginal_estimated_cost="", output_estimated_cost="",
+                 output_compare_marginal="", remove_outliers=True):
+        """
+        Parameters:
+        env (string): the name of EVM client, written to the env column
+        programs (string): the file with the programs, `program_id,opcode,op_count,arg0,arg1,arg2,...`
+        results (string): the file with the results, `program_id,sample_id,total_time_ns,...`
+        marginal_estimated_cost (string): the optional comma separated list of the estimated cost files of the
+          marginal procedure, to compare the opcode costs with
+        output_estimated_cost (string): the output CSV file with the estimated costs, defaults to STDOUT
+        output_compare_marginal (string): the output CSV file with the comparison, defaults to STDERR
+        remove_outliers (boolean): remove the outlying measurements, as the notebook does by default
+        """
+        if env == "":
+            print("The env parameter is required, the name of EVM client")
+            return
+        if programs == "" or results == "":
+            print("The programs and results parameters are required")
+            return
+
+        marginal_costs = None
+        if marginal_estimated_cost != "":
+            marginal_costs = read_marginal_estimated_cost(marginal_estimated_cost.split(','))
+            if len(marginal_costs) == 0:
+                print("No marginal estimated cost data found")
+                return
+            if any(cost_env != env for _, _, cost_env in marginal_costs):
+                print("Invalid EVM in marginal estimated cost files, all must be {}".format(env))
+                return
+
+        opcodes, arities, program_args = read_programs(programs)
+        if arities is None:
+            print("The programs arity is inconsistent, all the programs of an opcode must have the same arguments")
+            return
+        for opcode, arity in zip(opcodes, arities):
+            if opcode in EXPENSIVE_OPCODES and arity < 2:
+                print("The expensive mode of {} is not supported for its arity {}".format(opcode, arity))
+                return
+        program_ids, times = read_results(results, ('measure_total_time_ns', 'total_time_ns'))
+        opcode_ids, op_counts, args, times = join_programs(program_args, program_ids, times)
+        if remove_outliers:
+            kept = ~boxplot_outliers(group_ids(opcode_ids, op_counts), times)
+            opcode_ids, op_counts, args, times = opcode_ids[kept], op_counts[kept], args[kept], times[kept]
+        measured = numpy.bincount(opcode_ids, minlength=len(opcodes)) > 0
+
+        terms = model_terms(opcodes, arities)
+        design, kept = design_matrix(opcodes, opcode_ids, op_counts, args)
+        coefficients, p_values = fit_models(opcode_ids[kept], design[kept], times[kept], terms)
+        estimates = [opcode_estimates(opcode, coefficients[opcode_id], p_values[opcode_id], env)
+                     for opcode_id, opcode in enumerate(opcodes) if measured[opcode_id]]
+
+        output = sys.stdout if output_estimated_cost == "" else open(output_estimated_cost, 'w', newline='')
+        try:
+            writer = csv.writer(output, lineterminator='\n')
+            writer.writerow(ESTIMATES_HEADER)
+            for estimate in estimates:
+                writer.writerow([format_value(estimate[column]) for column in ESTIMATES_HEADER])
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        if marginal_costs is not None:
+            output = sys.stderr if output_compare_marginal == "" else open(output_compare_marginal, 'w', newline='')
+            try:
+                writer = csv.writer(output, lineterminator='\n')
+                writer.writerow(COMPARE_HEADER)
+                for row in compare_marginal(estimates, marginal_costs):
+                    writer.writerow([format_value(value) for value in row])
+            finally:
+                if output is not sys.stderr:
+                    output.close()
+
+
+def read_programs(programs_file):
+    """
+    The opcodes sorted, the arity of every opcode and the (opcode index, op_count, arg0, arg1, arg2) of every
+    program_id, with NaN for the missing arguments. The arities are None if they differ between the programs of an
+    opcode
+    """
+    with open(programs_file, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        program_id_column, opcode_column, op_count_column = (header.index(column)
+                                                             for column in ('program_id', 'opcode', 'op_count'))
+        arg_columns = [header.index(column) for column in ('arg0', 'arg1', 'arg2') if column in header]
+        programs = [(row[program_id_column], row[opcode_column], float(row[op_count_column]),
+                     *(_argument(row[column]) for column in arg_columns), *[math.nan] * (3 - len(arg_columns)))
+                    for row in reader]
+    opcodes = sorted({program[1] for program in programs})
+    opcode_index = {opcode: index for index, opcode in enumerate(opcodes)}
+    arities = [None] * len(opcodes)
+    program_args = {}
+    for program_id, opcode, op_count, *args in programs:
+        opcode_id = opcode_index[opcode]
+        arity = sum(not math.isnan(arg) for arg in args)
+        if arities[opcode_id] is not None and arities[opcode_id] != arity:
+            return opcodes, None, program_args
+        arities[opcode_id] = arity
+        program_args[program_id] = (opcode_id, op_count, *args)
+    return opcodes, arities, program_args
+
+
+def _argument(value):
+    # R reads both the empty and NA values as NA
+    if value == '' or value == 'NA':
+        return math.nan
+    return float(value)
+
+
+def join_programs(program_args, program_ids, times):
+    """
+    Drops the results of unknown programs. Returns the opcode index, op_count, arguments and time of every result
+    """
+    program_index = {program_id: index for index, program_id in enumerate(program_args)}
+    result_programs = numpy.fromiter((program_index.get(program_id, -1) for program_id in program_ids),
+                                     dtype=numpy.int64, count=len(program_ids))
+    kept = result_programs >= 0
+    result_programs = result_programs[kept]
+    programs = numpy.array(list(program_args.values()), dtype=float).reshape(-1, 5)[result_programs]
+    return programs[:, 0].astype(numpy.int64), programs[:, 1], programs[:, 2:], times[kept]
+
+
+def model_terms(opcodes, arities):
+    """
+    The mask of the terms (see `TERMS`) in the model of every opcode
+    """
+    terms = numpy.zeros((len(opcodes), len(TERMS)), dtype=bool)
+    for opcode_id, (opcode, arity) in enumerate(zip(opcodes, arities)):
+        terms[opcode_id, [INTERCEPT, OP_COUNT]] = True
+        if opcode in BLS_MSM_DISCOUNTS:
+            arity = 1
+        elif opcode in EXPENSIVE_OPCODES:
+            terms[opcode_id, [EXPENSIVE, OP_COUNT_EXPENSIVE]] = True
+        terms[opcode_id, ARGS[:arity]] = True
+        terms[opcode_id, OP_COUNT_ARGS[:arity]] = True
+    return terms
+
+
+def design_matrix(opcodes, opcode_ids, op_counts, args):
+    """
+    The values of all `TERMS` for every result and the mask of the results which can be used. The arg0 of the BLS
+    MSMs is discounted, the results of these with an unknown k are not used
+    """
+    args = args.copy()
+    expensive = numpy.zeros(len(op_counts))
+    kept = numpy.ones(len(op_counts), dtype=bool)
+    for opcode_id, opcode in enumerate(opcodes):
+        if opcode not in EXPENSIVE_OPCODES and opcode not in BLS_MSM_DISCOUNTS:
+            continue
+        rows = opcode_ids == opcode_id
+        if opcode in DIV_OPCODES:
+            expensive[rows] = args[rows, 0] > args[rows, 1]
+        elif opcode == 'ADDMOD':
+            # remember that argX is the byte-size of the argument in these measurements
+            expensive[rows] = 8.0 ** args[rows, 0] + 8.0 ** args[rows, 1] > 8.0 ** args[rows, 2]
+        elif opcode == 'MULMOD':
+            expensive[rows] = args[rows, 0] + args[rows, 1] > args[rows, 2]
+        elif opcode in BLS_MSM_DISCOUNTS:
+            discounts = numpy.array([math.nan] + BLS_MSM_DISCOUNTS[opcode])
+            k = args[rows, 0]
+            known = (k >= 1) & (k < len(discounts)) & (k == numpy.floor(k))
+            args[rows, 0] = numpy.where(known, k * discounts[numpy.where(known, k, 0).astype(int)], math.nan)
+            kept[rows] = known
+
+    # the arguments out of an opcode's model are NaN and not used
+    args = numpy.nan_to_num(args)
+    design = numpy.column_stack([numpy.ones(len(op_counts)), op_counts, args, expensive,
+                                 op_counts[:, None] * args, op_counts * expensive])
+    return design, kept
+
+
+def fit_models(opcode_ids, design, times, terms):
+    """
+    The least squares coefficients of every opcode's model and their p-values, NaN for the terms out of the model
+    or dropped as collinear
+    """
+    opcodes_count, terms_count = terms.shape
+    coefficients = numpy.full((opcodes_count, terms_count), math.nan)
+    p_values = numpy.full((opcodes_count, terms_count), math.nan)
+    if len(times) == 0:
+        return coefficients, p_values
+
+    order = numpy.argsort(opcode_ids, kind='stable')
+    opcode_ids, times = opcode_ids[order], times[order]
+    design = design[order] * terms[opcode_ids]
+    fitted, starts, counts = numpy.unique(opcode_ids, return_index=True, return_counts=True)
+    terms = terms[fitted]
+
+    # the normal equations of all the opcodes, X'X and X'y, by the sums over the rows of every opcode
+    xtx = numpy.empty((len(fitted), terms_count, terms_count))
+    for i in range(terms_count):
+        for j in range(i, terms_count):
+            xtx[:, i, j] = xtx[:, j, i] = numpy.add.reduceat(design[:, i] * design[:, j], starts)
+    xty = numpy.stack([numpy.add.reduceat(design[:, i] * times, starts) for i in range(terms_count)], axis=1)
+
+    # scaled to unit norm columns, the Gram-Schmidt residual of a term is its pivot in the elimination
+    norms = numpy.sqrt(numpy.einsum('kii->ki', xtx))
+    used = terms & (norms > 0)
+    scales = numpy.where(used, norms, 1)
+    scaled = xtx / (scales[:, :, None] * scales[:, None, :])
+    eliminated = scaled.copy()
+    for term in range(terms_count):
+        pivots = eliminated[:, term, term]
+        used[:, term] &= pivots > LM_TOLERANCE ** 2
+        sweep = numpy.where(used[:, term], 1 / numpy.where(used[:, term], pivots, 1), 0)
+        eliminated -= (eliminated[:, :, term, None] * eliminated[:, None, term, :]) * sweep[:, None, None]
+
+    # the dropped terms get a unit row and column, so their coefficients are zero
+    used_pairs = used[:, :, None] & used[:, None, :]
+    scaled = numpy.where(used_pairs, scaled, 0) + (~used[:, :, None] & numpy.eye(terms_count, dtype=bool))
+    inverse = numpy.linalg.inv(scaled) / (scales[:, :, None] * scales[:, None, :])
+    fitted_coefficients = numpy.einsum('kij,kj->ki', inverse, numpy.where(used, xty, 0))
+
+    positions = numpy.repeat(numpy.arange(len(fitted)), counts)
+    residuals = times - numpy.einsum('ni,ni->n', design, fitted_coefficients[positions])
+    residual_df = counts - used.sum(axis=1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        sigma2 = numpy.where(residual_df > 0, numpy.bincount(positions, residuals * residuals) / residual_df,
+                             math.nan)
+        stderrs = numpy.sqrt(numpy.einsum('kii->ki', inverse) * sigma2[:, None])
+        t_values = fitted_coefficients / stderrs
+    fitted_p_values = numpy.array([[student_t_p_value(t_value, df) for t_value in opcode_t_values]
+                                   for opcode_t_values, df in zip(t_values, residual_df)]).reshape(t_values.shape)
+
+    coefficients[fitted] = numpy.where(used, fitted_coefficients, math.nan)
+    p_values[fitted] = numpy.where(used, fitted_p_values, math.nan)
+    return coefficients, p_values
+
+
+def student_t_p_value(t_value, df):
+    """
+    The two-sided p-value of `t_value` in the Student's t-distribution with `df` degrees of freedom,
+    `2 * pt(-abs(t_value), df)` in R
+    """
+    if math.isnan(t_value) or df <= 0:
+        return math.nan
+    if math.isinf(t_value):
+        return 0.0
+    if t_value == 0:
+        return 1.0
+    # P(|T| > t) = I_x(df / 2, 1 / 2) for x = df / (df + t^2)
+    ratio = t_value * t_value / df
+    return regularized_beta(df / 2, 0.5, -math.log1p(ratio), math.log(ratio) - math.log1p(ratio))
+
+
+def regularized_beta(a, b, log_x, log_1_x):
+    """
+    The regularized incomplete beta function I_x(a, b), of x given as `log(x)` and `log(1 - x)`
+    """
+    x = math.exp(log_x)
+    if x == 0:
+        return 0.0
+    if log_1_x == -math.inf:
+        return 1.0
+    log_front = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * log_x + b * log_1_x
+    if x < (a + 1) / (a + b + 2):
+        return math.exp(log_front) * _beta_fraction(a, b, x) / a
+    return 1 - math.exp(log_front) * _beta_fraction(b, a, math.exp(log_1_x)) / b
+
+
+def _beta_fraction(a, b, x):
+    # the continued fraction of the incomplete beta function, by the modified Lentz's method
+    tiny = 1e-300
+    c = 1.0
+    d = 1 - (a + b) * x / (a + 1)
+    d = 1 / (d if abs(d) > tiny else tiny)
+    fraction = d
+    for m in range(1, BETA_ITERATIONS + 1):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1 + numerator * d
+            d = 1 / (d if abs(d) > tiny else tiny)
+            c = 1 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            delta = c * d
+            fraction *= delta
+        if abs(delta - 1) < BETA_EPSILON:
+            break
+    return fraction
+
+
+def opcode_estimates(opcode, coefficients, p_values, env):
+    """
+    The row of the notebook's `first_pass` of an opcode
+    """
+    estimates = {
+        'opcode': opcode,
+        'intercept': coefficients[INTERCEPT],
+        'intercept_p': p_values[INTERCEPT],
+        'estimate_marginal_ns': coefficients[OP_COUNT],
+        'estimate_marginal_ns_p': p_values[OP_COUNT],
+        'expensive_ns_raw': coefficients[OP_COUNT_EXPENSIVE],
+        'expensive_ns_p': p_values[OP_COUNT_EXPENSIVE],
+        'env': env,
+    }
+    for arg, term in enumerate(OP_COUNT_ARGS):
+        raw, p_value = coefficients[term], p_values[term]
+        estimates['arg{}_ns_raw'.format(arg)] = raw
+        estimates['arg{}_ns_p'.format(arg)] = p_value
+        estimates['has_impacting_arg{}'.format(arg)] = bool(
+            p_value < P_VALUE_THRESH and abs(raw) > estimates['estimate_marginal_ns'] * IMPACT_RATIO)
+    if opcode in IMPACTING_ARGS:
+        estimates['has_impacting_arg{}'.format(IMPACTING_ARGS[opcode])] = True
+    estimates['has_impacting'] = any(estimates['has_impacting_arg{}'.format(arg)] for arg in range(3))
+    # the discount of the BLS MSMs is per mille
+    if opcode in BLS_MSM_DISCOUNTS:
+        estimates['arg0_ns_raw'] *= 1000
+    return estimates
+
+
+def read_marginal_estimated_cost(estimated_cost_files):
+    """
+    The (op, estimate_marginal_ns, env) of all the marginal estimated cost files
+    """
+    costs = []
+    for estimated_cost_file in estimated_cost_files:
+        with open(estimated_cost_file.strip(), newline='') as csvfile:
+            costs.extend((row['op'], _argument(row['estimate_marginal_ns']), row['env'])
+                         for row in csv.DictReader(csvfile))
+    return costs
+
+
+def compare_marginal(estimates, marginal_costs):
+    """
+    The (opcode, opcode_cost(arguments), opcode_cost(marginal), rel diff) of every opcode, for every marginal
+    estimation of its reference opcode, or with NA if there is none
+    """
+    marginal_by_op = {}
+    for op, cost, _ in marginal_costs:
+        marginal_by_op.setdefault(op, []).append(cost)
+    for estimate in estimates:
+        opcode = estimate['opcode']
+        reference_opcode, reference_arg0 = MARGINAL_REFERENCES.get(opcode, (opcode, 0))
+        arguments_cost = (estimate['estimate_marginal_ns'] + _if_nan(estimate['expensive_ns_raw'], 0)
+                          + _if_nan(estimate['arg0_ns_raw'], 0) * reference_arg0)
+        for marginal_cost in marginal_by_op.get(reference_opcode, [math.nan]):
+            relative_difference = arguments_cost / marginal_cost - 1 if marginal_cost != 0 else math.nan
+            yield opcode, arguments_cost, marginal_cost, relative_difference
+
+
+def _if_nan(value, default):
+    return default if math.isnan(value) else value
+
+
+def format_value(value):
+    # as R writes the data frame, `TRUE`/`FALSE` for the logical columns
+    if isinstance(value, (bool, numpy.bool_)):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, str):
+        return value
+    return format_number(value)
+
+
+def main():
+    fire.Fire(ArgumentsEstimator, name='estimate_arguments')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+import csv
+import fire
+import math
+import os
+import sys
+
+import numpy
+
+from estimate_marginal import format_number
+
+"""
+The alternative gas cost schedule of `final_estimation.Rmd`, without Docker, R and the report. It combines any number
+of estimated cost files of the marginal and arguments procedures and writes the comparison CSV of the notebook:
+```
+python3 estimate_final.py estimate --estimate_files "estimated_cost_marginal_full_geth.csv,estimated_cost_marginal_full_evmone.csv" --output_comparison_file final_gas_schedule_comparison.csv
+```
+
+The same steps as in the notebook:
+- the arguments estimated costs become the `<OPCODE>_ARG0`, `_ARG1` and `_ARG2` ops with the arguments' costs, and
+  the `<OPCODE>_ARGC` op with the `op_count` cost (plus the expensive mode's). The files without the env column,
+  as the older arguments reports, get the env from their name, e.g. `estimated_cost_arguments_more_geth.csv`
+- the estimates of every env are scaled to gas: with the `l1` metric by the median ratio of the estimate to
+  the current gas cost of the base opcodes (`base > 0` in `current_gas_cost`), with `l2` by the mean ratio.
+  With `reference_opcode` instead, by the ratio of that opcode only, so it keeps its current gas cost
+- the alternative gas cost is the median (`l1`) or the mean (`l2`) of the scaled estimates of all the envs, with
+  the mean absolute deviation (`l1`) or the standard error (`l2`)
+
+Only the opcodes of `current_gas_cost` with `groups >= 0` and an estimate of any env are compared.
+"""
+
+DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+CURRENT_GAS_COST = os.path.join(DIR_PATH, 'current_gas_cost.csv')
+METRICS = ['l1', 'l2']
+MARGINAL_COLUMNS = ['op', 'estimate_marginal_ns', 'estimate_marginal_ns_stderr', 'env']
+ARGUMENTS_COLUMNS = ['opcode', 'arg0_ns_raw', 'arg1_ns_raw', 'arg2_ns_raw']
+COMPARISON_COLUMNS = ['opcode', 'constant_current_gas', 'alternative_gas', 'alternative_gas_stderr',
+                      'alternative_gas_rel_stderr', 'alternative_gas_rel_diff']
+
+
+class FinalEstimator(object):
+    """
+    Computes the alternative gas cost schedule from the estimated costs of the EVM clients
+    """
+
+    def estimate(self, estimate_files="", current_gas_cost=CURRENT_GAS_COST, output_comparison_file="",
+                 metric="l1", reference_opcode=""):
+        """
+        Parameters:
+        estimate_files (string): comma separated list of the estimated cost files, of the marginal or arguments
+          procedure
+        current_gas_cost (string): the file with the current gas cost schedule and the groups,
+          `opcode,constant_current_gas,groups,base`, by default `current_gas_cost.csv`
+        output_comparison_file (string): the output CSV file with the comparison, defaults to STDOUT
+        metric (string): l1 or l2, how the estimates are scaled and combined
+        reference_opcode (string): the opcode to scale the estimates of every env to, by default the scale is
+          computed over all the base opcodes
+        """
+        if metric not in METRICS:
+            print("Wrong metric parameter. Allowed are: {}".format(','.join(METRICS)))
+            return
+        estimate_files = estimate_files.split(',') if isinstance(estimate_files, str) else list(estimate_files)
+        estimate_files = [estimate_file.strip() for estimate_file in estimate_files if estimate_file.strip() != ""]
+        if len(estimate_files) == 0:
+            print("The estimate_files parameter is required, the comma separated list of estimate files")
+            return
+
+        estimated_cost = []
+        for estimate_file in estimate_files:
+            file_estimated_cost = read_estimated_cost(estimate_file)
+            if file_estimated_cost is None:
+                print("Unrecognized file format: {}".format(estimate_file))
+                return
+            estimated_cost.extend(file_estimated_cost)
+        if len(estimated_cost) == 0:
+            print("No estimated cost data found")
+            return
+        duplicate = find_duplicate(estimated_cost)
+        if duplicate is not None:
+            print("Non unique input data, estimate cost multiplied for: {} {}".format(*duplicate))
+            return
+
+        opcodes, current_gas, groups, base = read_current_gas_cost(current_gas_cost)
+        envs, estimates, stderrs = estimates_matrix(estimated_cost, opcodes)
+        if reference_opcode != "":
+            if reference_opcode not in opcodes:
+                print("The reference opcode {} is not in {}".format(reference_opcode, current_gas_cost))
+                return
+            scales = reference_scales(estimates, current_gas, opcodes.index(reference_opcode))
+        else:
+            scales = metric_scales(estimates, current_gas, base > 0, metric)
+        missing_scales = [env for env, scale in zip(envs, scales) if math.isnan(scale)]
+        if missing_scales:
+            print("Cannot calculate the scale of {}, no estimates of the reference opcodes".format(
+                ','.join(missing_scales)))
+            return
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            gas = estimates / scales
+            gas_stderrs = stderrs / scales
+        compared = (groups >= 0) & ~numpy.all(numpy.isnan(gas), axis=1)
+        gas, gas_stderrs = gas[compared], gas_stderrs[compared]
+        current_gas = current_gas[compared]
+        alternative_gas, alternative_gas_stderr = alternative_schedule(gas, metric)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            rel_stderr = alternative_gas_stderr / alternative_gas
+            rel_diff = numpy.abs((current_gas - alternative_gas) / current_gas)
+
+        output = sys.stdout if output_comparison_file == "" else open(output_comparison_file, 'w', newline='')
+        try:
+            writer = csv.writer(output, lineterminator='\n')
+            writer.writerow([column for env in envs for column in (env + '_gas', env + '_gas_stderr')]
+                            + COMPARISON_COLUMNS)
+            compared_opcodes = [opcode for opcode, is_compared in zip(opcodes, compared) if is_compared]
+            for row, opcode in enumerate(compared_opcodes):
+                writer.writerow([format_value(value) for env in range(len(envs))
+                                 for value in (gas[row, env], gas_stderrs[row, env])]
+                                + [opcode] + [format_value(value) for value in (
+                                    current_gas[row], alternative_gas[row], alternative_gas_stderr[row],
+                                    rel_stderr[row], rel_diff[row])])
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+
+def read_estimated_cost(estimate_file):
+    """
+    The (op, estimate_marginal_ns, estimate_marginal_ns_stderr, env) of an estimated cost file, of the marginal or
+    arguments procedure. None if it is neither
+    """
+    with open(estimate_file, newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        columns = reader.fieldnames or []
+        rows = list(reader)
+    default_env = os.path.splitext(os.path.basename(estimate_file))[0].split('_')[-1]
+    if all(column in columns for column in ARGUMENTS_COLUMNS):
+        estimated_cost = []
+        for arg in range(3):
+            estimated_cost.extend(('{}_ARG{}'.format(row['opcode'], arg), _number(row['arg{}_ns_raw'.format(arg)]),
+                                   0.0, row.get('env', default_env))
+                                  for row in rows if not math.isnan(_number(row['arg{}_ns_raw'.format(arg)])))
+        estimated_cost.extend(
+            (row['opcode'] + '_ARGC', _number(row['estimate_marginal_ns']) + _if_nan(row.get('expensive_ns_raw'), 0),
+             0.0, row.get('env', default_env))
+            for row in rows if not math.isnan(_number(row['estimate_marginal_ns'])))
+        return estimated_cost
+    if all(column in columns for column in MARGINAL_COLUMNS):
+        return [(row['op'], _number(row['estimate_marginal_ns']), _number(row['estimate_marginal_ns_stderr']),
+                 row['env']) for row in rows]
+    return None
+
+
+def _number(value):
+    # R reads both the empty and NA values as NA
+    if value is None or value == '' or value == 'NA':
+        return math.nan
+    return float(value)
+
+
+def _if_nan(value, default):
+    value = _number(value)
+    return default if math.isnan(value) else value
+
+
+def find_duplicate(estimated_cost):
+    """
+    The first (op, env) estimated more than once, None if all are unique
+    """
+    seen = set()
+    for op, _, _, env in estimated_cost:
+        if (op, env) in seen:
+            return op, env
+        seen.add((op, env))
+    return None
+
+
+def read_current_gas_cost(current_gas_cost_file):
+    """
+    The opcodes of the current gas cost schedule and their constant_current_gas, groups and base
+    """
+    with open(current_gas_cost_file, newline='') as csvfile:
+        rows = list(csv.DictReader(csvfile))
+    opcodes = [row['opcode'] for row in rows]
+    current_gas = numpy.array([_number(row['constant_current_gas']) for row in rows])
+    groups = numpy.array([_number(row['groups']) for row in rows])
+    base = numpy.array([_number(row['base']) for row in rows])
+    return opcodes, current_gas, groups, base
+
+
+def estimates_matrix(estimated_cost, opcodes):
+    """
+    The envs, in the order of their first estimate, and the estimates and their standard errors of every opcode
+    (rows) and env (columns), NaN if missing
+    """
+    envs = list(dict.fromkeys(env for _, _, _, env in estimated_cost))
+    env_index = {env: index for index, env in enumerate(envs)}
+    opcode_index = {opcode: index for index, opcode in enumerate(opcodes)}
+    estimates = numpy.full((len(opcodes), len(envs)), math.nan)
+    stderrs = numpy.full((len(opcodes), len(envs)), math.nan)
+    # the estimated costs of the opcodes out of the schedule are not compared
+    known = [(opcode_index[op], env_index[env], estimate, stderr)
+             for op, estimate, stderr, env in estimated_cost if op in opcode_index]
+    if known:
+        rows, columns, known_estimates, known_stderrs = (numpy.array(values) for values in zip(*known))
+        estimates[rows, columns] = known_estimates
+        stderrs[rows, columns] = known_stderrs
+    return envs, estimates, stderrs
+
+
+def metric_scales(estimates, current_gas, reference, metric):
+    """
+    The ns per gas of every env, over the `reference` opcodes. NaN if an env has none of them estimated
+    """
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ratios = estimates[reference] / numpy.where(current_gas[reference] != 0, current_gas[reference],
+                                                    math.nan)[:, None]
+    estimated = ~numpy.isnan(ratios)
+    if metric == 'l1':
+        scales = numpy.array([numpy.median(column[~numpy.isnan(column)]) if numpy.any(~numpy.isnan(column))
+                              else math.nan for column in ratios.T])
+    else:
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            scales = numpy.where(estimated, ratios, 0).sum(axis=0) / estimated.sum(axis=0)
+    # the notebook pastes the scales into a query, with 15 significant digits
+    return numpy.array([float(format_number(scale)) if not math.isnan(scale) else math.nan for scale in scales])
+
+
+def reference_scales(estimates, current_gas, reference):
+    """
+    The ns per gas of every env, by its estimate of the `reference` opcode. NaN if an env has not estimated it
+    """
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return estimates[reference] / current_gas[reference]
+
+
+def alternative_schedule(gas, metric):
+    """
+    The alternative gas cost of every opcode (rows) from the scaled estimates of the envs (columns) and its
+    standard error
+    """
+    if gas.shape[1] == 1:
+        return gas[:, 0], numpy.zeros(len(gas))
+    estimated = ~numpy.isnan(gas)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'l1':
+            # the row medians, NaN sorts last
+            counts = estimated.sum(axis=1)
+            ordered = numpy.sort(gas, axis=1)
+            rows = numpy.arange(len(gas))
+            lower = ordered[rows, numpy.maximum((counts - 1) // 2, 0)]
+            upper = ordered[rows, numpy.maximum(counts // 2, 0)]
+            alternative_gas = numpy.where(counts > 0, (lower + upper) / 2, math.nan)
+            deviations = numpy.where(estimated, numpy.abs(gas - alternative_gas[:, None]), 0)
+            alternative_gas_stderr = deviations.sum(axis=1) / counts
+        else:
+            alternative_gas = numpy.where(estimated, gas, 0).sum(axis=1) / estimated.sum(axis=1)
+            # `sd` of the whole row, NA if any env is missing
+            alternative_gas_stderr = numpy.std(gas, axis=1, ddof=1) / math.sqrt(gas.shape[1])
+    return alternative_gas, alternative_gas_stderr
+
+
+def format_value(value):
+    if math.isinf(value):
+        return 'Inf' if value > 0 else '-Inf'
+    return format_number(value)
+
+
+def main():
+    fire.Fire(FinalEstimator, name='estimate_final')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+import csv
+import fire
+import math
+import multiprocessing
+import sys
+
+import numpy
+
+"""
+The `measure_marginal` estimation of `measure_marginal_single.Rmd`, without R and without the report. For a quick
+feedback on the measurements, the numbers only:
+```
+python3 estimate_marginal.py estimate --env geth --programs pg_marginal_full.csv --results results_marginal_full_geth.csv
+```
+
+The same steps as in the notebook:
+- the results with zero `total_time_ns` are dropped and the rest joined with the programs by `program_id`
+- the outliers are removed as in `remove_outliers` of `common.R`, i.e. by the boxplot rule: in every
+  (opcode, op_count) group, the values beyond 1.5 IQR from the hinges (Tukey's `fivenum`) are dropped
+- the median time of every (opcode, op_count) and the `median ~ op_count` regression of every opcode, its slope
+  and the slope's standard error are the estimate
+
+All the groups are computed at once, on arrays sorted by group, and all the regressions in one pass.
+The output CSV has the columns of the notebook's `output_estimated_cost`: op,estimate_marginal_ns,
+estimate_marginal_ns_stderr,env
+
+With `bootstrap`, the estimate is repeated on that many replicates of the results, each resampling the samples of
+every program with replacement, and the percentile confidence intervals of the slopes are added as
+estimate_marginal_ns_ci_low,estimate_marginal_ns_ci_high. Every replicate has its own seed derived from `seed`,
+so the intervals do not depend on the number of `workers`:
+```
+python3 estimate_marginal.py estimate --env geth --programs pg_marginal_full.csv --results results_marginal_full_geth.csv --bootstrap 1000 --workers 8
+```
+"""
+
+ESTIMATES_HEADER = ['op', 'estimate_marginal_ns', 'estimate_marginal_ns_stderr', 'env']
+CI_HEADER = ['estimate_marginal_ns_ci_low', 'estimate_marginal_ns_ci_high']
+# `remove_outliers` uses the default `boxplot` range
+BOXPLOT_RANGE = 1.5
+
+
+class MarginalEstimator(object):
+    """
+    Estimates the marginal cost of every opcode from the programs and the results of `measurements.py`
+    """
+
+    def estimate(self, env="", programs="", results="", output_estimated_cost="", remove_outliers=True, bootstrap=0,
+                 confidence=0.95, seed=0, workers=1):
+        """
+        Parameters:
+        env (string): the name of EVM client, written to the env column
+        programs (string): the file with the programs, `program_id,opcode,op_count,...`
+        results (string): the file with the results, `program_id,sample_id,total_time_ns,...`
+        output_estimated_cost (string): the output CSV file with the estimated costs, defaults to STDOUT
+        remove_outliers (boolean): remove the outlying measurements, as the notebook does by default
+        bootstrap (integer): number of bootstrap replicates for the confidence intervals, none by default
+        confidence (float): the confidence level of the intervals, defaults to 0.95
+        seed (integer): seed of the bootstrap replicates
+        workers (integer): number of processes computing the bootstrap replicates, defaults to 1
+        """
+        if env == "":
+            print("The env parameter is required, the name of EVM client")
+            return
+        if programs == "" or results == "":
+            print("The programs and results parameters are required")
+            return
+        if not 0 < confidence < 1:
+            print("The confidence parameter must be between 0 and 1")
+            return
+
+        program_opcodes = read_programs(programs)
+        program_ids, times = read_results(results)
+        opcodes, opcode_ids, op_counts, times, result_programs = join_programs(program_opcodes, program_ids, times)
+        slopes, stderrs = fit_marginal(opcode_ids, op_counts, times, len(opcodes), remove_outliers)
+        columns = [opcodes, slopes, stderrs]
+        if bootstrap > 0:
+            replicates = bootstrap_slopes(opcode_ids, op_counts, times, result_programs, len(opcodes),
+                                          remove_outliers, bootstrap, seed, workers)
+            columns += confidence_intervals(replicates, confidence)
+
+        output = sys.stdout if output_estimated_cost == "" else open(output_estimated_cost, 'w', newline='')
+        try:
+            writer = csv.writer(output, lineterminator='\n')
+            header = ESTIMATES_HEADER[:3] + (CI_HEADER if bootstrap > 0 else []) + ESTIMATES_HEADER[3:]
+            writer.writerow(header)
+            for opcode, *estimates in zip(*columns):
+                writer.writerow([opcode] + [format_number(estimate) for estimate in estimates] + [env])
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+
+def read_programs(programs_file):
+    """
+    The (opcode, op_count) of every program_id
+    """
+    with open(programs_file, newline='') as csvfile:
+        return {row['program_id']: (row['opcode'], float(row['op_count'])) for row in csv.DictReader(csvfile)}
+
+
+def read_results(results_file, time_columns=('total_time_ns',)):
+    """
+    The program_ids and the total times of the results, other columns are skipped. The times are read from the
+    first of `time_columns` present in the file
+    """
+    with open(results_file, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        program_id_column = header.index('program_id')
+        time_column = header.index(next((column for column in time_columns if column in header), time_columns[-1]))
+        program_ids = []
+        times = []
+        for row in reader:
+            program_ids.append(row[program_id_column])
+            times.append(row[time_column])
+    return program_ids, numpy.array(times, dtype=float)
+
+
+def join_programs(program_opcodes, program_ids, times):
+    """
+    Drops the zero times and the results of unknown programs. Returns the opcodes, in the order of their first
+    result, the opcode index and op_count of every result, its time and the index of its program
+    """
+    program_index = {program_id: index for index, program_id in enumerate(program_opcodes)}
+    # geth short-circuits the zero length programs, with zero time
+    result_programs = numpy.fromiter((program_index.get(program_id, -1) for program_id in program_ids),
+                                     dtype=numpy.int64, count=len(program_ids))
+    kept = (result_programs >= 0) & (times != 0)
+    result_programs = result_programs[kept]
+
+    opcodes, program_opcode_ids = numpy.unique([opcode for opcode, _ in program_opcodes.values()],
+                                               return_inverse=True)
+    program_op_counts = numpy.array([op_count for _, op_count in program_opcodes.values()], dtype=float)
+    opcode_ids = program_opcode_ids.reshape(-1)[result_programs]
+    # renumber the opcodes in the order of their first result, as R's `unique` does
+    present_opcodes, first_results = numpy.unique(opcode_ids, return_index=True)
+    present_opcodes = present_opcodes[numpy.argsort(first_results)]
+    renumbered = numpy.full(len(opcodes), -1, dtype=numpy.int64)
+    renumbered[present_opcodes] = numpy.arange(len(present_opcodes))
+    return (list(opcodes[present_opcodes]), renumbered[opcode_ids], program_op_counts[result_programs],
+            times[kept], result_programs)
+
+
+def group_ids(opcode_ids, op_counts):
+    """
+    The index of every result's (opcode, op_count) group
+    """
+    distinct_op_counts, op_count_ids = numpy.unique(op_counts, return_inverse=True)
+    groups = opcode_ids * len(distinct_op_counts) + op_count_ids.reshape(-1)
+    return numpy.unique(groups, return_inverse=True)[1].reshape(-1)
+
+
+def _sorted_groups(group_ids, values):
+    # the values sorted by group and within it, with the start and size of every group
+    order = numpy.lexsort((values, group_ids))
+    _, starts, sizes = numpy.unique(group_ids[order], return_index=True, return_counts=True)
+    return order, values[order], starts, sizes
+
+
+def boxplot_outliers(group_ids, values):
+    """
+    The mask of the values `boxplot` marks as outliers within their groups
+    """
+    if len(values) == 0:
+        return numpy.zeros(0, dtype=bool)
+    order, sorted_values, starts, sizes = _sorted_groups(group_ids, values)
+    lower_fences, upper_fences = _boxplot_fences(sorted_values, starts, sizes)
+    group_of_sorted = numpy.repeat(numpy.arange(len(sizes)), sizes)
+    sorted_outliers = ((sorted_values < lower_fences[group_of_sorted])
+                       | (sorted_values > upper_fences[group_of_sorted]))
+    outliers = numpy.empty(len(values), dtype=bool)
+    outliers[order] = sorted_outliers
+    return outliers
+
+
+def _boxplot_fences(sorted_values, starts, sizes):
+    # the hinges of `fivenum`, at the 1-based positions d and n + 1 - d, extended by the boxplot range of the IQR
+    d = numpy.floor((sizes + 3) / 2) / 2
+    lower_hinges = (sorted_values[starts + numpy.floor(d).astype(int) - 1]
+                    + sorted_values[starts + numpy.ceil(d).astype(int) - 1]) / 2
+    upper_d = sizes + 1 - d
+    upper_hinges = (sorted_values[starts + numpy.floor(upper_d).astype(int) - 1]
+                    + sorted_values[starts + numpy.ceil(upper_d).astype(int) - 1]) / 2
+    iqrs = upper_hinges - lower_hinges
+    return lower_hinges - BOXPLOT_RANGE * iqrs, upper_hinges + BOXPLOT_RANGE * iqrs
+
+
+def group_medians(group_ids, values):
+    """
+    The median of every group, by group index
+    """
+    _, sorted_values, starts, sizes = _sorted_groups(group_ids, values)
+    return (sorted_values[starts + (sizes - 1) // 2] + sorted_values[starts + sizes // 2]) / 2
+
+
+def marginal_estimates(opcode_ids, op_counts, times, opcodes_count):
+    """
+    The slope of the `median ~ op_count` regression of every opcode, with its standard error.
+    NaN where it can't be estimated, e.g. for a single op_count
+    """
+    groups = group_ids(opcode_ids, op_counts)
+    medians = group_medians(groups, times)
+    # the opcode and op_count of every group
+    _, first_results = numpy.unique(groups, return_index=True)
+    return regression_slopes(opcode_ids[first_results], op_counts[first_results], medians, opcodes_count)
+
+
+def regression_slopes(opcode_of_group, x, medians, opcodes_count):
+    """
+    The slope of the `medians ~ x` regression of every opcode, over its groups, with its standard error
+    """
+    n = numpy.bincount(opcode_of_group, minlength=opcodes_count).astype(float)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        x_mean = numpy.bincount(opcode_of_group, x, opcodes_count) / n
+        y_mean = numpy.bincount(opcode_of_group, medians, opcodes_count) / n
+        dx = x - x_mean[opcode_of_group]
+        dy = medians - y_mean[opcode_of_group]
+        sxx = numpy.bincount(opcode_of_group, dx * dx, opcodes_count)
+        sxy = numpy.bincount(opcode_of_group, dx * dy, opcodes_count)
+        syy = numpy.bincount(opcode_of_group, dy * dy, opcodes_count)
+        slopes = numpy.where(sxx > 0, sxy / sxx, numpy.nan)
+        residuals = numpy.maximum(syy - slopes * sxy, 0)
+        stderrs = numpy.where(n > 2, numpy.sqrt(residuals / (n - 2) / sxx), numpy.nan)
+    return slopes, stderrs
+
+
+def fit_marginal(opcode_ids, op_counts, times, opcodes_count, remove_outliers):
+    """
+    The slopes and their standard errors of all the opcodes, see `marginal_estimates`, from the results with
+    the outliers removed or not
+    """
+    if remove_outliers:
+        kept = ~boxplot_outliers(group_ids(opcode_ids, op_counts), times)
+        opcode_ids, op_counts, times = opcode_ids[kept], op_counts[kept], times[kept]
+    return marginal_estimates(opcode_ids, op_counts, times, opcodes_count)
+
+
+def bootstrap_slopes(opcode_ids, op_counts, times, result_programs, opcodes_count, remove_outliers, replicates,
+                     seed, workers):
+    """
+    The slopes of all the opcodes (columns) in every bootstrap replicate (rows). A replicate draws, for every
+    result, a random result of the same program
+    """
+    if len(times) == 0:
+        return numpy.full((replicates, opcodes_count), math.nan)
+    # a program is in a single (opcode, op_count) group, so the groups are the same in all the replicates.
+    # The results are sorted by group and program, the results of a program are a contiguous range
+    groups = group_ids(opcode_ids, op_counts)
+    order = numpy.lexsort((result_programs, groups))
+    groups, times, result_programs = groups[order], times[order], result_programs[order]
+    program_starts = numpy.flatnonzero(numpy.diff(result_programs, prepend=-1))
+    program_sizes = numpy.diff(program_starts, append=len(result_programs))
+    _, group_starts, group_sizes = numpy.unique(groups, return_index=True, return_counts=True)
+    data = {
+        'times': times,
+        'groups': groups,
+        'program_starts': numpy.repeat(program_starts, program_sizes),
+        'program_sizes': numpy.repeat(program_sizes, program_sizes),
+        'group_starts': group_starts,
+        'group_sizes': group_sizes,
+        'opcode_of_group': opcode_ids[order][group_starts],
+        'op_count_of_group': op_counts[order][group_starts],
+        'opcodes_count': opcodes_count,
+        'remove_outliers': remove_outliers,
+    }
+    seeds = numpy.random.SeedSequence(seed).spawn(replicates)
+    if workers <= 1:
+        _init_bootstrap(data)
+        return numpy.array([_bootstrap_replicate(replicate_seed) for replicate_seed in seeds])
+    with multiprocessing.Pool(workers, initializer=_init_bootstrap, initargs=(data,)) as pool:
+        chunksize = max(1, replicates // (4 * workers))
+        return numpy.array(pool.map(_bootstrap_replicate, seeds, chunksize))
+
+
+_bootstrap_data = None
+
+
+def _init_bootstrap(data):
+    global _bootstrap_data
+    _bootstrap_data = data
+
+
+def _bootstrap_replicate(replicate_seed):
+    # `fit_marginal` of the resampled results, on the results already grouped
+    data = _bootstrap_data
+    random = numpy.random.default_rng(replicate_seed).random(len(data['times']))
+    draws = data['program_starts'] + numpy.floor(random * data['program_sizes']).astype(numpy.int64)
+    starts, sizes, groups = data['group_starts'], data['group_sizes'], data['groups']
+    sorted_values = _sort_within_groups(data['times'][draws], groups, starts, sizes)
+    if data['remove_outliers']:
+        # the outliers are the lowest and the highest values of a group, the kept values are a contiguous range
+        lower_fences, upper_fences = _boxplot_fences(sorted_values, starts, sizes)
+        starts = starts + numpy.bincount(groups, sorted_values < lower_fences[groups], len(sizes)).astype(int)
+        sizes = numpy.bincount(groups, (sorted_values >= lower_fences[groups])
+                               & (sorted_values <= upper_fences[groups]), len(sizes)).astype(int)
+    medians = (sorted_values[starts + (sizes - 1) // 2] + sorted_values[starts + sizes // 2]) / 2
+    return regression_slopes(data['opcode_of_group'], data['op_count_of_group'], medians, data['opcodes_count'])[0]
+
+
+def _sort_within_groups(values, groups, starts, sizes):
+    # the values of contiguous groups sorted within every group. If the groups are of similar sizes, as the
+    # generators make them, as the rows of a matrix padded to the largest group, which is faster than `lexsort`
+    width = sizes.max()
+    if width * len(sizes) > 2 * len(values):
+        return values[numpy.lexsort((values, groups))]
+    matrix = numpy.full((len(sizes), width), numpy.inf)
+    matrix[groups, numpy.arange(len(values)) - starts[groups]] = values
+    matrix.sort(axis=1)
+    return matrix[numpy.arange(width) < sizes[:, None]]
+
+
+def confidence_intervals(replicates, confidence):
+    """
+    The percentile intervals of the replicated slopes of every opcode, NaN where no replicate has a slope
+    """
+    bounds = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+    lows, highs = numpy.full(replicates.shape[1], math.nan), numpy.full(replicates.shape[1], math.nan)
+    estimated = ~numpy.all(numpy.isnan(replicates), axis=0)
+    if numpy.any(estimated):
+        lows[estimated], highs[estimated] = numpy.nanpercentile(replicates[:, estimated], bounds, axis=0)
+    return [lows, highs]
+
+
+def format_number(value):
+    # as R writes the doubles, 15 significant digits
+    if math.isnan(value):
+        return 'NA'
+    # and without the sign of zero
+    return '{:.15g}'.format(value + 0.0)
+
+
+def main():
+    fire.Fire(MarginalEstimator, name='estimate_marginal')
+
+
+if __name__ == '__main__':
+    main()
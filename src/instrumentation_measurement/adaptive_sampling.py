@@ -0,0 +1,85 @@
+"""
+Adaptive sample size. A program is sampled until the 95% confidence interval of the mean `total_time_ns`
+is narrow enough, relative to the mean, but at least `min_samples` and at most `max_samples` times.
+
+The interval is `mean ± t(0.975, n - 1) * stdev / sqrt(n)`, its relative half-width is compared to
+`target_rel_ci`, e.g. `0.01` stops sampling when the mean is known within ±1%.
+"""
+
+import math
+import statistics
+
+from failures import SampleFailure
+
+# Student's t 0.975 quantiles for 1 to 30 degrees of freedom
+T_975 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+         2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+         2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+Z_975 = 1.959964
+
+
+def t_975(degrees_of_freedom):
+    if degrees_of_freedom <= len(T_975):
+        return T_975[degrees_of_freedom - 1]
+    # Cornish-Fisher expansion, accurate to 1e-4 above 30 degrees of freedom
+    z = Z_975
+    return (z + (z ** 3 + z) / (4 * degrees_of_freedom)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * degrees_of_freedom ** 2))
+
+
+def relative_ci(times):
+    """
+    Relative half-width of the 95% confidence interval of the mean, infinite if it can't be estimated
+    """
+    if len(times) < 2:
+        return math.inf
+    mean = statistics.fmean(times)
+    if mean <= 0:
+        return math.inf
+    return t_975(len(times) - 1) * statistics.stdev(times) / math.sqrt(len(times)) / mean
+
+
+def total_time_ns(instrumenter_row):
+    # the instrumenter rows of all the EVMs start with `sample_id,total_time_ns`
+    return float(instrumenter_row.split(',')[1])
+
+
+class AdaptiveSampling(object):
+    """
+    The stopping rule of the adaptive sample size mode
+    """
+
+    def __init__(self, min_samples, max_samples, target_rel_ci):
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.target_rel_ci = target_rel_ci
+
+    def finished(self, times):
+        if len(times) >= self.max_samples:
+            return True
+        return len(times) >= self.min_samples and relative_ci(times) <= self.target_rel_ci
+
+    def samples(self, runner, program, exec_path, times):
+        """
+        Measures the program until `finished`, yields the instrumenter rows like the runners do.
+        `times` are the total times of the samples measured before (when resuming), the new ones are
+        appended to it
+        """
+        while not self.finished(times):
+            sample_id = len(times) + 1
+            # the first `min_samples` are measured in one go, the stopping rule is checked after each one later
+            last_sample_id = max(sample_id, min(self.min_samples, self.max_samples))
+            for instrumenter_row in runner(program, range(sample_id, last_sample_id + 1), exec_path):
+                if instrumenter_row is None:
+                    yield None
+                    return
+                if isinstance(instrumenter_row, SampleFailure):
+                    # a failed sample ends the program, its sample_id would be taken by the next one
+                    yield instrumenter_row
+                    return
+                times.append(total_time_ns(instrumenter_row))
+                yield instrumenter_row
+            if len(times) < sample_id:
+                print("No samples measured for program {}".format(program.id))
+                yield None
+                return
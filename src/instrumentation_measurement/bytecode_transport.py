@@ -0,0 +1,80 @@
+"""
+Passing the bytecode to the EVM processes. As a command line argument (`argv`) the bytecode is limited by
+`MAX_ARG_STRLEN`, the clients that can read it from a file or from STDIN are not:
+- `file`: the bytecode is written once per program to a memfd (or a tmpfs file, where memfd is not available),
+  the client gets its path. With `workers`, the jobs measure single samples, so the file is written once per sample
+- `stdin`: the bytecode is streamed on the client's STDIN
+
+See `CODE_TRANSPORTS` in `measurements.py` for the clients supporting them.
+"""
+
+import os
+import tempfile
+
+ARGV = 'argv'
+FILE = 'file'
+STDIN = 'stdin'
+TRANSPORTS = (ARGV, FILE, STDIN)
+
+# the limit of a single command line argument in Linux, including the terminating null
+MAX_ARG_STRLEN = 131072
+
+TMPFS_DIR = '/dev/shm'
+
+
+class CodeTransport(object):
+    """
+    The bytecode of a program, ready to be passed to the EVM processes
+    """
+
+    def __init__(self, transport, bytecode):
+        self.transport = transport
+        self.bytecode = bytecode
+        self.path = None
+        self.pass_fds = ()
+        self._fd = None
+        if transport == FILE:
+            self._write_file(bytecode)
+
+    def _write_file(self, bytecode):
+        if hasattr(os, 'memfd_create'):
+            self._fd = os.memfd_create('bytecode', 0)
+            # the spawned processes inherit the descriptor under the same number
+            self.path = '/dev/fd/{}'.format(self._fd)
+            self.pass_fds = (self._fd,)
+        else:
+            directory = TMPFS_DIR if os.path.isdir(TMPFS_DIR) else None
+            self._fd, self.path = tempfile.mkstemp(prefix='bytecode-', dir=directory)
+        data = memoryview(bytecode.encode())
+        # a write can be short, the client must not get a truncated program
+        while data:
+            data = data[os.write(self._fd, data):]
+
+    @property
+    def argument(self):
+        """
+        The bytecode itself for `argv`, its path for `file` and `-` for `stdin`
+        """
+        if self.transport == FILE:
+            return self.path
+        if self.transport == STDIN:
+            return '-'
+        return self.bytecode
+
+    @property
+    def stdin(self):
+        return self.bytecode if self.transport == STDIN else None
+
+    def close(self):
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        if not self.pass_fds:
+            os.remove(self.path)
+        self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,95 @@
+"""
+Persistent EVM client sessions. A session client is started once and then measures many programs,
+so the process startup (.NET, JVM, Node.js) is not paid for every sample.
+
+The protocol is line based, over the client's STDIN and STDOUT:
+```
+> run <bytecode>
+< ok <result columns>
+< error <message>
+```
+The `<result columns>` are the comma separated values following `program_id,sample_id` in the
+measurement CSV of the given EVM, e.g. `total_time_ns,iterations_count,std_dev_time_ns`.
+Any other line printed by the client before the response (warnings, logs) is ignored.
+The client exits when its STDIN is closed. A client not responding within the timeout is killed,
+it is started again for the next program.
+
+See `stub_client.py` for the reference implementation.
+"""
+
+import subprocess
+import threading
+
+class ClientSessionError(Exception):
+    pass
+
+
+class ClientSession(object):
+    """
+    A running session client
+    """
+
+    def __init__(self, invocation, cwd=None, timeout=None):
+        self._invocation = invocation
+        self._cwd = cwd
+        self._timeout = timeout
+        self._start()
+
+    def _start(self):
+        self._process = subprocess.Popen(self._invocation, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         universal_newlines=True, bufsize=1, cwd=self._cwd)
+
+    def run(self, bytecode):
+        """
+        Measures a single sample of the bytecode, returns the result columns
+        """
+        if self._process.poll() is not None:
+            self._start()
+        if self._timeout is None:
+            return self._run(bytecode)
+
+        timed_out = threading.Event()
+        watchdog = threading.Timer(self._timeout, self._kill, args=(timed_out,))
+        watchdog.start()
+        try:
+            return self._run(bytecode)
+        except ClientSessionError:
+            if timed_out.is_set():
+                raise ClientSessionError('session client {} timed out after {}s'.format(
+                    self._invocation[0], self._timeout))
+            raise
+        finally:
+            watchdog.cancel()
+
+    def _kill(self, timed_out):
+        timed_out.set()
+        self._process.kill()
+
+    def _run(self, bytecode):
+        try:
+            self._process.stdin.write('run {}\n'.format(bytecode))
+            self._process.stdin.flush()
+        except BrokenPipeError:
+            raise ClientSessionError('session client {} is gone'.format(self._invocation[0]))
+
+        while True:
+            line = self._process.stdout.readline()
+            if line == '':
+                raise ClientSessionError('session client {} exited with {}'.format(
+                    self._invocation[0], self._process.wait()))
+            line = line.rstrip('\n')
+            if line.startswith('ok '):
+                return line[3:]
+            if line.startswith('error '):
+                raise ClientSessionError(line[6:])
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.stdin.close()
+            self._process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,183 @@
+"""
+Columnar results. Instead of the CSV text the results can be written as Parquet (requires `pyarrow`, an optional
+dependency, see `requirements.txt`) or as a NumPy `.npz` archive (requires `numpy`). The rows are collected column
+by column in a `ColumnBuffer` and written in batches of `BATCH_SIZE` rows:
+- `parquet`: a row group per batch, zstd compressed
+- `npz`: an array per column and batch, named `<column>.<batch>`, e.g. `total_time_ns.000002`
+
+The `program_id` column (and the `STRING_COLUMNS`) is kept as strings, `sample_id` as integers and all the other
+columns as doubles, an empty value (e.g. a perf counter not supported) is NaN.
+
+`load_results` reads any of the formats, CSV included, into a dict of NumPy arrays:
+```
+from columnar_output import load_results
+results = load_results('local/results_marginal_full_evmone.parquet')
+results['total_time_ns'].mean()
+```
+"""
+
+import array
+import csv
+import math
+import os
+import zipfile
+
+CSV = 'csv'
+PARQUET = 'parquet'
+NPZ = 'npz'
+OUTPUT_FORMATS = (CSV, PARQUET, NPZ)
+
+BATCH_SIZE = 65536
+
+# besu reports the gas used in hex and whether the program passed
+STRING_COLUMNS = ('program_id', 'gasUsed', 'pass')
+INTEGER_COLUMNS = ('sample_id',)
+STRING = 'str'
+INTEGER = 'q'
+DOUBLE = 'd'
+
+
+def column_type(column):
+    if column in STRING_COLUMNS:
+        return STRING
+    if column in INTEGER_COLUMNS:
+        return INTEGER
+    return DOUBLE
+
+
+class ColumnBuffer(object):
+    """
+    A batch of results rows, stored as typed arrays, one per column
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.types = [column_type(column) for column in columns]
+        self.clear()
+
+    def append(self, fields):
+        for values, column_type, value in zip(self.values, self.types, fields):
+            if column_type == STRING:
+                values.append(value)
+            elif column_type == INTEGER:
+                values.append(int(value))
+            else:
+                values.append(float(value) if value != '' else math.nan)
+        self._length += 1
+
+    def clear(self):
+        self.values = [[] if column_type == STRING else array.array(column_type) for column_type in self.types]
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+
+class ColumnarOutput(object):
+    """
+    The results file in a columnar format. Takes the CSV rows, like the CSV results file does,
+    and writes them in batches
+    """
+
+    def __init__(self, path, header, output_format, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self._buffer = ColumnBuffer(header.split(','))
+        if output_format == PARQUET:
+            self._writer = _ParquetWriter(path, self._buffer.columns)
+        else:
+            self._writer = _NpzWriter(path)
+
+    def write(self, result_row):
+        self._buffer.append(next(csv.reader([result_row.rstrip('\n')])))
+        if len(self._buffer) >= self.batch_size:
+            self._write_batch()
+
+    def flush(self):
+        # the rows are written in batches, and on close
+        pass
+
+    def _write_batch(self):
+        if len(self._buffer) > 0:
+            self._writer.write_batch(self._buffer)
+            self._buffer.clear()
+
+    def close(self):
+        self._write_batch()
+        self._writer.close()
+
+
+class _ParquetWriter(object):
+
+    def __init__(self, path, columns):
+        import pyarrow
+        import pyarrow.parquet
+        self._pyarrow = pyarrow
+        types = {STRING: pyarrow.string(), INTEGER: pyarrow.int64(), DOUBLE: pyarrow.float64()}
+        self._schema = pyarrow.schema([(column, types[column_type(column)]) for column in columns])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression='zstd')
+
+    def write_batch(self, buffer):
+        # NaN marks the empty values, as in the npz format
+        arrays = [self._pyarrow.array(values, field.type, from_pandas=False)
+                  for values, field in zip(buffer.values, self._schema)]
+        self._writer.write_table(self._pyarrow.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class _NpzWriter(object):
+
+    def __init__(self, path):
+        import numpy
+        self._numpy = numpy
+        self._archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+        self._batch = 0
+
+    def write_batch(self, buffer):
+        columns = [_to_numpy(self._numpy, values, column_type)
+                   for values, column_type in zip(buffer.values, buffer.types)]
+        for name, column in zip(buffer.columns, columns):
+            with self._archive.open('{}.{:06d}.npy'.format(name, self._batch), 'w', force_zip64=True) as entry:
+                self._numpy.lib.format.write_array(entry, column, allow_pickle=False)
+        self._batch += 1
+
+    def close(self):
+        self._archive.close()
+
+
+def _to_numpy(numpy, values, column_type):
+    if column_type == STRING:
+        return numpy.array(values, dtype=str)
+    return numpy.frombuffer(values, dtype=numpy.int64 if column_type == INTEGER else numpy.float64)
+
+
+def load_results(path):
+    """
+    Reads a results file (`.csv`, `.parquet` or `.npz`) into a dict of NumPy arrays, by column name
+    """
+    import numpy
+    extension = os.path.splitext(path)[1]
+    if extension == '.' + PARQUET:
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("pyarrow not found, install it (pip install pyarrow) to read the parquet results",
+                              name='pyarrow') from None
+        table = pyarrow.parquet.read_table(path)
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+    if extension == '.' + NPZ:
+        with numpy.load(path, allow_pickle=False) as archive:
+            batches = {}
+            # the entries are in the order written, batch by batch
+            for key in archive.files:
+                batches.setdefault(key.rsplit('.', 1)[0], []).append(archive[key])
+        return {name: numpy.concatenate(arrays) for name, arrays in batches.items()}
+    with open(path) as results_file:
+        reader = csv.reader(results_file)
+        columns = next(reader)
+        buffer = ColumnBuffer(columns)
+        for row in reader:
+            buffer.append(row)
+    return {name: _to_numpy(numpy, values, column_type).copy() for name, values, column_type in
+            zip(columns, buffer.values, buffer.types)}
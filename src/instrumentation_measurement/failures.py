@@ -0,0 +1,70 @@
+"""
+Failed samples. A runner raises `ClientRunError` when a client fails (an error output, a timeout, an unparsable
+result). The sample is retried, with an exponential backoff, and then handled by the failure policy:
+- `abort`: the measurement stops, as it always did
+- `skip-program`: the remaining samples of the program are skipped, the measurement goes on with the next one
+- `mark-failed`: only the sample is skipped
+
+Every failed sample is recorded in the failures CSV, `program_id,sample_id,evm,attempts,error`.
+The failed samples are not journaled, so a resumed run measures them again.
+"""
+
+import time
+
+ABORT = 'abort'
+SKIP_PROGRAM = 'skip-program'
+MARK_FAILED = 'mark-failed'
+FAILURE_POLICIES = (ABORT, SKIP_PROGRAM, MARK_FAILED)
+
+FAILURES_HEADER = "program_id,sample_id,evm,attempts,error"
+
+
+class ClientRunError(Exception):
+    pass
+
+
+class SampleFailure(object):
+    """
+    POD object for a failed sample, passed on in place of its instrumenter row
+    """
+
+    def __init__(self, program_id, sample_id, attempts, error):
+        self.program_id = program_id
+        self.sample_id = sample_id
+        self.attempts = attempts
+        self.error = error
+
+
+def fail_soft_runner(runner, on_failure=ABORT, retries=0, retry_backoff=1):
+    """
+    Wraps the runner to retry the failed samples and apply the failure policy. Yields a `SampleFailure`
+    for every failed sample, followed by `None` for `abort`
+    """
+    def fail_soft(program, sample_ids, exec_path):
+        sample_ids = list(sample_ids)
+        attempts = 0
+        while sample_ids:
+            try:
+                for instrumenter_row in runner(program, list(sample_ids), exec_path):
+                    if instrumenter_row is None:
+                        yield None
+                        return
+                    sample_ids.remove(int(instrumenter_row.partition(',')[0]))
+                    attempts = 0
+                    yield instrumenter_row
+                return
+            except ClientRunError as err:
+                attempts += 1
+                if attempts <= retries:
+                    time.sleep(retry_backoff * 2 ** (attempts - 1))
+                    continue
+                yield SampleFailure(program.id, sample_ids[0], attempts, str(err))
+                if on_failure == ABORT:
+                    yield None
+                    return
+                if on_failure == SKIP_PROGRAM:
+                    return
+                sample_ids.pop(0)
+                attempts = 0
+
+    return fail_soft
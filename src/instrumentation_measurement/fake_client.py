@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+A fake EVM benchmark client, for measuring the harness itself (see `harness_benchmark.py`). It takes the command
+line of a real client and prints its output format, without executing the bytecode:
+```
+FAKE_CLIENT_EVM=geth FAKE_CLIENT_DELAY=0.001 python3 measurements.py measure --evm geth --exec_path fake_client.py ...
+```
+
+`FAKE_CLIENT_EVM` selects the format: geth, erigon, evmone, nethermind, besu or revm (which writes its criterion
+files to `CRITERION_HOME`). `FAKE_CLIENT_DELAY` is the seconds slept in every sample, 0 by default.
+The reported time is derived from the bytecode length, like in `stub_client.py`.
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+NS_PER_BYTE = 10
+BASE_TIME_NS = 1000
+ITERATIONS_COUNT = 1000
+HEX_PATTERN = re.compile(r'(0x)?[0-9a-fA-F]+')
+
+
+def find_bytecode(args):
+    for i, arg in enumerate(args):
+        if arg in ('--code', '--bytecode') and i + 1 < len(args):
+            return args[i + 1]
+        if arg == '--codefile' and i + 1 < len(args):
+            if args[i + 1] == '-':
+                return sys.stdin.read().strip()
+            with open(args[i + 1]) as code:
+                return code.read().strip()
+        if arg.startswith('--code='):
+            return arg[len('--code='):]
+    return next((arg for arg in args if HEX_PATTERN.fullmatch(arg)), '')
+
+
+def total_time_ns(bytecode):
+    if bytecode.startswith('0x'):
+        bytecode = bytecode[2:]
+    return BASE_TIME_NS + NS_PER_BYTE * (len(bytecode) // 2)
+
+
+def print_geth(time_ns):
+    # geth and erigon report on STDERR
+    print("EVM gas used:    0\n"
+          "execution time:  {}µs\n"
+          "allocations:     3\n"
+          "allocated bytes: 160".format(time_ns / 1000), file=sys.stderr)
+
+
+def print_evmone(time_ns):
+    print("name,iterations,real_time,cpu_time,time_unit,bytes_per_second,items_per_second,label,error_occurred,"
+          "error_message")
+    print('"execute/bytecode",{},{},{},us,,,,,'.format(ITERATIONS_COUNT, time_ns / 1000, time_ns / 1000))
+
+
+def print_nethermind(time_ns):
+    print("{},{},{},3,160".format(time_ns, ITERATIONS_COUNT, time_ns / 100))
+
+
+def print_besu(time_ns):
+    print(json.dumps({'timens': time_ns, 'std_dev_timens': time_ns / 100, 'gasUsed': '0x0', 'pass': True}))
+
+
+def print_revm(time_ns):
+    results_folder = os.path.join(os.environ['CRITERION_HOME'], 'revme', 'evm', 'new')
+    os.makedirs(results_folder, exist_ok=True)
+    with open(os.path.join(results_folder, 'estimates.json'), 'w') as estimates_file:
+        json.dump({'mean': {'point_estimate': time_ns}, 'slope': {'point_estimate': time_ns},
+                   'std_dev': {'point_estimate': time_ns / 100}}, estimates_file)
+    with open(os.path.join(results_folder, 'sample.json'), 'w') as sample_file:
+        json.dump({'sampling_mode': 'Flat', 'iters': [ITERATIONS_COUNT]}, sample_file)
+
+
+FORMATS = {
+    'geth': print_geth,
+    'erigon': print_geth,
+    'evmone': print_evmone,
+    'nethermind': print_nethermind,
+    'besu': print_besu,
+    'revm': print_revm,
+}
+
+
+def main():
+    evm = os.environ.get('FAKE_CLIENT_EVM', 'geth')
+    if evm not in FORMATS:
+        print("Unknown FAKE_CLIENT_EVM {}, allowed are: {}".format(evm, ','.join(FORMATS)), file=sys.stderr)
+        sys.exit(2)
+    # revm gets the bytecode as an argument and on STDIN, the latter is not read
+    bytecode = find_bytecode(sys.argv[1:])
+    delay = float(os.environ.get('FAKE_CLIENT_DELAY', 0))
+    if delay > 0:
+        time.sleep(delay)
+    FORMATS[evm](total_time_ns(bytecode))
+
+
+if __name__ == '__main__':
+    main()
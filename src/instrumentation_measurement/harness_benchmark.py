@@ -0,0 +1,191 @@
+"""
+Benchmarks of the measurement harness itself. `Measurements.measure` is run against `fake_client.py`, which prints
+the output of a real client without executing anything, so all the time spent is the harness overhead plus the
+fake client's `delay`.
+
+Prints CSV, a row per EVM: the throughput (samples/s) and the time per sample in each phase (in µs):
+- `process_us`: spawning and reaping the client process, including the `delay`
+- `runner_us`: the rest of the runner, i.e. building the invocation and parsing the client's output. In the session
+  mode it includes the round trip to the client
+- `rows_us`: appending the program_id to the rows (`csv_row_append_info`) and the runner wrappers
+- `write_us`: writing the rows and journaling them (`_write_results`)
+- `other_us`: the rest, e.g. reading the programs
+
+The phases are timed in the serial mode only, with `workers` > 1 only the throughput is reported.
+
+Compare the results before and after a harness change:
+```
+python3 harness_benchmark.py run --evm geth,evmone,nethermind --programs 200 --sample_size 5
+```
+"""
+
+import collections
+import csv
+import fire
+import os
+import random
+import sys
+import tempfile
+import time
+
+from measurements import DIR_PATH, Measurements
+
+FAKE_CLIENT = os.path.join(DIR_PATH, 'fake_client.py')
+STUB_CLIENT = os.path.join(DIR_PATH, 'stub_client.py')
+# stub runs `stub_client.py`, which supports the session mode
+EVMS = ['geth', 'erigon', 'evmone', 'nethermind', 'besu', 'revm', 'stub']
+PHASES = ['process', 'runner', 'rows', 'write']
+RESULTS_HEADER = "evm,samples,samples_per_s," + ','.join(phase + '_us' for phase in PHASES + ['other'])
+
+
+class PhaseTimer(object):
+    """
+    Exclusive times of nested phases: while a phase runs, the phase it was entered from is paused
+    """
+
+    def __init__(self):
+        self.times = collections.Counter()
+        self._phases = []
+        self._start = None
+
+    def enter(self, phase):
+        now = time.perf_counter()
+        if self._phases:
+            self.times[self._phases[-1]] += now - self._start
+        self._phases.append(phase)
+        self._start = now
+
+    def exit(self):
+        now = time.perf_counter()
+        self.times[self._phases.pop()] += now - self._start
+        self._start = now
+
+
+class TimedMeasurements(Measurements):
+    """
+    `Measurements` timing the phases of every sample, see `phase_timer`
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.phase_timer = PhaseTimer()
+
+    def _run_process(self, invocation, input=None, **popen_args):
+        self.phase_timer.enter('process')
+        try:
+            return super()._run_process(invocation, input, **popen_args)
+        finally:
+            self.phase_timer.exit()
+
+    def _benchmark_runner(self, evm, session_client=None):
+        runner = super()._benchmark_runner(evm, session_client)
+
+        def timed_runner(program, sample_ids, exec_path):
+            return _timed(runner(program, sample_ids, exec_path), self.phase_timer, 'runner')
+
+        return timed_runner
+
+    def csv_row_append_info(self, instrumenter_result, program):
+        return _timed(super().csv_row_append_info(instrumenter_result, program), self.phase_timer, 'rows')
+
+    def _write_results(self, program, instrumenter_result):
+        self.phase_timer.enter('write')
+        try:
+            return super()._write_results(program, instrumenter_result)
+        finally:
+            self.phase_timer.exit()
+
+
+def _timed(rows, phase_timer, phase):
+    # the generator is timed while it computes the next row only
+    rows = iter(rows)
+    while True:
+        phase_timer.enter(phase)
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        finally:
+            phase_timer.exit()
+        yield row
+
+
+class HarnessBenchmark(object):
+    """
+    Measures the overhead of `measurements.py`, see the module docs
+    """
+
+    def run(self, evm=','.join(EVMS), programs=100, sample_size=5, bytecode_size=1024, delay=0, workers=1,
+            session=False, seed=0):
+        """
+        Parameters:
+        evm (string): comma separated list of the EVMs whose output is faked, all of them by default
+        programs (integer): number of random programs to measure
+        sample_size (integer): samples per program
+        bytecode_size (integer): bytes of every program
+        delay (float): seconds the fake client sleeps in every sample, 0 by default
+        workers (integer): number of workers, the phases are timed with 1 worker only
+        session (boolean): measure `stub` in the session mode
+        seed (integer): seed of the random programs
+        """
+        evms = evm.split(',') if isinstance(evm, str) else list(evm)
+        for evm in evms:
+            if evm not in EVMS:
+                print("Wrong evm parameter. Allowed are: {}".format(','.join(EVMS)))
+                return
+
+        with tempfile.TemporaryDirectory(prefix='harness-benchmark-') as directory:
+            input_file = os.path.join(directory, 'programs.csv')
+            self._write_programs(input_file, programs, bytecode_size, seed)
+            print(RESULTS_HEADER)
+            for evm in evms:
+                row = self._benchmark(evm, input_file, programs * sample_size, sample_size, delay, workers, session,
+                                      os.path.join(directory, 'results_{}.csv'.format(evm)))
+                if row is None:
+                    return
+                print(row, flush=True)
+
+    def _write_programs(self, input_file, programs, bytecode_size, seed):
+        rng = random.Random(seed)
+        with open(input_file, 'w') as programs_file:
+            writer = csv.writer(programs_file)
+            writer.writerow(['program_id', 'bytecode'])
+            for program_id in range(programs):
+                writer.writerow(['PROGRAM_{}'.format(program_id), rng.randbytes(bytecode_size).hex()])
+
+    def _benchmark(self, evm, input_file, samples, sample_size, delay, workers, session, output_file):
+        os.environ['FAKE_CLIENT_EVM'] = evm
+        os.environ['FAKE_CLIENT_DELAY'] = str(delay)
+        exec_path = STUB_CLIENT if evm == 'stub' else FAKE_CLIENT
+        measurements = TimedMeasurements()
+        start = time.perf_counter()
+        try:
+            measurements.measure(sample_size=sample_size, evm=evm, input_file=input_file, exec_path=exec_path,
+                                 workers=workers, session=session and evm == 'stub', output_file=output_file)
+        except SystemExit:
+            # the failed measurement is reported below, the other EVMs are benchmarked
+            pass
+        wall_time = time.perf_counter() - start
+
+        with open(output_file) as results_file:
+            measured = sum(1 for _ in results_file) - 1
+        if measured != samples:
+            print("Measuring {} failed, {} of {} samples measured".format(evm, max(measured, 0), samples),
+                  file=sys.stderr)
+            return None
+
+        columns = [evm, samples, round(samples / wall_time, 1)]
+        if workers > 1:
+            return ','.join(str(column) for column in columns + [''] * (len(PHASES) + 1))
+        phase_times = [measurements.phase_timer.times[phase] for phase in PHASES]
+        phase_times.append(wall_time - sum(phase_times))
+        columns += [round(phase_time / samples * 1e6, 1) for phase_time in phase_times]
+        return ','.join(str(column) for column in columns)
+
+
+def main():
+    fire.Fire(HarnessBenchmark, name='harness_benchmark')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Checkpoint journal of a measurement run. Every completed sample is appended as a `program_id,sample_id`
+line and synced to the disk, so a run interrupted by a crash, OOM or a reboot can be resumed.
+
+The results row of a sample is written (and synced) before its journal line, so a sample in the journal
+always has its results. A sample measured but not journaled at the moment of a crash is measured again
+on resume, the analysis takes care of such duplicated rows as of any other sample.
+"""
+
+import csv
+import os
+
+class Journal(object):
+    """
+    Completed (program_id, sample_id) pairs of a measurement run
+    """
+
+    def __init__(self, path, resume=False):
+        self._completed = set()
+        if resume and os.path.exists(path):
+            truncate_torn_line(path)
+            self._completed = self._read_completed(path)
+            self._file = open(path, 'a', newline='')
+        else:
+            self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+
+    def _read_completed(self, path):
+        completed = set()
+        with open(path, newline='') as journal_file:
+            for row in csv.reader(journal_file):
+                if len(row) != 2 or not row[1].isdigit():
+                    continue
+                completed.add((row[0], int(row[1])))
+        return completed
+
+    def __len__(self):
+        return len(self._completed)
+
+    def is_completed(self, program_id, sample_id):
+        return (program_id, sample_id) in self._completed
+
+    def pending_samples(self, program_id, sample_ids):
+        return [sample_id for sample_id in sample_ids if not self.is_completed(program_id, sample_id)]
+
+    def record(self, program_id, sample_id):
+        self._writer.writerow([program_id, sample_id])
+        sync_file(self._file)
+        self._completed.add((program_id, sample_id))
+
+    def close(self):
+        self._file.close()
+
+
+def sync_file(file):
+    """
+    Flushes the file and syncs it to the disk. Pipes and terminals can't be synced, they are only flushed
+    """
+    file.flush()
+    try:
+        os.fsync(file.fileno())
+    except OSError:
+        pass
+
+
+def truncate_torn_line(path):
+    """
+    Cuts off the last line of the file if it was torn by a crash, i.e. it is not terminated by a newline
+    """
+    with open(path, 'rb+') as file:
+        size = file.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            block_start = max(0, end - 4096)
+            file.seek(block_start)
+            newline = file.read(end - block_start).rfind(b'\n')
+            if newline != -1:
+                end = block_start + newline + 1
+                break
+            end = block_start
+        if end != size:
+            file.truncate(end)
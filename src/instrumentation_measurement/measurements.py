@@ -1,17 +1,38 @@
+import collections
 import csv
 import fire
+import itertools
 import json
+import multiprocessing
 import os
 import os.path
+import queue
 import re
 import shutil
 import sys
-import subprocess
+import tempfile
+import threading
 from io import StringIO
 from pathlib import Path
 
-MAX_OPCODE_ARGS = 7
+from adaptive_sampling import AdaptiveSampling, relative_ci, total_time_ns
+from bytecode_transport import ARGV, MAX_ARG_STRLEN, TRANSPORTS, CodeTransport
+from client_session import ClientSession, ClientSessionError
+from columnar_output import CSV, OUTPUT_FORMATS, ColumnarOutput
+from failures import (ABORT, FAILURE_POLICIES, FAILURES_HEADER, SKIP_PROGRAM, ClientRunError, SampleFailure,
+                      fail_soft_runner)
+from process_resources import PERF_COLUMNS, RUSAGE_COLUMNS, resource_columns, run_process
+from journal import Journal, sync_file, truncate_torn_line
+from result_cache import DEFAULT_CACHE_PATH, DEFAULT_CACHE_SIZE_MB, ResultCache
+
 DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+# the program POD object is shared with the generators
+sys.path.append(os.path.join(DIR_PATH, '..', 'program_generator'))
+from program_record import ProgramRecord, pack_bytecode
+
+MAX_OPCODE_ARGS = 7
+# programs passed through files or STDIN are not limited by `MAX_ARG_STRLEN`
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
 
 DEFAULT_EXEC_EVMONE = '../../../gas-cost-estimator-clients/build/evmone/evmone-bench'
 DEFAULT_EXEC_GETH = '../../../gas-cost-estimator-clients/build/geth/evm'
@@ -20,16 +41,60 @@ DEFAULT_EXEC_ERIGON = '../../../gas-cost-estimator-clients/build/erigon/evm'
 DEFAULT_EXEC_REVM = '../../../gas-cost-estimator-clients/build/revm/revme'
 DEFAULT_EXEC_ETHERJS = '../../../gas-cost-estimator-clients/build/ethereumjs/index.js'
 DEFAULT_EXEC_BESU = '../../../gas-cost-estimator-clients/build/besu/evmtool/bin/evmtool'
-
-
-class Program(object):
+DEFAULT_EXEC_STUB = 'stub_client.py'
+
+DEFAULT_EXECS = {
+    'evmone': DEFAULT_EXEC_EVMONE,
+    'geth': DEFAULT_EXEC_GETH,
+    'nethermind': DEFAULT_EXEC_NETHERMIND,
+    'erigon': DEFAULT_EXEC_ERIGON,
+    'revm': DEFAULT_EXEC_REVM,
+    'ethereumjs': DEFAULT_EXEC_ETHERJS,
+    'besu': DEFAULT_EXEC_BESU,
+    'stub': DEFAULT_EXEC_STUB,
+}
+
+# Results' CSV header of every EVM
+HEADERS = {
+    'geth': "program_id,sample_id,total_time_ns,mem_allocs,mem_alloc_bytes",
+    'erigon': "program_id,sample_id,total_time_ns,mem_allocs,mem_alloc_bytes",
+    'evmone': "program_id,sample_id,total_time_ns,iterations_count",
+    'nethermind': "program_id,sample_id,total_time_ns,iterations_count,std_dev_time_ns,mem_allocs,mem_alloc_bytes",
+    'ethereumjs': "program_id,sample_id,total_time_ns,iterations_count,std_dev_time_ns",
+    'revm': "program_id,sample_id,total_time_ns,iterations_count,std_dev_time_ns",
+    'besu': "program_id,sample_id,total_time_ns,iterations_count,std_dev_time_ns,gasUsed,pass",
+    'stub': "program_id,sample_id,total_time_ns,iterations_count,std_dev_time_ns",
+}
+
+# Programs parsed ahead of the slowest EVM, when measuring many EVMs at once
+PROGRAM_QUEUE_SIZE = 1000
+
+# Bytecode transports, besides `argv`, supported by the EVMs. See `bytecode_transport.py`
+CODE_TRANSPORTS = {
+    'geth': {'file', 'stdin'},
+    'erigon': {'file', 'stdin'},
+    'stub': {'file', 'stdin'},
+}
+
+# EVMs measuring all the samples of a program in one process, in parallel too their jobs are whole programs
+BATCHED_EVMS = ['ethereumjs']
+
+# Arguments starting a client in the session mode, for the EVMs that support it. See `client_session.py`
+SESSION_ARGS = {
+    'stub': ['--session'],
+}
+
+
+class Program(ProgramRecord):
     """
     POD object for a program
     """
 
+    __slots__ = ('id', 'measured_op_position')
+
     def __init__(self, id, bytecode, measured_op_position):
+        super().__init__(bytecode)
         self.id = id
-        self.bytecode = bytecode
         self.measured_op_position = measured_op_position
 
 
@@ -46,6 +111,17 @@ class Measurements(object):
     ```
     """
 
+    def __init__(self):
+        # set by `measure`, see `bytecode_transport.py` and `process_resources.py`
+        self._transport = ARGV
+        self._rusage = False
+        self._perf = False
+        self._timeout = None
+        self._on_failure = ABORT
+        self._retries = 0
+        self._retry_backoff = 1
+        self._keyed_program = None
+
     def _program_from_csv_row(self, row):
         program_id = row['program_id']
         bytecode = self._expand_unreachable_code(row['bytecode'])
@@ -57,100 +133,598 @@ class Measurements(object):
     def _expand_unreachable_code(self, bytecode):
         if bytecode[-11:] == 'unreachable':
             bytecode = bytecode[:-11]
-            bytecode += '00'  # STOP
-            # watch out to not hit the hard `MAX_ARG_STRLEN` limit of `131072` chars,
+            # STOP, then watch out to not hit the hard `MAX_ARG_STRLEN` limit of `131072` chars,
             # c.f. https://tousu.in/qa/?qa=833087/
-            bytecode += '03' * ((1 << 11) - len(bytecode) // 2)
-            return bytecode
+            tail = b'\x00' + b'\x03' * ((1 << 11) - len(bytecode) // 2 - 1)
+            code = pack_bytecode(bytecode)
+            if isinstance(code, bytes):
+                return code + tail
+            return bytecode + tail.hex()
         else:
             return bytecode
 
-    def measure(self, sample_size=1, evm="evmone", input_file="", exec_path=""):
+    def measure(self, sample_size=1, evm="evmone", input_file="", exec_path="", workers=1, cpus=None, session=False,
+                output_file="", journal="", resume=False, reuse_cache=False, cache_path=DEFAULT_CACHE_PATH,
+                cache_size_mb=DEFAULT_CACHE_SIZE_MB, min_samples=5, max_samples=100, target_rel_ci=0,
+                sample_counts_file="", transport=ARGV, rusage=False, perf=False, timeout=0, retries=0,
+                retry_backoff=1, on_failure=ABORT, failures_file="", output_format=CSV):
         """
         Main entrypoint of the CLI tool.
 
-        Reads programs' CSV from STDIN. Prints measurement results CSV to STDOUT
+        Reads programs' CSV from STDIN. Prints measurement results CSV to STDOUT, or to `output_file`.
+        Exits with the code 1 if the measurement of any EVM stopped, e.g. aborted on a failed sample
 
         Parameters:
         sample_size (integer): size of a sample to pass into the EVM measuring executable
         mode (string): Measurement mode. Allowed: total, all, trace, benchmark
         evm (string): which evm use. Default: geth. Allowed: geth, evmone
+          A comma separated list of distinct EVMs (e.g. `evmone,geth`) measures them at once, each on its own cores
+          (`cpus`, all available by default). Then `output_file` (and `journal`) must contain
+          the `{evm}` placeholder and `exec_path` is a comma separated list too, if given
+        workers (integer): number of programs' samples measured in parallel, defaults to 1.
+          The EVMs measuring all the samples of a program in one process (see `BATCHED_EVMS`) measure
+          whole programs in parallel, as in the serial mode
+        cpus (string): comma separated list (or ranges, e.g. `2-5`) of cores to pin the workers to,
+          one core per worker. If `workers` is not given, one worker per core is started
+        session (boolean): if set, the client process is started once and measures all the programs,
+          for the EVMs which support it (see `SESSION_ARGS`). Other EVMs spawn a process per sample
+        output_file (string): file to write the results to, instead of STDOUT
+        journal (string): file to record every completed sample in, see `journal.py`
+        resume (boolean): continue the run recorded in `journal`. The completed samples are skipped and
+          the results are appended to `output_file` (or printed without the header)
+        reuse_cache (boolean): reuse the results of the same client binary, bytecode and sample_id measured
+          before and cache the new ones, see `result_cache.py`
+        cache_path (string): the cache file, defaults to `~/.cache/gas-cost-estimator/results.sqlite`
+        cache_size_mb (integer): the cache size limit, the least recently used results are evicted
+        target_rel_ci (float): if given, `sample_size` is adaptive. A program is sampled until the 95% confidence
+          interval of `total_time_ns` is within ±`target_rel_ci` of the mean, e.g. `0.01`.
+          See `adaptive_sampling.py`
+        min_samples (integer): the minimal sample size in the adaptive mode, defaults to 5
+        max_samples (integer): the maximal sample size in the adaptive mode, defaults to 100
+        sample_counts_file (string): file to write the final sample size of every program to, in the adaptive
+          mode. Defaults to STDERR
+        transport (string): how to pass the bytecode to the EVM processes, see `bytecode_transport.py`.
+          Allowed: argv (default), file, stdin. The EVMs not supporting it (see `CODE_TRANSPORTS`) fall back to argv
+        rusage (boolean): add the resource usage of every sample's process to the results: max_rss_kb,
+          user_time_us, sys_time_us, vol_ctx_switches, invol_ctx_switches. See `process_resources.py`
+        perf (boolean): run every sample's process under `perf stat` and add the cycles, instructions and
+          cache_misses to the results
+        timeout (float): seconds a sample may take, then the client (with its child processes) is killed
+          and the sample fails. No timeout by default
+        retries (integer): how many times a failed sample is retried, defaults to 0
+        retry_backoff (float): seconds to wait before the first retry, doubled for every next one
+        on_failure (string): what to do when a sample fails, see `failures.py`.
+          Allowed: abort (default), skip-program, mark-failed
+        failures_file (string): file to write the failed samples to, defaults to STDERR
+        output_format (string): the format of `output_file`, see `columnar_output.py`.
+          Allowed: csv (default), parquet, npz. The columnar formats require `output_file` and can't be journaled.
+          parquet requires the optional `pyarrow` package, npz requires `numpy`
         """
 
-        if (input_file != ""):
+        # programs are parsed lazily, one at a time, while being measured
+        programs = self._read_programs(input_file)
+
+        evms = _parse_evms(evm)
+        for evm in evms:
+            if evm not in HEADERS:
+                print("Wrong evm parameter. Allowed are: {}".format(
+                    ','.join(HEADERS)))
+                return
+        if resume and journal == "":
+            print("The journal parameter is required to resume")
+            return
+        if transport not in TRANSPORTS:
+            print("Wrong transport parameter. Allowed are: {}".format(','.join(TRANSPORTS)))
+            return
+        if on_failure not in FAILURE_POLICIES:
+            print("Wrong on_failure parameter. Allowed are: {}".format(','.join(FAILURE_POLICIES)))
+            return
+        if output_format not in OUTPUT_FORMATS:
+            print("Wrong output_format parameter. Allowed are: {}".format(','.join(OUTPUT_FORMATS)))
+            return
+        if output_format != CSV and output_file == "":
+            print("The output_file parameter is required for the {} output format".format(output_format))
+            return
+        if output_format != CSV and journal != "":
+            # the rows are written in batches, a journaled sample could be lost with its batch
+            print("The journal is supported with the csv output format only")
+            return
+
+        adaptive = None
+        if target_rel_ci > 0:
+            if not 1 <= min_samples <= max_samples:
+                print("Wrong sample size limits: {} to {}".format(min_samples, max_samples))
+                return
+            if resume and output_file == "":
+                # the times measured before are read back from the results file
+                print("The output_file parameter is required to resume in the adaptive mode")
+                return
+            adaptive = AdaptiveSampling(min_samples, max_samples, target_rel_ci)
+
+        run_options = dict(sample_size=sample_size, session=session, resume=resume, reuse_cache=reuse_cache,
+                           cache_path=cache_path, cache_size_mb=cache_size_mb, adaptive=adaptive, transport=transport,
+                           rusage=rusage, perf=perf, timeout=timeout, retries=retries, retry_backoff=retry_backoff,
+                           on_failure=on_failure, failures_file=failures_file, output_format=output_format)
+        if len(evms) > 1:
+            succeeded = self._measure_clients(programs, evms, exec_path, cpus, output_file, journal,
+                                              sample_counts_file, run_options)
+        else:
+            succeeded = self._measure_client(programs, evms[0], exec_path, workers, cpus, output_file, journal,
+                                             sample_counts_file, **run_options)
+        if not succeeded:
+            # a failed (e.g. aborted) measurement is reported to the caller's shell
+            sys.exit(1)
+
+    def _measure_client(self, programs, evm, exec_path, workers, cpus, output_file, journal, sample_counts_file,
+                        sample_size, session, resume, reuse_cache, cache_path, cache_size_mb, adaptive, transport,
+                        rusage, perf, timeout, retries, retry_backoff, on_failure, failures_file, output_format):
+        if session and evm not in SESSION_ARGS:
+            print("{} does not support sessions, spawning a process per sample".format(evm), file=sys.stderr)
+            session = False
+        if session and (rusage or perf):
+            print("The resource usage is not measured per sample in the session mode")
+            return False
+        if perf and shutil.which('perf') is None:
+            print("perf not found, install it (e.g. linux-tools) to count the perf events")
+            return False
+        if transport != ARGV and transport not in CODE_TRANSPORTS.get(evm, ()):
+            print("{} does not support the {} transport, passing the bytecode as an argument".format(evm, transport),
+                  file=sys.stderr)
+            transport = ARGV
+        self._transport = transport
+        self._rusage = rusage
+        self._perf = perf
+        self._timeout = timeout if timeout > 0 else None
+        self._on_failure = on_failure
+        self._retries = retries
+        self._retry_backoff = retry_backoff
+        self._evm = evm
+        self._failures_file = failures_file
+        self._failures = None
+        self._resume = resume
+        header = HEADERS[evm]
+        if rusage:
+            header += ',' + ','.join(RUSAGE_COLUMNS)
+        if perf:
+            header += ',' + ','.join(PERF_COLUMNS)
+        # the cached results of other columns are not reused
+        self._cache_evm = evm + ('+rusage' if rusage else '') + ('+perf' if perf else '')
+
+        self._cache = None
+        if reuse_cache:
+            self._cache = ResultCache(cache_path, cache_size_mb)
+            try:
+                self._client_key = self._cache.client_key(self._resolve_exec_path(evm, exec_path))
+            except OSError as err:
+                print("Can't hash the client binary: {}".format(err))
+                self._cache.close()
+                return False
+
+        if output_format != CSV:
+            try:
+                self._output = ColumnarOutput(output_file, header, output_format)
+            except ImportError as err:
+                # pyarrow is an optional dependency, see `requirements.txt`
+                module = (err.name or '').split('.')[0]
+                print("{} not found, install it (pip install {}) to write the {} output format".format(
+                    module, module, output_format))
+                if self._cache is not None:
+                    self._cache.close()
+                return False
+        else:
+            self._output = self._open_output(output_file, resume)
+        self._journal = Journal(journal, resume) if journal != "" else None
+        self._adaptive = adaptive
+        self._sample_counts = None
+        try:
+            self._resumed_times = {}
+            if adaptive is not None and resume:
+                self._resumed_times = self._read_resumed_times(output_file)
+            # a resumed run appends to the results of the interrupted one
+            if output_format == CSV and (not resume or (output_file != "" and self._output.tell() == 0)):
+                self._output.write(header + '\n')
+                self._output.flush()
+            if resume:
+                print("Resuming {}, {} samples completed".format(evm, len(self._journal)), file=sys.stderr)
+            if adaptive is not None:
+                self._sample_counts = sys.stderr if sample_counts_file == "" else self._open_output(
+                    sample_counts_file, resume)
+                if self._sample_counts is sys.stderr or self._sample_counts.tell() == 0:
+                    self._sample_counts.write("program_id,sample_count,rel_ci\n")
+                    self._sample_counts.flush()
+
+            if workers > 1 or cpus is not None:
+                return self._measure_parallel(programs, evm, sample_size, exec_path, workers, cpus, session)
+            return self._measure_serial(programs, evm, sample_size, exec_path, session)
+        finally:
+            if self._output is not sys.stdout:
+                self._output.close()
+            if self._sample_counts is not None and self._sample_counts is not sys.stderr:
+                self._sample_counts.close()
+            if self._failures is not None and self._failures is not sys.stderr:
+                self._failures.close()
+            if self._journal is not None:
+                self._journal.close()
+            if self._cache is not None:
+                self._cache.close()
+
+    def _measure_clients(self, programs, evms, exec_path, cpus, output_file, journal, sample_counts_file,
+                         run_options):
+        """
+        Measures the programs with many EVMs at once. Every EVM is measured in its own process, with its own
+        set of cores, and writes its own results file. The programs are parsed once, here, and passed on to
+        the EVM processes. A slow EVM gets behind by at most `PROGRAM_QUEUE_SIZE` programs, then it holds
+        back the other ones.
+        """
+        duplicate_evms = sorted(set(evm for evm in evms if evms.count(evm) > 1))
+        if duplicate_evms:
+            # the EVM processes would write the same results (and journal) files
+            print("Duplicate evms: {}".format(','.join(duplicate_evms)))
+            return False
+        paths = (output_file, journal, sample_counts_file, run_options['failures_file'])
+        if output_file == "" or any('{evm}' not in path for path in paths if path != ""):
+            print("The output_file (journal, sample_counts_file, failures_file) must contain the {evm} placeholder "
+                  "to measure many evms")
+            return False
+        exec_paths = _parse_exec_paths(exec_path, len(evms))
+        if exec_paths is None:
+            print("Give an exec_path for every evm (comma separated) or none at all")
+            return False
+
+        cpu_list = _parse_cpus(cpus) if cpus is not None else sorted(os.sched_getaffinity(0))
+        if len(cpu_list) < len(evms):
+            print("Not enough cpus for {} evms: {}".format(len(evms), cpu_list))
+            return False
+        unavailable_cpus = set(cpu_list) - os.sched_getaffinity(0)
+        if unavailable_cpus:
+            print("Unavailable cpus: {}".format(','.join(str(cpu) for cpu in sorted(unavailable_cpus))))
+            return False
+
+        clients = []
+        for evm, client_exec_path, client_cpus in zip(evms, exec_paths, _split_cpus(cpu_list, len(evms))):
+            program_queue = multiprocessing.Queue(PROGRAM_QUEUE_SIZE)
+            process = multiprocessing.Process(
+                target=_run_client, name=evm,
+                args=(program_queue, evm, client_exec_path, client_cpus, output_file.format(evm=evm),
+                      journal.format(evm=evm), sample_counts_file.format(evm=evm), run_options))
+            process.start()
+            print("Measuring {} on cpus {}".format(evm, ','.join(str(cpu) for cpu in client_cpus)), file=sys.stderr)
+            clients.append((process, program_queue))
+
+        for program in programs:
+            for process, program_queue in clients:
+                _put_program(process, program_queue, program)
+        for process, program_queue in clients:
+            _put_program(process, program_queue, None)
+
+        succeeded = True
+        for process, program_queue in clients:
+            process.join()
+            if process.exitcode != 0:
+                # the programs left in the queue of a failed EVM are dropped
+                program_queue.cancel_join_thread()
+                print("Measuring {} failed with exit code {}".format(process.name, process.exitcode))
+                succeeded = False
+        return succeeded
+
+    def _open_output(self, output_file, resume):
+        if output_file == "":
+            return sys.stdout
+        if resume and os.path.exists(output_file):
+            truncate_torn_line(output_file)
+            return open(output_file, 'a')
+        return open(output_file, 'w')
+
+    def _measure_serial(self, programs, evm, sample_size, exec_path, session):
+        session_client = self.start_session(evm, exec_path) if session else None
+        runner = self._benchmark_runner(evm, session_client)
+        if self._cache is not None:
+            runner = self._cached_runner(runner, evm)
+        runner = self._fail_soft_runner(runner)
+        try:
+            for program in programs:
+                if self._adaptive is not None:
+                    times = self._resumed_times.pop(program.id, [])
+                    resumed_samples = len(times)
+                    instrumenter_result = self._adaptive.samples(runner, program, exec_path, times)
+                    if not self._write_results(program, instrumenter_result):
+                        return False
+                    if len(times) > resumed_samples:
+                        self._write_sample_count(program, times)
+                    continue
+
+                sample_ids = self._pending_samples(program, sample_size)
+                if not sample_ids:
+                    continue
+                instrumenter_result = runner(program, sample_ids, exec_path)
+                if not self._write_results(program, instrumenter_result):
+                    return False
+            return True
+        finally:
+            if session_client is not None:
+                session_client.close()
+
+    def _fail_soft_runner(self, runner):
+        return fail_soft_runner(runner, self._on_failure, self._retries, self._retry_backoff)
+
+    def _cached_runner(self, runner, evm):
+        """
+        Wraps the runner to measure only the samples missing in the cache
+        """
+        def cached_runner(program, sample_ids, exec_path):
+            bytecode_key = ResultCache.bytecode_key(program.bytecode)
+            cached = {}
+            for sample_id in sample_ids:
+                columns = self._cache.get(self._client_key, self._cache_evm, bytecode_key, sample_id)
+                if columns is not None:
+                    cached[sample_id] = "{},{}".format(sample_id, columns)
+
+            for instrumenter_row in _prefetched_runner(runner, cached)(program, sample_ids, exec_path):
+                if instrumenter_row is not None and _sample_id(instrumenter_row) not in cached:
+                    self._cache_result(evm, bytecode_key, instrumenter_row)
+                yield instrumenter_row
+
+        return cached_runner
+
+    def _cache_result(self, evm, bytecode_key, instrumenter_result):
+        sample_id, _, columns = instrumenter_result.partition(',')
+        self._cache.put(self._client_key, self._cache_evm, bytecode_key, int(sample_id), columns)
+
+    def _resolve_exec_path(self, evm, exec_path):
+        if exec_path == "":
+            return os.path.abspath(DIR_PATH + '/' + DEFAULT_EXECS[evm])
+        return os.path.abspath(exec_path)
+
+    def _write_failure(self, failure):
+        if self._failures is None:
+            if self._failures_file == "":
+                self._failures = sys.stderr
+            else:
+                self._failures = self._open_output(self._failures_file, self._resume)
+            if self._failures is sys.stderr or self._failures.tell() == 0:
+                self._failures.write(FAILURES_HEADER + '\n')
+        csv.writer(self._failures, lineterminator='\n').writerow(
+            [failure.program_id, failure.sample_id, self._evm, failure.attempts, failure.error.strip()])
+        self._failures.flush()
+
+    def _read_resumed_times(self, output_file):
+        """
+        Reads the total times of the journaled samples back from the results of the interrupted run
+        """
+        samples = {}
+        if not os.path.exists(output_file):
+            return {}
+        with open(output_file) as results_file:
+            for row in csv.DictReader(results_file):
+                sample = (row['program_id'], int(row['sample_id']))
+                # a sample measured again after a crash is journaled once, keep its first row
+                if self._journal.is_completed(*sample) and sample not in samples:
+                    samples[sample] = float(row['total_time_ns'])
+        resumed_times = {}
+        for program_id, sample_id in sorted(samples, key=lambda sample: sample[1]):
+            resumed_times.setdefault(program_id, []).append(samples[(program_id, sample_id)])
+        return resumed_times
+
+    def _write_sample_count(self, program, times):
+        self._sample_counts.write("{},{},{}\n".format(program.id, len(times), round(relative_ci(times), 6)))
+        self._sample_counts.flush()
+
+    def _pending_samples(self, program, sample_size):
+        sample_ids = range(1, sample_size + 1)
+        if self._journal is None:
+            return sample_ids
+        return self._journal.pending_samples(program.id, sample_ids)
+
+    def _write_results(self, program, instrumenter_result):
+        """
+        Writes every sample as soon as it is measured and records it in the journal.
+        Returns False if a sample failed
+        """
+        instrumenter_result, journaled_result = itertools.tee(instrumenter_result)
+        sample_ids = (_sample_id(row) if isinstance(row, str) else None for row in journaled_result)
+        result_rows = self.csv_row_append_info(instrumenter_result, program)
+        for sample_id, result_row in zip(sample_ids, result_rows):
+            if result_row is None:
+                return False
+            if isinstance(result_row, SampleFailure):
+                self._write_failure(result_row)
+                continue
+            self._output.write(result_row + '\n')
+            if self._journal is None:
+                self._output.flush()
+            else:
+                # the results row must be on the disk before the sample is journaled
+                sync_file(self._output)
+                self._journal.record(program.id, sample_id)
+        return True
+
+    def _read_programs(self, input_file):
+        if input_file != "":
             input_file_full_path = os.path.abspath(input_file)
-            self._programs = []
             with open(input_file_full_path) as csvfile:
-                reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
-                for row in reader:
-                    # skip if row starts from #
-                    if row['program_id'].startswith('#'):
-                        continue
-                    self._programs.append(self._program_from_csv_row(row))
+                yield from self._programs_from_csv(csvfile)
         else:
-            reader = csv.DictReader(sys.stdin, delimiter=',', quotechar='"')
-            self._programs = [
-                self._program_from_csv_row(row) for row in reader]
-        # print("Loaded {} programs".format(len(self._programs)))
-
-        geth = "geth"
-        evmone = "evmone"
-        nethermind = "nethermind"
-        ethereumjs = 'ethereumjs'
-        erigon = "erigon"
-        revm = "revm"
-        besu = "besu"
-
-        allowed_evms = {geth, evmone, nethermind,
-                        ethereumjs, erigon, revm, besu}
-        if evm not in allowed_evms:
-            print("Wrong evm parameter. Allowed are: {}".format(
-                ','.join(allowed_evms)))
-            return
+            yield from self._programs_from_csv(sys.stdin)
+
+    def _programs_from_csv(self, csvfile):
+        reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
+        for row in reader:
+            # skip if row starts from #
+            if row['program_id'].startswith('#'):
+                continue
+            yield self._program_from_csv_row(row)
+
+    def _benchmark_runner(self, evm, session_client=None):
+        if session_client is not None:
+            return lambda program, sample_ids, exec_path: self.run_session_benchmark(
+                session_client, program, sample_ids)
+        return self._argument_checked_runner({
+            'geth': self.run_geth_benchmark,
+            'evmone': self.run_evmone_benchmark,
+            'nethermind': self.run_nethermind_benchmark,
+            'ethereumjs': self.run_ethereumjs_benchmark,
+            'erigon': self.run_erigon_benchmark,
+            'revm': self.run_revm_benchmark,
+            'besu': self.run_besu_benchmark,
+            'stub': self.run_stub_benchmark,
+        }[evm])
+
+    def _argument_checked_runner(self, runner):
+        def argument_checked_runner(program, sample_ids, exec_path):
+            # leave room for the longest argument prefix, besu's `--code=`, and `0x`
+            if self._transport == ARGV and len(program.bytecode) + len('--code=0x') >= MAX_ARG_STRLEN:
+                raise ClientRunError("Bytecode exceeds MAX_ARG_STRLEN, use the file or stdin transport")
+            yield from runner(program, sample_ids, exec_path)
+
+        return argument_checked_runner
+
+    def start_session(self, evm, exec_path):
+        exec_path = self._resolve_exec_path(evm, exec_path)
+
+        invocation = [exec_path] + SESSION_ARGS[evm]
+        if exec_path.endswith('.py'):
+            invocation = [sys.executable] + invocation
+        return ClientSession(invocation, cwd=os.path.dirname(exec_path), timeout=self._timeout)
+
+    def run_session_benchmark(self, session_client, program, sample_ids):
+        bytecode = program.bytecode
+        for run_id in sample_ids:
+            try:
+                instrumenter_result = session_client.run(bytecode)
+            except ClientSessionError as err:
+                raise ClientRunError("Error in session benchmark: {}".format(err))
 
-        header = ""
-        if evm == geth or evm == erigon:
-            header = "program_id,sample_id,total_time_ns,mem_allocs,mem_alloc_bytes"
-        elif evm == evmone:
-            header = "program_id,sample_id,total_time_ns,iterations_count"
-        elif evm == nethermind:
-            header = "program_id,sample_id,total_time_ns,iterations_count,std_dev_time_ns,mem_allocs,mem_alloc_bytes"
-        elif evm == ethereumjs or evm == revm:
-            header = "program_id,sample_id,total_time_ns,iterations_count,std_dev_time_ns"
-        elif evm == besu:
-            header = "program_id,sample_id,total_time_ns,iterations_count,std_dev_time_ns,gasUsed,pass"
-        print(header)
-
-        for program in self._programs:
-            instrumenter_result = None
-            if evm == geth:
-                instrumenter_result = self.run_geth_benchmark(
-                    program, sample_size, exec_path)
-            elif evm == evmone:
-                instrumenter_result = self.run_evmone_benchmark(
-                    program, sample_size, exec_path)
-            elif evm == nethermind:
-                instrumenter_result = self.run_nethermind_benchmark(
-                    program, sample_size, exec_path)
-            elif evm == ethereumjs:
-                instrumenter_result = self.run_ethereumjs_benchmark(
-                    program, sample_size, exec_path)
-            elif evm == erigon:
-                instrumenter_result = self.run_erigon_benchmark(
-                    program, sample_size, exec_path)
-            elif evm == revm:
-                instrumenter_result = self.run_revm_benchmark(
-                    program, sample_size, exec_path)
-            elif evm == besu:
-                instrumenter_result = self.run_besu_benchmark(
-                    program, sample_size, exec_path)
-
-            if instrumenter_result is None:
-                return
-            result_row = self.csv_row_append_info(instrumenter_result, program)
+            yield str(run_id) + "," + instrumenter_result
 
-            csv_chunk = '\n'.join(result_row)
-            print(csv_chunk)
+    def _measure_parallel(self, programs, evm, sample_size, exec_path, workers, cpus, session):
+        """
+        Spreads (program, sample) jobs over a pool of worker processes. The jobs of `BATCHED_EVMS` are
+        (program, all its samples), so the samples are measured by one client process, as in the serial mode. If `cpus` is given, every worker
+        pins itself (and so the client processes it spawns) to its own core.
+
+        The results are printed in the same order as in the serial mode.
+        """
+        cpu_list = _parse_cpus(cpus) if cpus is not None else []
+        if cpus is not None and workers <= 1:
+            workers = len(cpu_list)
+        if cpus is not None and len(cpu_list) < workers:
+            print("Not enough cpus for {} workers: {}".format(workers, cpu_list))
+            return False
+        unavailable_cpus = set(cpu_list) - os.sched_getaffinity(0)
+        if unavailable_cpus:
+            print("Unavailable cpus: {}".format(','.join(str(cpu) for cpu in sorted(unavailable_cpus))))
+            return False
+
+        cpu_queue = None
+        if cpu_list:
+            cpu_queue = multiprocessing.Queue()
+            for cpu in cpu_list[:workers]:
+                cpu_queue.put(cpu)
+
+        # with `skip-program` the samples of a failed program still in flight are dropped, as in the serial mode
+        self._skipped_program = None
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(cpu_queue,)) as pool:
+            if self._adaptive is None and evm in BATCHED_EVMS:
+                submitted_jobs = (self._submit_samples(pool, evm, program, sample_ids, exec_path, session)
+                                  for program in programs
+                                  for sample_ids in [list(self._pending_samples(program, sample_size))] if sample_ids)
+            elif self._adaptive is None:
+                submitted_jobs = (self._submit_sample(pool, evm, program, sample_id, exec_path, session)
+                                  for program in programs for sample_id in self._pending_samples(program, sample_size)
+                                  if program is not self._skipped_program)
+            else:
+                # in the adaptive mode the sample size is known only while measuring, a job measures a whole program
+                submitted_jobs = (self._submit_adaptive(pool, evm, program, exec_path, session)
+                                  for program in programs)
+
+            # keep a bounded window of jobs in flight and collect them in submission order
+            window = 2 * workers
+            pending = collections.deque()
+            for submitted_job in submitted_jobs:
+                pending.append(submitted_job)
+                if len(pending) >= window:
+                    if not self._write_parallel_result(*pending.popleft()):
+                        pool.terminate()
+                        return False
+            while pending:
+                if not self._write_parallel_result(*pending.popleft()):
+                    pool.terminate()
+                    return False
+        return True
+
+    def _submit_sample(self, pool, evm, program, sample_id, exec_path, session):
+        cached_row = self._cached_row(evm, program, sample_id)
+        if cached_row is not None:
+            return evm, program, _CachedResult([cached_row]), None, self._bytecode_key(program)
+        async_result = pool.apply_async(_run_worker_job,
+                                        (evm, program, [sample_id], exec_path, session, self._runner_options()))
+        return evm, program, async_result, None, self._bytecode_key(program)
+
+    def _submit_samples(self, pool, evm, program, sample_ids, exec_path, session):
+        # the cached samples are passed to the worker, which measures the others in one client process
+        cached_rows = {}
+        for sample_id in sample_ids:
+            cached_row = self._cached_row(evm, program, sample_id)
+            if cached_row is not None:
+                cached_rows[sample_id] = cached_row
+        if len(cached_rows) == len(sample_ids):
+            return (evm, program, _CachedResult([cached_rows[sample_id] for sample_id in sample_ids]), None,
+                    self._bytecode_key(program))
+        async_result = pool.apply_async(_run_worker_job, (evm, program, sample_ids, exec_path, session,
+                                                          self._runner_options(), cached_rows))
+        return evm, program, async_result, None, self._bytecode_key(program)
+
+    def _submit_adaptive(self, pool, evm, program, exec_path, session):
+        times = self._resumed_times.pop(program.id, [])
+        # the cached samples following the resumed ones are passed to the worker
+        cached_rows = {}
+        sample_id = len(times) + 1
+        while sample_id <= self._adaptive.max_samples:
+            cached_row = self._cached_row(evm, program, sample_id)
+            if cached_row is None:
+                break
+            cached_rows[sample_id] = cached_row
+            sample_id += 1
+        async_result = pool.apply_async(_run_adaptive_worker_job, (evm, program, exec_path, session,
+                                                                   self._runner_options(), self._adaptive, times,
+                                                                   cached_rows))
+        return evm, program, async_result, times, self._bytecode_key(program)
+
+    def _bytecode_key(self, program):
+        """
+        The cache key of the program's bytecode, None without the cache. The jobs of a program are submitted one
+        after another, its bytecode is hashed once, and the key travels with the jobs to `_write_parallel_result`
+        """
+        if self._cache is None:
+            return None
+        if self._keyed_program is not program:
+            self._keyed_program = program
+            self._program_key = ResultCache.bytecode_key(program.bytecode)
+        return self._program_key
+
+    def _cached_row(self, evm, program, sample_id):
+        if self._cache is None:
+            return None
+        columns = self._cache.get(self._client_key, self._cache_evm, self._bytecode_key(program), sample_id)
+        if columns is None:
+            return None
+        return "{},{}".format(sample_id, columns)
+
+    def _write_parallel_result(self, evm, program, async_result, resumed_times, bytecode_key):
+        if program is self._skipped_program:
+            return True
+        instrumenter_result = async_result.get()
+        if self._on_failure == SKIP_PROGRAM and any(isinstance(row, SampleFailure) for row in instrumenter_result):
+            self._skipped_program = program
+        measured_rows = [row for row in instrumenter_result if isinstance(row, str)]
+        if self._cache is not None and not isinstance(async_result, _CachedResult):
+            for result_row in measured_rows:
+                self._cache_result(evm, bytecode_key, result_row)
+        if not self._write_results(program, instrumenter_result):
+            return False
+        if resumed_times is not None and measured_rows:
+            self._write_sample_count(program, resumed_times + [total_time_ns(row) for row in measured_rows])
+        return True
 
     def _parse_geth_benchmark_output(self, stdout, stderr):
         text = stderr
@@ -179,28 +753,31 @@ class Measurements(object):
 
         return "{},{},{}".format(int(execution_time), int(allocations), int(allocated_bytes))
 
-    def run_geth_benchmark(self, program, sample_size, exec_path):
+    def run_geth_benchmark(self, program, sample_ids, exec_path):
         if exec_path == "":
             exec_path = os.path.abspath(DIR_PATH + '/' + DEFAULT_EXEC_GETH)
         else:
             exec_path = os.path.abspath(exec_path)
 
-        args = ['run', '--bench', program.bytecode]
-        invocation = [exec_path] + args
+        with CodeTransport(self._transport, program.bytecode) as code:
+            if code.transport == ARGV:
+                args = ['run', '--bench', code.argument]
+            else:
+                args = ['run', '--bench', '--codefile', code.argument]
+            invocation = [exec_path] + args
 
-        results = []
-        for run_id in range(1, sample_size + 1):
-            pro = subprocess.Popen(
-                invocation, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-            stdout, stderr = pro.communicate()
+            for run_id in sample_ids:
+                result = self._run_process(invocation, code.stdin, pass_fds=code.pass_fds)
+                if result.returncode != 0:
+                    raise ClientRunError("Error in geth benchmark, exit code {}: {}".format(
+                        result.returncode, result.stderr))
 
-            instrumenter_result = self._parse_geth_benchmark_output(
-                stdout, stderr)
+                instrumenter_result = self._parse_geth_benchmark_output(
+                    result.stdout, result.stderr)
 
-            results.append(str(run_id) + "," + instrumenter_result)
-        return results
+                yield str(run_id) + "," + instrumenter_result + self._resource_columns(result)
 
-    def run_nethermind_benchmark(self, program, sample_size, exec_path):
+    def run_nethermind_benchmark(self, program, sample_ids, exec_path):
         if exec_path == "":
             exec_path = os.path.abspath(
                 DIR_PATH + '/' + DEFAULT_EXEC_NETHERMIND)
@@ -212,69 +789,66 @@ class Measurements(object):
 
         invocation = [exec_path] + args
 
-        results = []
-        for run_id in range(1, sample_size + 1):
-            pro = subprocess.Popen(invocation, stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE, universal_newlines=True, cwd=exec_parent)
-            stdout, stderr = pro.communicate()
+        for run_id in sample_ids:
+            result = self._run_process(invocation, cwd=exec_parent)
 
-            if (stderr != ""):
-                print("Error in nethermind benchmark")
-                print(stderr)
-                return
+            if (result.stderr != ""):
+                raise ClientRunError("Error in nethermind benchmark: {}".format(result.stderr))
+            if result.returncode != 0:
+                raise ClientRunError("Error in nethermind benchmark, exit code {}".format(result.returncode))
 
-            instrumenter_result = stdout.split('\n')[0]
-            results.append(str(run_id) + "," + instrumenter_result)
-        return results
+            instrumenter_result = result.stdout.split('\n')[0]
+            yield str(run_id) + "," + instrumenter_result + self._resource_columns(result)
 
-    def run_evmone_benchmark(self, program, sample_size, exec_path):
+    def run_evmone_benchmark(self, program, sample_ids, exec_path):
         if exec_path == "":
             exec_path = os.path.abspath(DIR_PATH + '/' + DEFAULT_EXEC_EVMONE)
         else:
             exec_path = os.path.abspath(exec_path)
 
-        if program.bytecode.startswith('0x'):
-            bytecode = program.bytecode
-        else:
-            bytecode = '0x' + program.bytecode
+        bytecode = program.bytecode
+        if not bytecode.startswith('0x'):
+            bytecode = '0x' + bytecode
 
         args = [bytecode, '--benchmark_format=csv']
         invocation = [exec_path] + args
 
-        results = []
-        for run_id in range(1, sample_size + 1):
-            pro = subprocess.Popen(
-                invocation, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-            stdout, stderr = pro.communicate()
-            last_line = [line for line in stdout.split('\n') if line][-1]
+        for run_id in sample_ids:
+            process_result = self._run_process(invocation)
+            lines = [line for line in process_result.stdout.split('\n') if line]
+            if process_result.returncode != 0 or not lines:
+                raise ClientRunError("Error in evmone benchmark, exit code {}: {}".format(
+                    process_result.returncode, process_result.stderr))
+            last_line = lines[-1]
             result = last_line.split(',')
-            results.append(
-                f'{run_id},{float(result[2]) * 1000},{result[1]}')
-
-        return results
+            yield (
+                f'{run_id},{float(result[2]) * 1000},{result[1]}' + self._resource_columns(process_result))
 
-    def run_erigon_benchmark(self, program, sample_size, exec_path):
+    def run_erigon_benchmark(self, program, sample_ids, exec_path):
         if exec_path == "":
             exec_path = os.path.abspath(DIR_PATH + '/' + DEFAULT_EXEC_ERIGON)
         else:
             exec_path = os.path.abspath(exec_path)
 
-        args = ['--code', program.bytecode, '--bench', 'run']
-        invocation = [exec_path] + args
+        with CodeTransport(self._transport, program.bytecode) as code:
+            if code.transport == ARGV:
+                args = ['--code', code.argument, '--bench', 'run']
+            else:
+                args = ['--codefile', code.argument, '--bench', 'run']
+            invocation = [exec_path] + args
 
-        results = []
-        for run_id in range(1, sample_size + 1):
-            pro = subprocess.Popen(
-                invocation, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-            stdout, stderr = pro.communicate()
+            for run_id in sample_ids:
+                result = self._run_process(invocation, code.stdin, pass_fds=code.pass_fds)
+                if result.returncode != 0:
+                    raise ClientRunError("Error in erigon benchmark, exit code {}: {}".format(
+                        result.returncode, result.stderr))
 
-            instrumenter_result = self._parse_geth_benchmark_output(
-                stdout, stderr)
+                instrumenter_result = self._parse_geth_benchmark_output(
+                    result.stdout, result.stderr)
 
-            results.append(str(run_id) + "," + instrumenter_result)
-        return results
+                yield str(run_id) + "," + instrumenter_result + self._resource_columns(result)
 
-    def run_ethereumjs_benchmark(self, program, sample_size, exec_path):
+    def run_ethereumjs_benchmark(self, program, sample_ids, exec_path):
         if exec_path == "":
             exec_path = os.path.abspath(DIR_PATH + '/' + DEFAULT_EXEC_ETHERJS)
         else:
@@ -286,18 +860,19 @@ class Measurements(object):
             '--max-old-space-size=4096',
             exec_path]
         args = ["benchmarks",
-                f'bytecode:{sample_size}', "-b", program.bytecode, "--csv"]
+                f'bytecode:{len(sample_ids)}', "-b", program.bytecode, "--csv"]
         invocation = ethereumjs_benchmark + args
-        result = subprocess.run(
-            invocation, stdout=subprocess.PIPE, universal_newlines=True)
-        assert result.returncode == 0
+        result = self._run_process(invocation)
+        print(result.stderr, end='', file=sys.stderr)
+        if result.returncode != 0:
+            raise ClientRunError("Error in ethereumjs benchmark, exit code {}".format(result.returncode))
+        # all the samples are measured by one process, they share its resource usage
+        resource_columns = self._resource_columns(result)
         # strip the final newline
 
         raw_result = [line for line in result.stdout.split('\n')[1:] if line]
 
-        instrumenter_result = []
-        line_id = 1
-        for line in raw_result:
+        for line_id, line in zip(sample_ids, raw_result):
             line_values = line.split(',')
             
             if line_values[2].startswith('±') and line_values[2].endswith('%'):
@@ -305,44 +880,52 @@ class Measurements(object):
             else :
                 std_dev_ns = line_values[2]
 
-            instrumenter_result.append(
-                f'{line_id},{line_values[1]},{line_values[3]},{std_dev_ns}')
-            line_id += 1
-        return instrumenter_result
+            yield f'{line_id},{line_values[1]},{line_values[3]},{std_dev_ns}' + resource_columns
 
-    def run_revm_benchmark(self, program, sample_size, exec_path):
+    def run_revm_benchmark(self, program, sample_ids, exec_path):
         if exec_path == "":
             exec_path = os.path.abspath(DIR_PATH + '/' + DEFAULT_EXEC_REVM)
         else:
             exec_path = os.path.abspath(exec_path)
 
+        bytecode = program.bytecode
         args = [
             'evm',
-            program.bytecode,
+            bytecode,
             '--bench']
         invocation = [exec_path] + args
-        results = []
-        for run_id in range(1, sample_size + 1):
-
-            pro = subprocess.Popen(invocation,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,
-                                   stdin=subprocess.PIPE,
-                                   universal_newlines=True)
-            stdout, stderr = pro.communicate(program.bytecode)
-
-            result_line = self._create_revm_result_line(run_id)
-            results.append(result_line)
-
-        return results
-
-    def _create_revm_result_line(self, sample_id):
-        results_base_folder = os.path.abspath(
-            os.getcwd() + '/target/criterion/revme/evm')
-        base_benchmark_data = json.load(
-            open(results_base_folder+'/new/estimates.json'))
-        base_benchmark_samples_data = json.load(
-            open(results_base_folder+'/new/sample.json'))
+        cleanups = []
+        try:
+            for run_id in sample_ids:
+                # every invocation gets its own criterion directory, so revm can be measured in parallel
+                target_dir = tempfile.mkdtemp(prefix='revm-')
+                env = dict(os.environ, CARGO_TARGET_DIR=target_dir,
+                           CRITERION_HOME=os.path.join(target_dir, 'criterion'))
+                result = self._run_process(invocation, bytecode, cwd=target_dir, env=env)
+
+                try:
+                    if result.returncode != 0:
+                        raise ClientRunError("Error in revm benchmark, exit code {}: {}".format(
+                            result.returncode, result.stderr))
+                    result_line = self._create_revm_result_line(run_id, target_dir) + self._resource_columns(result)
+                except OSError as err:
+                    raise ClientRunError("Error in revm benchmark: {} {}".format(err, result.stderr))
+                finally:
+                    # the directory is removed while the next sample is measured
+                    cleanup = threading.Thread(target=shutil.rmtree, args=(target_dir, True))
+                    cleanup.start()
+                    cleanups.append(cleanup)
+                yield result_line
+        finally:
+            for cleanup in cleanups:
+                cleanup.join()
+
+    def _create_revm_result_line(self, sample_id, target_dir):
+        results_folder = os.path.join(target_dir, 'criterion', 'revme', 'evm', 'new')
+        with open(os.path.join(results_folder, 'estimates.json')) as estimates_file:
+            base_benchmark_data = json.load(estimates_file)
+        with open(os.path.join(results_folder, 'sample.json')) as sample_file:
+            base_benchmark_samples_data = json.load(sample_file)
 
         # header = "program_id,sample_id,total_time_ns,iterations_count,std_dev_time_ns"
 
@@ -363,11 +946,9 @@ class Measurements(object):
                   ['point_estimate'], 2),  # std_dev_time_ns
         ]
 
-        shutil.rmtree(results_base_folder, True)
-
         return ','.join(str(col) for col in columns)
 
-    def run_besu_benchmark(self, program, sample_size, exec_path):
+    def run_besu_benchmark(self, program, sample_ids, exec_path):
         if exec_path == "":
             exec_path = os.path.abspath(DIR_PATH + '/' + DEFAULT_EXEC_BESU)
         else:
@@ -376,18 +957,15 @@ class Measurements(object):
         args = [ '--code=' + program.bytecode, '--repeat=1000', '--samples=1000' ]
         invocation = [exec_path] + args
 
-        results = []
-        for run_id in range(1, sample_size + 1):
-            pro = subprocess.Popen(invocation, stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE, universal_newlines=True)
-            stdout, stderr = pro.communicate()
+        for run_id in sample_ids:
+            process_result = self._run_process(invocation)
 
-            if (stderr != ""):
-                print("Error in besu benchmark")
-                print(stderr)
-                return
+            if (process_result.stderr != ""):
+                raise ClientRunError("Error in besu benchmark: {}".format(process_result.stderr))
+            if process_result.returncode != 0:
+                raise ClientRunError("Error in besu benchmark, exit code {}".format(process_result.returncode))
 
-            stdout_lines = stdout.splitlines()
+            stdout_lines = process_result.stdout.splitlines()
             # besu warnings, do not break execution but go to stderr
             for i in range(0, len(stdout_lines) - 2):
                 print(stdout_lines[i], file=sys.stderr)
@@ -395,12 +973,53 @@ class Measurements(object):
             try:
                 result = json.loads(stdout_lines[-1])
             except:
-                print("Error parsing the result:", stdout_lines[-1])
-                return
+                raise ClientRunError("Error parsing the result: {}".format(stdout_lines[-1] if stdout_lines else ""))
+
+            yield (
+                f'{run_id},{str(result["timens"])},{10*100},{str(result["std_dev_timens"])},{result["gasUsed"]},{result["pass"]}'
+                + self._resource_columns(process_result))
 
-            results.append(
-                f'{run_id},{str(result["timens"])},{10*100},{str(result["std_dev_timens"])},{result["gasUsed"]},{result["pass"]}')
-        return results
+    def run_stub_benchmark(self, program, sample_ids, exec_path):
+        if exec_path == "":
+            exec_path = os.path.abspath(DIR_PATH + '/' + DEFAULT_EXEC_STUB)
+        else:
+            exec_path = os.path.abspath(exec_path)
+
+        with CodeTransport(self._transport, program.bytecode) as code:
+            if code.transport == ARGV:
+                args = ['--bytecode', code.argument]
+            else:
+                args = ['--codefile', code.argument]
+            invocation = [sys.executable, exec_path] + args
+
+            for run_id in sample_ids:
+                result = self._run_process(invocation, code.stdin, pass_fds=code.pass_fds)
+                if result.returncode != 0:
+                    raise ClientRunError("Error in stub benchmark, exit code {}: {}".format(
+                        result.returncode, result.stderr))
+
+                instrumenter_result = result.stdout.split('\n')[0]
+                yield str(run_id) + "," + instrumenter_result + self._resource_columns(result)
+
+    def _runner_options(self):
+        # the options of the runners, passed on to the workers
+        return {'transport': self._transport, 'rusage': self._rusage, 'perf': self._perf, 'timeout': self._timeout,
+                'on_failure': self._on_failure, 'retries': self._retries, 'retry_backoff': self._retry_backoff}
+
+    def _set_runner_options(self, runner_options):
+        self._transport = runner_options['transport']
+        self._rusage = runner_options['rusage']
+        self._perf = runner_options['perf']
+        self._timeout = runner_options['timeout']
+        self._on_failure = runner_options['on_failure']
+        self._retries = runner_options['retries']
+        self._retry_backoff = runner_options['retry_backoff']
+
+    def _run_process(self, invocation, input=None, **popen_args):
+        return run_process(invocation, input, perf=self._perf, timeout=self._timeout, **popen_args)
+
+    def _resource_columns(self, result):
+        return resource_columns(result, self._rusage, self._perf)
 
     def csv_row_append_info(self, instrumenter_result, program):
         # append program_id which are not known to the instrumenter tool
@@ -411,7 +1030,148 @@ class Measurements(object):
             to_append = "\"{}\",".format(program_id)
         else:
             to_append = "{},".format(program_id)
-        return [to_append + row for row in instrumenter_result]
+        for row in instrumenter_result:
+            # a failed sample is passed on as is, None stops the measurement
+            yield to_append + row if isinstance(row, str) else row
+
+
+def _parse_evms(evm):
+    """
+    Parses the `--evm` parameter. Fire passes `evmone,geth` as a tuple
+    """
+    if isinstance(evm, str):
+        evm = evm.split(',')
+    return [str(name).strip() for name in evm]
+
+
+def _parse_exec_paths(exec_path, evms_count):
+    if exec_path == "":
+        return [""] * evms_count
+    if isinstance(exec_path, str):
+        exec_path = exec_path.split(',')
+    exec_paths = [str(path).strip() for path in exec_path]
+    return exec_paths if len(exec_paths) == evms_count else None
+
+
+def _split_cpus(cpu_list, parts):
+    """
+    Splits the cpus into `parts` disjoint sets of (almost) equal sizes
+    """
+    part_size, remainder = divmod(len(cpu_list), parts)
+    cpu_sets = []
+    start = 0
+    for part in range(parts):
+        end = start + part_size + (1 if part < remainder else 0)
+        cpu_sets.append(cpu_list[start:end])
+        start = end
+    return cpu_sets
+
+
+def _put_program(process, program_queue, program):
+    # a failed EVM process does not take programs anymore, do not wait for it
+    while process.is_alive():
+        try:
+            program_queue.put(program, timeout=1)
+            return
+        except queue.Full:
+            pass
+
+
+def _run_client(program_queue, evm, exec_path, cpus, output_file, journal, sample_counts_file, run_options):
+    # the EVM processes and the workers inherit the affinity
+    os.sched_setaffinity(0, cpus)
+    workers = len(cpus)
+    programs = iter(program_queue.get, None)
+    run_options = dict(run_options, failures_file=run_options['failures_file'].format(evm=evm))
+    succeeded = Measurements()._measure_client(programs, evm, exec_path, workers, cpus if workers > 1 else None,
+                                               output_file, journal, sample_counts_file, **run_options)
+    sys.exit(0 if succeeded else 1)
+
+
+def _parse_cpus(cpus):
+    """
+    Parses the `--cpus` parameter. Fire passes `2,3,4,5` as a tuple and `2` as an int, ranges like `2-5` are
+    passed as strings.
+    """
+    if isinstance(cpus, int):
+        return [cpus]
+    if isinstance(cpus, str):
+        cpus = cpus.split(',')
+    cpu_list = []
+    for cpu in cpus:
+        cpu = str(cpu).strip()
+        if '-' in cpu:
+            first, last = cpu.split('-')
+            cpu_list.extend(range(int(first), int(last) + 1))
+        elif cpu:
+            cpu_list.append(int(cpu))
+    return cpu_list
+
+
+class _CachedResult(object):
+    """
+    A cache hit in place of a worker's `AsyncResult`
+    """
+
+    def __init__(self, instrumenter_result):
+        self._instrumenter_result = instrumenter_result
+
+    def get(self):
+        return self._instrumenter_result
+
+
+_worker_session = None
+
+def _init_worker(cpu_queue):
+    if cpu_queue is not None:
+        # the affinity is inherited by the spawned EVM processes
+        os.sched_setaffinity(0, {cpu_queue.get()})
+
+
+def _worker_runner(evm, exec_path, session, runner_options, cached_rows=None):
+    global _worker_session
+    measurements = Measurements()
+    measurements._set_runner_options(runner_options)
+    # every worker keeps its own session client, it exits together with the worker closing its STDIN
+    if session and _worker_session is None:
+        _worker_session = measurements.start_session(evm, exec_path)
+    runner = measurements._benchmark_runner(evm, _worker_session)
+    if cached_rows:
+        runner = _prefetched_runner(runner, cached_rows)
+    return measurements._fail_soft_runner(runner)
+
+
+def _run_worker_job(evm, program, sample_ids, exec_path, session, runner_options, cached_rows=None):
+    runner = _worker_runner(evm, exec_path, session, runner_options, cached_rows)
+    return list(runner(program, sample_ids, exec_path))
+
+
+def _run_adaptive_worker_job(evm, program, exec_path, session, runner_options, adaptive, times, cached_rows):
+    runner = _worker_runner(evm, exec_path, session, runner_options, cached_rows)
+    return list(adaptive.samples(runner, program, exec_path, times))
+
+
+def _prefetched_runner(runner, instrumenter_rows):
+    """
+    Wraps the runner to measure only the samples missing in `instrumenter_rows`, by sample_id
+    """
+    def prefetched_runner(program, sample_ids, exec_path):
+        missing = [sample_id for sample_id in sample_ids if sample_id not in instrumenter_rows]
+        measured = runner(program, missing, exec_path) if missing else iter(())
+        for sample_id in sample_ids:
+            if sample_id in instrumenter_rows:
+                yield instrumenter_rows[sample_id]
+                continue
+            instrumenter_row = next(measured, None)
+            yield instrumenter_row
+            if instrumenter_row is None:
+                return
+
+    return prefetched_runner
+
+
+def _sample_id(instrumenter_row):
+    return int(instrumenter_row.partition(',')[0])
 
 
 def main():
@@ -0,0 +1,139 @@
+"""
+Running the EVM processes with resource accounting. Every process is reaped with `os.wait4`, its rusage
+(which includes the processes it waited for) gives the max RSS, the CPU times and the context switches.
+Optionally the process is run under `perf stat` to count cycles, instructions and cache misses.
+
+The context switches and the cycles tell the samples disturbed by the OS apart.
+"""
+
+import os
+import signal
+import subprocess
+import threading
+
+from failures import ClientRunError
+
+RUSAGE_COLUMNS = ['max_rss_kb', 'user_time_us', 'sys_time_us', 'vol_ctx_switches', 'invol_ctx_switches']
+PERF_EVENTS = ['cycles', 'instructions', 'cache-misses']
+PERF_COLUMNS = ['cycles', 'instructions', 'cache_misses']
+
+
+class ProcessResult(object):
+    """
+    POD object for a finished process
+    """
+
+    def __init__(self, returncode, stdout, stderr, rusage, perf_counters):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.rusage = rusage
+        self.perf_counters = perf_counters
+
+
+def run_process(invocation, input=None, perf=False, timeout=None, pass_fds=(), **popen_args):
+    """
+    Runs the process to completion, like `subprocess.run` with text pipes, but reaps it with `os.wait4`.
+    After `timeout` seconds the process, with all the processes it started, is killed and `ClientRunError` raised
+    """
+    perf_read_fd = None
+    if perf:
+        perf_read_fd, perf_write_fd = os.pipe()
+        invocation = ['perf', 'stat', '-x,', '-e', ','.join(PERF_EVENTS), '--log-fd', str(perf_write_fd),
+                      '--'] + invocation
+        pass_fds = tuple(pass_fds) + (perf_write_fd,)
+    try:
+        # in its own process group, to be killed together with its children
+        pro = subprocess.Popen(invocation, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True, pass_fds=pass_fds, start_new_session=timeout is not None,
+                               **popen_args)
+    except OSError:
+        if perf:
+            os.close(perf_read_fd)
+        raise
+    finally:
+        if perf:
+            os.close(perf_write_fd)
+
+    watchdog = None
+    timed_out = threading.Event()
+    if timeout is not None:
+        watchdog = threading.Timer(timeout, _kill_process_group, args=(pro.pid, timed_out))
+        watchdog.start()
+
+    # both pipes are drained at once, the process could block on a full one otherwise
+    stderr = []
+    stderr_reader = threading.Thread(target=lambda: stderr.append(pro.stderr.read()))
+    stderr_reader.start()
+    stdin_writer = threading.Thread(target=_write_input, args=(pro.stdin, input))
+    stdin_writer.start()
+    stdout = pro.stdout.read()
+    stdin_writer.join()
+    stderr_reader.join()
+    pro.stdout.close()
+    pro.stderr.close()
+
+    if watchdog is not None:
+        # the watchdog is stopped before the process is reaped, so it never kills a reused pid
+        os.waitid(os.P_PID, pro.pid, os.WEXITED | os.WNOWAIT)
+        watchdog.cancel()
+        watchdog.join()
+    _, status, rusage = os.wait4(pro.pid, 0)
+    # the process is reaped already, `Popen` must not wait for it
+    pro.returncode = os.waitstatus_to_exitcode(status)
+
+    perf_output = os.fdopen(perf_read_fd) if perf else None
+    if timed_out.is_set():
+        if perf_output is not None:
+            perf_output.close()
+        raise ClientRunError('{} timed out after {}s'.format(os.path.basename(invocation[0]), timeout))
+
+    perf_counters = None
+    if perf_output is not None:
+        with perf_output:
+            perf_counters = _parse_perf_output(perf_output.read())
+    return ProcessResult(pro.returncode, stdout, stderr[0], rusage, perf_counters)
+
+
+def _kill_process_group(pid, timed_out):
+    timed_out.set()
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _write_input(stdin, input):
+    try:
+        if input is not None:
+            stdin.write(input)
+        stdin.close()
+    except BrokenPipeError:
+        # the process does not read its STDIN
+        pass
+
+
+def _parse_perf_output(perf_output):
+    # `-x,` lines are `value,unit,event,...`, the value is `<not counted>` or `<not supported>` if unavailable
+    counters = {}
+    for line in perf_output.splitlines():
+        fields = line.split(',')
+        if len(fields) < 3:
+            continue
+        event = fields[2].split(':')[0]
+        if event in PERF_EVENTS and fields[0].isdigit():
+            counters[event] = int(fields[0])
+    return [counters.get(event, '') for event in PERF_EVENTS]
+
+
+def resource_columns(result, rusage, perf):
+    """
+    The extra CSV columns of a sample, with the leading comma. Empty if there are none
+    """
+    columns = []
+    if rusage:
+        columns += [result.rusage.ru_maxrss, int(result.rusage.ru_utime * 1e6), int(result.rusage.ru_stime * 1e6),
+                    result.rusage.ru_nvcsw, result.rusage.ru_nivcsw]
+    if perf:
+        columns += result.perf_counters
+    return ''.join(',' + str(column) for column in columns)
@@ -0,0 +1,113 @@
+"""
+On-disk cache of the measurement results. A result is keyed by the hash of the client binary, the evm,
+the hash of the (expanded) bytecode and the sample_id, so rebuilding a client or changing a program
+invalidates its results.
+
+Note that only the `exec_path` file itself is hashed. For the clients started by a launcher
+(e.g. besu's `evmtool` script) a rebuild might not change it, clear the cache (remove the file) then.
+
+The cache size is bounded, the least recently used results are evicted first.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                                  'gas-cost-estimator', 'results.sqlite')
+DEFAULT_CACHE_SIZE_MB = 256
+
+# uncommitted changes are lost when the run is killed, that only costs a few samples measured again
+COMMIT_INTERVAL = 100
+# estimated storage overhead of an entry besides the result columns
+ENTRY_OVERHEAD_BYTES = 200
+
+
+class ResultCache(object):
+    """
+    Size-bounded LRU cache of the instrumenter result columns (without `sample_id`)
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_size_mb=DEFAULT_CACHE_SIZE_MB):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._max_size = int(max_size_mb * 1024 * 1024)
+        self._client_keys = {}
+        self._uncommitted = 0
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'client TEXT, evm TEXT, bytecode TEXT, sample_id INTEGER, columns TEXT, size INTEGER, last_access REAL, '
+            'PRIMARY KEY (client, evm, bytecode, sample_id))')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)')
+        self._size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if self._size > self._max_size:
+            self._evict()
+
+    def client_key(self, exec_path):
+        exec_path = os.path.realpath(exec_path)
+        if exec_path not in self._client_keys:
+            digest = hashlib.sha256()
+            with open(exec_path, 'rb') as exec_file:
+                for block in iter(lambda: exec_file.read(1 << 20), b''):
+                    digest.update(block)
+            self._client_keys[exec_path] = digest.hexdigest()
+        return self._client_keys[exec_path]
+
+    @staticmethod
+    def bytecode_key(bytecode):
+        return hashlib.sha256(bytecode.encode()).hexdigest()
+
+    def get(self, client, evm, bytecode, sample_id):
+        key = (client, evm, bytecode, sample_id)
+        row = self._connection.execute(
+            'SELECT columns FROM results WHERE client=? AND evm=? AND bytecode=? AND sample_id=?', key).fetchone()
+        if row is None:
+            return None
+        self._connection.execute(
+            'UPDATE results SET last_access=? WHERE client=? AND evm=? AND bytecode=? AND sample_id=?',
+            (time.time(),) + key)
+        self._changed()
+        return row[0]
+
+    def put(self, client, evm, bytecode, sample_id, columns):
+        size = len(columns) + ENTRY_OVERHEAD_BYTES
+        replaced = self._connection.execute(
+            'SELECT size FROM results WHERE client=? AND evm=? AND bytecode=? AND sample_id=?',
+            (client, evm, bytecode, sample_id)).fetchone()
+        self._connection.execute(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (client, evm, bytecode, sample_id, columns, size, time.time()))
+        self._size += size - (replaced[0] if replaced else 0)
+        if self._size > self._max_size:
+            self._evict()
+        self._changed()
+
+    def _evict(self):
+        # evict down to 90% of the limit, not to evict on every put
+        target_size = self._max_size * 0.9
+        while self._size > target_size:
+            entries = self._connection.execute(
+                'SELECT rowid, size FROM results ORDER BY last_access LIMIT 1000').fetchall()
+            if not entries:
+                self._size = 0
+                return
+            evicted = []
+            for rowid, size in entries:
+                if self._size <= target_size:
+                    break
+                evicted.append((rowid,))
+                self._size -= size
+            self._connection.executemany('DELETE FROM results WHERE rowid=?', evicted)
+
+    def _changed(self):
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_INTERVAL:
+            self._connection.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
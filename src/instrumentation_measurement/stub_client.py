@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+A local stub of an EVM benchmark client. It does not execute the bytecode, the reported time is
+derived from the bytecode length. It is meant to test the measurement harness without the real EVMs.
+
+Prints results as `total_time_ns,iterations_count,std_dev_time_ns`.
+
+Single sample:
+```
+python3 stub_client.py --bytecode 6001600201
+```
+
+The bytecode can be read from a file, or from STDIN with `-`, like geth's `--codefile`:
+```
+python3 stub_client.py --codefile program.hex
+```
+
+Session mode, see `client_session.py` for the protocol:
+```
+python3 stub_client.py --session
+```
+"""
+
+import argparse
+import random
+import sys
+import time
+
+NS_PER_BYTE = 10
+BASE_TIME_NS = 1000
+ITERATIONS_COUNT = 1000
+
+
+def measure(bytecode, delay):
+    if delay > 0:
+        time.sleep(delay)
+    if bytecode.startswith('0x'):
+        bytecode = bytecode[2:]
+    total_time_ns = BASE_TIME_NS + NS_PER_BYTE * (len(bytecode) // 2)
+    noise = random.gauss(0, total_time_ns * 0.01)
+    return '{},{},{}'.format(int(total_time_ns + noise), ITERATIONS_COUNT, round(abs(noise), 2))
+
+
+def read_codefile(codefile):
+    if codefile == '-':
+        return sys.stdin.read().strip()
+    with open(codefile) as code:
+        return code.read().strip()
+
+
+def serve(delay):
+    for line in sys.stdin:
+        command, _, argument = line.rstrip('\n').partition(' ')
+        if command == 'run':
+            print('ok ' + measure(argument, delay), flush=True)
+        else:
+            print('error unknown command ' + command, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EVM benchmark client stub')
+    parser.add_argument('--bytecode', help='the bytecode to measure')
+    parser.add_argument('--codefile', help='file containing the bytecode to measure, - for STDIN')
+    parser.add_argument('--session', action='store_true', help='serve the session protocol on STDIN/STDOUT')
+    parser.add_argument('--delay', type=float, default=0, help='seconds to sleep in every sample')
+    args = parser.parse_args()
+
+    if args.session:
+        serve(args.delay)
+    elif args.bytecode is not None:
+        print(measure(args.bytecode, args.delay))
+    elif args.codefile is not None:
+        print(measure(read_codefile(args.codefile), args.delay))
+    else:
+        parser.error('either --bytecode, --codefile or --session is required')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+Tests of `Measurements.measure` against the fake clients, which report a time derived from the bytecode length:
+```
+python3 -m unittest test_measurements
+```
+"""
+
+import csv
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from measurements import DIR_PATH, Measurements
+
+PROGRAMS = [('PROGRAM_0', '6001'), ('PROGRAM_1', '600160'), ('PROGRAM_2', '60016002')]
+
+# a geth client logging its invocations, failing the `TEST_CLIENT_FAIL` bytecode and the first
+# `TEST_CLIENT_FAIL_FIRST` invocations, see `fake_client.py` for the output
+TEST_CLIENT = """#!{python}
+import os
+import sys
+sys.path.insert(0, {dir_path!r})
+import fake_client
+
+with open(os.environ['TEST_CLIENT_LOG'], 'a+') as log:
+    log.seek(0)
+    invocations = len(log.readlines())
+    log.write(' '.join(sys.argv[1:]) + '\\n')
+if os.environ.get('TEST_CLIENT_FAIL', '') in sys.argv or invocations < int(os.environ.get('TEST_CLIENT_FAIL_FIRST', 0)):
+    print('test client failure', file=sys.stderr)
+    sys.exit(1)
+fake_client.main()
+"""
+
+
+class MeasureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='test-measurements-')
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.client_log = self.path('client.log')
+        environ = mock.patch.dict(os.environ, {'FAKE_CLIENT_EVM': 'geth', 'TEST_CLIENT_LOG': self.client_log})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        self.client = self.path('test_client.py')
+        with open(self.client, 'w') as client_file:
+            client_file.write(TEST_CLIENT.format(python=sys.executable, dir_path=DIR_PATH))
+        os.chmod(self.client, os.stat(self.client).st_mode | stat.S_IXUSR)
+        self.programs = self.write_programs(PROGRAMS)
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def write_programs(self, programs):
+        path = self.path('programs.csv')
+        with open(path, 'w') as programs_file:
+            writer = csv.writer(programs_file)
+            writer.writerow(['program_id', 'bytecode'])
+            writer.writerows(programs)
+        return path
+
+    def measure(self, output_name='results.csv', **options):
+        options = dict(dict(evm='geth', exec_path=self.client, input_file=self.programs, sample_size=2), **options)
+        output_file = self.path(output_name)
+        Measurements().measure(output_file=output_file, **options)
+        return read_rows(output_file)
+
+    def invocations(self):
+        if not os.path.exists(self.client_log):
+            return 0
+        with open(self.client_log) as log:
+            return len(log.readlines())
+
+    def test_serial(self):
+        rows = self.measure()
+        self.assertEqual(['program_id', 'sample_id', 'total_time_ns', 'mem_allocs', 'mem_alloc_bytes'], rows[0])
+        self.assertEqual([['PROGRAM_0', '1', '1020'], ['PROGRAM_0', '2', '1020'], ['PROGRAM_1', '1', '1030'],
+                          ['PROGRAM_1', '2', '1030'], ['PROGRAM_2', '1', '1040'], ['PROGRAM_2', '2', '1040']],
+                         [row[:3] for row in rows[1:]])
+        self.assertEqual(6, self.invocations())
+
+    def test_parallel_order(self):
+        serial_rows = self.measure('serial.csv', sample_size=3)
+        parallel_rows = self.measure('parallel.csv', sample_size=3, workers=3)
+        self.assertEqual(serial_rows, parallel_rows)
+
+    def test_resume(self):
+        journal = self.path('journal.csv')
+        self.measure(journal=journal)
+        self.assertEqual(6, self.invocations())
+
+        # the journaled samples 1 and 2 of every program are skipped, only the samples 3 are measured
+        rows = self.measure(journal=journal, resume=True, sample_size=3)
+        self.assertEqual(9, self.invocations())
+        self.assertEqual(['program_id', 'sample_id', 'total_time_ns', 'mem_allocs', 'mem_alloc_bytes'], rows[0])
+        self.assertEqual([('PROGRAM_0', '3'), ('PROGRAM_1', '3'), ('PROGRAM_2', '3')],
+                         [tuple(row[:2]) for row in rows[7:]])
+        self.assertEqual(10, len(rows))
+
+    def test_resume_parallel(self):
+        journal = self.path('journal.csv')
+        self.measure(journal=journal, sample_size=1)
+        self.measure(journal=journal, resume=True, workers=2)
+        self.assertEqual(6, self.invocations())
+
+    def test_reuse_cache(self):
+        cache_path = self.path('cache.sqlite')
+        rows = self.measure('first.csv', reuse_cache=True, cache_path=cache_path)
+        self.assertEqual(6, self.invocations())
+
+        self.assertEqual(rows, self.measure('cached.csv', reuse_cache=True, cache_path=cache_path))
+        self.assertEqual(rows, self.measure('cached_parallel.csv', reuse_cache=True, cache_path=cache_path,
+                                            workers=2))
+        self.assertEqual(6, self.invocations())
+
+    def test_reuse_cache_other_samples(self):
+        cache_path = self.path('cache.sqlite')
+        self.measure(reuse_cache=True, cache_path=cache_path, sample_size=1)
+        self.measure(reuse_cache=True, cache_path=cache_path, sample_size=2)
+        self.assertEqual(6, self.invocations())
+
+    def test_abort(self):
+        os.environ['TEST_CLIENT_FAIL'] = '600160'
+        with self.assertRaises(SystemExit) as exit_context:
+            self.measure()
+        self.assertEqual(1, exit_context.exception.code)
+        # the measurement stops on the first failed sample
+        self.assertEqual(3, self.invocations())
+        self.assertEqual([['PROGRAM_0', '1'], ['PROGRAM_0', '2']], [row[:2] for row in read_rows(
+            self.path('results.csv'))[1:]])
+
+    def test_skip_program(self):
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                os.environ['TEST_CLIENT_FAIL'] = '600160'
+                failures_file = self.path('failures_{}.csv'.format(workers))
+                rows = self.measure(on_failure='skip-program', failures_file=failures_file, workers=workers)
+                self.assertEqual([['PROGRAM_0', '1'], ['PROGRAM_0', '2'], ['PROGRAM_2', '1'], ['PROGRAM_2', '2']],
+                                 [row[:2] for row in rows[1:]])
+                failures = read_rows(failures_file)
+                self.assertEqual(['program_id', 'sample_id', 'evm', 'attempts', 'error'], failures[0])
+                self.assertEqual([['PROGRAM_1', '1', 'geth', '1']], [row[:4] for row in failures[1:]])
+                self.assertIn('exit code 1', failures[1][4])
+
+    def test_mark_failed(self):
+        os.environ['TEST_CLIENT_FAIL'] = '600160'
+        failures_file = self.path('failures.csv')
+        rows = self.measure(on_failure='mark-failed', failures_file=failures_file)
+        self.assertEqual(['PROGRAM_0', 'PROGRAM_0', 'PROGRAM_2', 'PROGRAM_2'], [row[0] for row in rows[1:]])
+        self.assertEqual([['PROGRAM_1', '1'], ['PROGRAM_1', '2']],
+                         [row[:2] for row in read_rows(failures_file)[1:]])
+
+    def test_retries(self):
+        os.environ['TEST_CLIENT_FAIL_FIRST'] = '2'
+        failures_file = self.path('failures.csv')
+        rows = self.measure(retries=2, retry_backoff=0, failures_file=failures_file)
+        self.assertEqual(6, len(rows) - 1)
+        self.assertEqual(8, self.invocations())
+        self.assertFalse(os.path.exists(failures_file) and read_rows(failures_file)[1:])
+
+    def test_retries_exhausted(self):
+        os.environ['TEST_CLIENT_FAIL'] = '600160'
+        failures_file = self.path('failures.csv')
+        self.measure(retries=2, retry_backoff=0, on_failure='skip-program', failures_file=failures_file)
+        self.assertEqual([['PROGRAM_1', '1', 'geth', '3']], [row[:4] for row in read_rows(failures_file)[1:]])
+
+    def test_duplicate_evms(self):
+        with self.assertRaises(SystemExit) as exit_context:
+            self.measure('results_{evm}.csv', evm='geth,geth', exec_path='{0},{0}'.format(self.client), cpus='0,0')
+        self.assertEqual(1, exit_context.exception.code)
+        self.assertEqual(0, self.invocations())
+
+    def test_transports(self):
+        rows = self.measure('argv.csv')
+        for transport in ('file', 'stdin'):
+            with self.subTest(transport=transport):
+                self.assertEqual(rows, self.measure(transport + '.csv', transport=transport))
+
+    def test_transport_unreachable(self):
+        # the padded code is passed in full
+        self.programs = self.write_programs([('PROGRAM_0', '6001unreachable')])
+        for transport in ('argv', 'file', 'stdin'):
+            with self.subTest(transport=transport):
+                rows = self.measure(transport + '.csv', transport=transport, sample_size=1)
+                self.assertEqual(['PROGRAM_0', '1', str(1000 + 10 * 2048)], rows[1][:3])
+
+    def test_stub_transports(self):
+        for transport in ('argv', 'file', 'stdin'):
+            with self.subTest(transport=transport):
+                rows = self.measure(transport + '.csv', evm='stub', exec_path='', transport=transport)
+                self.assertEqual([('PROGRAM_0', '1'), ('PROGRAM_0', '2'), ('PROGRAM_1', '1'), ('PROGRAM_1', '2'),
+                                  ('PROGRAM_2', '1'), ('PROGRAM_2', '2')], [tuple(row[:2]) for row in rows[1:]])
+                # the stub adds a 1% noise to the time
+                self.assertAlmostEqual(1040, float(rows[-1][2]), delta=100)
+
+
+def read_rows(path):
+    with open(path) as csv_file:
+        return list(csv.reader(csv_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+"""
+Random BLS12-381 points for the programs of `pg_arguments_bls.py`.
+
+Point `index` of a group (G1 or G2) and a seed is `scalar * G`, where the scalar is drawn from the seed, the group and
+the index alone. The points are encoded the way the BLS precompiles take them, every coordinate in 64 bytes. A point
+is the same wherever it comes from:
+
+- computed on the fly, with fixed-base windowed tables of the generators: `scalar * G` is the sum of one table entry
+  per `WINDOW_BITS` bits of the scalar, so no doublings and only a few additions, in projective coordinates,
+- read from a point pool file, which holds all the `POOL_SIZE` points of both groups for a seed. It is built once,
+  in parallel, with `build`, and memory-mapped by the generator.
+"""
+
+import fire
+import mmap
+import multiprocessing
+import random
+import struct
+from py_ecc.optimized_bls12_381 import (G1, G2, add, curve_order, double, normalize)
+
+POOL_SIZE = 4096
+WINDOW_BITS = 4
+
+POOL_MAGIC = b'BLSPOOL1'
+POINT_SIZES = {'g1': 128, 'g2': 256}
+GENERATORS = {'g1': G1, 'g2': G2}
+
+# the fixed-base tables, built on first use, per process
+_tables = {}
+
+
+class BlsPoints(object):
+    """
+    The points of a seed, read from the `pool_file` if given, otherwise computed on the fly
+    """
+
+    def __init__(self, seed, pool_file=None):
+        self._seed = str(seed)
+        self._pool_file = pool_file
+        self._computed = {}
+        self._pool = None
+        if pool_file:
+            self._pool, self._offsets = _open_pool(pool_file, self._seed)
+
+    def __getstate__(self):
+        # the memory map can't be pickled, so a process pool worker maps the pool file again
+        return self._seed, self._pool_file
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def g1(self, index):
+        """
+        The hex encoding of the G1 point `index`
+        """
+        return self._point('g1', index)
+
+    def g2(self, index):
+        """
+        The hex encoding of the G2 point `index`
+        """
+        return self._point('g2', index)
+
+    def _point(self, group, index):
+        assert 0 <= index < POOL_SIZE
+        if self._pool is not None:
+            offset = self._offsets[group] + index * POINT_SIZES[group]
+            return self._pool[offset:offset + POINT_SIZES[group]].hex()
+        if (group, index) not in self._computed:
+            self._computed[(group, index)] = point_encoding(self._seed, group, index).hex()
+        return self._computed[(group, index)]
+
+
+class PointPool(object):
+    """
+    Builds the point pool files of `BlsPoints`
+    """
+
+    def build(self, output, seed=0, jobs=1):
+        """
+        Computes all the points of both groups for the seed and writes them to the pool file `output`.
+
+        Parameters:
+        output (string): the point pool file to write
+        seed: the seed of the points, the same as the `seed` of the generator using the pool, defaults to 0
+        jobs (integer): number of processes computing the points, defaults to 1
+        """
+        seed = str(seed)
+        points = [(seed, group, index) for group in ['g1', 'g2'] for index in range(POOL_SIZE)]
+
+        with open(output, 'wb') as pool_file:
+            pool_file.write(_pool_header(seed))
+            if jobs > 1:
+                with multiprocessing.Pool(jobs) as pool:
+                    for encoding in pool.imap(_point_encoding_of, points, chunksize=64):
+                        pool_file.write(encoding)
+            else:
+                for point in points:
+                    pool_file.write(_point_encoding_of(point))
+
+
+def point_encoding(seed, group, index):
+    """
+    The encoding of the point `index` of the `group` for the `seed`, as bytes
+    """
+    scalar = random.Random('/'.join([str(seed), group, str(index)])).randrange(1, curve_order - 1)
+    x, y = normalize(fixed_base_multiply(group, scalar))
+    if group == 'g1':
+        coordinates = [x.n, y.n]
+    else:
+        coordinates = list(x.coeffs) + list(y.coeffs)
+    return b''.join(coordinate.to_bytes(64, 'big') for coordinate in coordinates)
+
+
+def fixed_base_multiply(group, scalar):
+    """
+    `scalar * G` for the generator of the `group`, as a projective point. `scalar` must be in `[1, curve_order)`
+    """
+    point = None
+    for row in _table(group):
+        digit = scalar & ((1 << WINDOW_BITS) - 1)
+        if digit:
+            point = row[digit] if point is None else add(point, row[digit])
+        scalar >>= WINDOW_BITS
+    return point
+
+
+def _table(group):
+    # row `i` holds `digit * 2^(i * WINDOW_BITS) * G` for all the digits of a window
+    if group not in _tables:
+        table = []
+        base = GENERATORS[group]
+        for _ in range(0, curve_order.bit_length(), WINDOW_BITS):
+            row = [None, base]
+            for _ in range(2, 1 << WINDOW_BITS):
+                row.append(add(row[-1], base))
+            table.append(row)
+            for _ in range(0, WINDOW_BITS):
+                base = double(base)
+        _tables[group] = table
+    return _tables[group]
+
+
+def _point_encoding_of(point):
+    return point_encoding(*point)
+
+
+def _pool_header(seed):
+    seed = seed.encode()
+    return POOL_MAGIC + struct.pack('<II', POOL_SIZE, len(seed)) + seed
+
+
+def _open_pool(pool_file, seed):
+    with open(pool_file, 'rb') as f:
+        pool = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    header = _pool_header(seed)
+    if pool[:len(header)] != header:
+        raise ValueError("{} is not a point pool of {} points for seed {}".format(pool_file, POOL_SIZE, seed))
+    g1_offset = len(header)
+    g2_offset = g1_offset + POOL_SIZE * POINT_SIZES['g1']
+    if len(pool) != g2_offset + POOL_SIZE * POINT_SIZES['g2']:
+        raise ValueError("{} is truncated".format(pool_file))
+
+    return pool, {'g1': g1_offset, 'g2': g2_offset}
+
+
+def main():
+    fire.Fire(PointPool, name='build')
+
+if __name__ == '__main__':
+    main()
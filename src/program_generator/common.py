@@ -1,4 +1,5 @@
 import csv
+import multiprocessing
 import random
 from math import ceil
 
@@ -15,90 +16,245 @@ def generate_single_marginal(single_op_pushes, operation, op_count, init_code =
   The returned program has the same number of empty pushes, pushes and pops regardless op_count.
   The init_code is executed once before the main opcodes
   """
-  nreturns = int(operation['Added to stack'])
-
-  # i.e. 23 from 0x23, PUSHes are longer
-  opcode = operation['Value'][2:]
-  popcode = "50"
-
-  # support up to 60 instructions
-  assert op_count <= constants.MAX_INSTRUCTIONS
-  
-  total_pop_count = constants.MAX_INSTRUCTIONS * nreturns
-  # support up to 60 ternary instructions
-  push_count = constants.MAX_INSTRUCTIONS * 3
-  # unless those are LOG* operations which consume more values from the stack
-  if operation['Mnemonic'] in ['LOG2', 'LOG3', 'LOG4']:
-    push_count = constants.MAX_INSTRUCTIONS * 6
-  # ...but before the pushes intended for `operation`, put "void" pushes to ensure all the pops can pop regardless of the remainder of the program
-  empty_push_count = total_pop_count
-
-  interleaved_op_and_pops_count = max(op_count - 1, 0)
-  end_pop_count = total_pop_count - interleaved_op_and_pops_count * nreturns
-
-  # start generation
-  bytecode = ''
-
-  # If this is an OPCODE accessing memory, we pre-allocate 128KB of memory at the very beginning
-  initial_mstore = initial_mstore_bytecode() if operation['Mnemonic'] in constants.MEMORY_OPCODES else ''
-  bytecode += initial_mstore
-
-  initial_call = initial_call_bytecode() if operation['Mnemonic'] in constants.RETURNDATA_OPCODES else ''
-  bytecode += initial_call
-
-  if init_code:
-    bytecode += init_code
-
-  empty_pushes = ["6000"] * empty_push_count
-  bytecode += ''.join(empty_pushes)
-  pushes = single_op_pushes * ceil(push_count / arity(operation)) if arity(operation) > 0 else []
-  bytecode += ''.join(pushes)
-
-  if operation['Mnemonic'] in ["JUMP", "JUMPI"]:
-    # JUMPs don't return anything, we don't POP it, so assertion
-    assert nreturns == 0
-
-    empty_combos_count = constants.MAX_INSTRUCTIONS - op_count
-    for _ in range(0, op_count):
-      bytecode += jump_opcode_combo(bytecode, opcode)
-    for _ in range(0, empty_combos_count):
-      bytecode += jump_opcode_combo(bytecode, None)
-  else:
-    if op_count == 0:
-      middle = []
-      pops = [popcode] * total_pop_count
-      bytecode += ''.join(middle + pops)
-    elif op_count >= 1:
-      middle = [opcode] + ([popcode] * nreturns + [opcode]) * interleaved_op_and_pops_count
-      bytecode += ''.join(middle)
-      pops = [popcode] * end_pop_count
-      bytecode += ''.join(pops)
-
-  # JUMPDEST is the only opcode that does not interact with the stack, so we prepend PUSH0 to not have empty bytecode programs
-  if operation['Mnemonic'] in ["JUMPDEST", "STOP", "INVALID"]:
-      bytecode = '5f' + bytecode 
-  final_unreachable_placeholder = 'unreachable' if operation['Mnemonic'] == 'CODECOPY' else ''
-  bytecode += final_unreachable_placeholder
-
-  # just in case
-  assert interleaved_op_and_pops_count * nreturns + end_pop_count == total_pop_count
-  assert interleaved_op_and_pops_count >= 0
-  assert end_pop_count >= 0
-
-  return bytecode
-
-
-# Generates the combination of OPCODEs needed to perform a JUMP
-# `bytecode` so far, needed to generate a correct JUMPDEST pc
-# `opcode` - is that of JUMP or JUMPI. If None, will not put the opcode in at all
-def jump_opcode_combo(current_bytecode, opcode):
-  current_pc = len(current_bytecode) // 2
-  if opcode:
-    jumpdest_pc = current_pc + 1 + 3 + 1  # PUSH3, pushed 3 bytes, jump
-    return byte_size_push(3, jumpdest_pc) + opcode + '5b'
-  else:
-    jumpdest_pc = current_pc + 1 + 3  # PUSH3, pushed 3 bytes, no jump here!
-    return byte_size_push(3, jumpdest_pc) + '5b'
+  return MarginalTemplate(single_op_pushes, operation, init_code).program(op_count)
+
+
+class MarginalTemplate(object):
+  """
+  The programs of `generate_single_marginal` for one operation and any op_count. The prefix, i.e. the initial code,
+  the empty pushes and the pushes of the arguments, does not depend on op_count, so it is encoded once, and a program
+  only appends the measured opcodes and the pops to it. Keep a template per operation to generate an op_count sweep
+  """
+
+  def __init__(self, single_op_pushes, operation, init_code = None):
+    self._mnemonic = operation['Mnemonic']
+    self._nreturns = int(operation['Added to stack'])
+
+    # i.e. 23 from 0x23, PUSHes are longer
+    self._opcode = operation['Value'][2:]
+
+    self._total_pop_count = constants.MAX_INSTRUCTIONS * self._nreturns
+    # support up to 60 ternary instructions
+    push_count = constants.MAX_INSTRUCTIONS * 3
+    # unless those are LOG* operations which consume more values from the stack
+    if self._mnemonic in ['LOG2', 'LOG3', 'LOG4']:
+      push_count = constants.MAX_INSTRUCTIONS * 6
+    # ...but before the pushes intended for `operation`, put "void" pushes to ensure all the pops can pop regardless of the remainder of the program
+    empty_push_count = self._total_pop_count
+
+    prefix = Assembler()
+
+    # JUMPDEST is the only opcode that does not interact with the stack, so we prepend PUSH0 to not have empty bytecode programs
+    if self._mnemonic in ["JUMPDEST", "STOP", "INVALID"]:
+      prefix.append('5f')
+
+    # If this is an OPCODE accessing memory, we pre-allocate 128KB of memory at the very beginning
+    if self._mnemonic in constants.MEMORY_OPCODES:
+      prefix.append(initial_mstore_bytecode())
+
+    if self._mnemonic in constants.RETURNDATA_OPCODES:
+      prefix.append(initial_call_bytecode())
+
+    if init_code:
+      prefix.append(init_code)
+
+    prefix.append("6000", empty_push_count)
+    if arity(operation) > 0:
+      prefix.append(''.join(single_op_pushes), ceil(push_count / arity(operation)))
+
+    self._prefix = prefix.code()
+    self._final_unreachable_placeholder = 'unreachable' if self._mnemonic == 'CODECOPY' else ''
+
+  def program(self, op_count):
+    """
+    The bytecode of the program with `op_count` measured opcodes
+    """
+    # support up to 60 instructions
+    assert op_count <= constants.MAX_INSTRUCTIONS
+
+    nreturns = self._nreturns
+    popcode = b'\x50'
+    interleaved_op_and_pops_count = max(op_count - 1, 0)
+    end_pop_count = self._total_pop_count - interleaved_op_and_pops_count * nreturns
+
+    if self._mnemonic in ["JUMP", "JUMPI"]:
+      # JUMPs don't return anything, we don't POP it, so assertion
+      assert nreturns == 0
+
+      # the JUMPDESTs are at PCs after the prefix
+      bytecode = Assembler()
+      bytecode.append(self._prefix)
+      empty_combos_count = constants.MAX_INSTRUCTIONS - op_count
+      for _ in range(0, op_count):
+        bytecode.jump_combo(self._opcode)
+      for _ in range(0, empty_combos_count):
+        bytecode.jump_combo(None)
+      code = bytecode.code()
+    elif op_count == 0:
+      code = self._prefix + popcode * self._total_pop_count
+    else:
+      opcode = bytes.fromhex(self._opcode)
+      code = b''.join([self._prefix, opcode, (popcode * nreturns + opcode) * interleaved_op_and_pops_count,
+                       popcode * end_pop_count])
+
+    # just in case
+    assert interleaved_op_and_pops_count * nreturns + end_pop_count == self._total_pop_count
+    assert interleaved_op_and_pops_count >= 0
+    assert end_pop_count >= 0
+
+    return code.hex() + self._final_unreachable_placeholder
+
+
+class Assembler(object):
+  """
+  Builds the bytecode of a program in a `bytearray`, so that appending does not copy the whole program every time,
+  as `bytecode += ...` on a hex string does. The hex is encoded once, by `hex()`, when the program is complete.
+
+  Jump destinations are labels: `push_label` puts a PUSH with a placeholder value, which `hex()` fixes up to the
+  PC at which `label` put the label, so a jump can go forward to code that is not there yet.
+  """
+
+  def __init__(self):
+    self._code = bytearray()
+    self._labels = {}
+    self._fixups = []
+    self._label_count = 0
+
+  @property
+  def pc(self):
+    """
+    The PC of the next instruction, i.e. the current size of the program in bytes
+    """
+    return len(self._code)
+
+  def append(self, code, count=1):
+    """
+    Appends `count` copies of `code`, in hex or bytes, which can be any number of instructions
+    """
+    if isinstance(code, str):
+      code = bytes.fromhex(code)
+    self._code += code * count
+
+  def push(self, byte_size, value):
+    """
+    Appends a PUSH of `value`, `byte_size` is also the PUSH variant (PUSH1 to PUSH32)
+    """
+    self._code.append(0x5f + byte_size)  # 0x60 is PUSH1
+    self._code += value.to_bytes(byte_size, 'big')
+
+  def new_label(self):
+    """
+    Returns a label which was not used yet in this program
+    """
+    self._label_count += 1
+    return ('_label', self._label_count)
+
+  def label(self, name):
+    """
+    Puts the label `name` at the current PC, the label must not be put twice
+    """
+    assert name not in self._labels
+    self._labels[name] = self.pc
+
+  def push_label(self, name, byte_size=3):
+    """
+    Appends a PUSH of the PC of the label `name`, which can be put before or after it
+    """
+    self._fixups.append((self.pc + 1, byte_size, name))
+    self.push(byte_size, 0)
+
+  def jump_combo(self, opcode):
+    """
+    Appends the combination of OPCODEs needed to perform a JUMP to the JUMPDEST directly following it.
+    `opcode` - is that of JUMP or JUMPI. If None, will not put the opcode in at all
+    """
+    jumpdest = self.new_label()
+    self.push_label(jumpdest)
+    if opcode:
+      self.append(opcode)
+    self.label(jumpdest)
+    self.append('5b')
+
+  def code(self):
+    """
+    The bytecode of the program, with all the label PUSHes fixed up
+    """
+    self._fix_up()
+    return bytes(self._code)
+
+  def hex(self):
+    """
+    The hex bytecode of the program, with all the label PUSHes fixed up
+    """
+    self._fix_up()
+    return self._code.hex()
+
+  def _fix_up(self):
+    for offset, byte_size, name in self._fixups:
+      if name not in self._labels:
+        raise ValueError("label {} is pushed, but never put".format(name))
+      self._code[offset:offset + byte_size] = self._labels[name].to_bytes(byte_size, 'big')
+
+
+def seed_unit(seed, *key):
+  """
+  Seeds `random` for a single unit of generation, from the master `seed` and the `key` of the unit (e.g. the opcode
+  and the op count), so that the programs of a unit do not depend on which units were generated before it, nor in
+  which process or shard
+  """
+  random.seed(a='/'.join(str(part) for part in (seed,) + key), version=2)
+
+
+def parse_shard(shard):
+  """
+  Parses the `--shard i/N` option into `(i, N)`, no shard is the single shard `(0, 1)`
+  """
+  if shard is None:
+    return 0, 1
+  try:
+    index, count = (int(part) for part in str(shard).split('/'))
+  except ValueError:
+    raise ValueError("shard must be i/N, got {}".format(shard))
+  if count < 1 or not 0 <= index < count:
+    raise ValueError("shard must be i/N with 0 <= i < N, got {}".format(shard))
+  return index, count
+
+
+def shard_units(units, shard):
+  """
+  The units of the shard `i/N`, the `i`-th of `N` contiguous slices of `units` of (nearly) equal size, and the position
+  of its first unit in `units`. The outputs of all the shards, concatenated in order, are the output of a single run
+  """
+  index, count = parse_shard(shard)
+  start = len(units) * index // count
+  end = len(units) * (index + 1) // count
+  return units[start:end], start
+
+
+def generate_units(generate_unit, units, jobs=1):
+  """
+  Yields the programs of `units` in order, where `generate_unit(unit)` returns the list of programs of a unit.
+  With `jobs > 1`, the units are generated in a pool of `jobs` processes, so `generate_unit` must seed the random
+  numbers it uses from the unit alone, see `seed_unit`
+  """
+  if jobs <= 1:
+    for unit in units:
+      yield from generate_unit(unit)
+    return
+
+  chunksize = max(1, len(units) // (jobs * 16))
+  with multiprocessing.Pool(jobs, initializer=_init_unit_worker, initargs=(generate_unit,)) as pool:
+    for programs in pool.imap(_generate_unit_in_worker, units, chunksize):
+      yield from programs
+
+
+def _init_unit_worker(generate_unit):
+  global _generate_unit
+  _generate_unit = generate_unit
+
+
+def _generate_unit_in_worker(unit):
+  return _generate_unit(unit)
 
 
 def prepare_opcodes(opcodes_file):
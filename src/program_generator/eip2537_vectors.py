@@ -0,0 +1,198 @@
+"""
+The EIP-2537 (BLS12-381 precompiles) test vectors of `data/eip-2537`.
+
+The JSON vector files are parsed once into a binary index file next to them. A vector set is a JSON file, named after
+the precompile, and prefixed with `fail-` for the vectors the precompile must reject, e.g. `add_G1_bls` and
+`fail-add_G1_bls`. Every set in the index carries the SHA-256 of its source file, and is parsed again only when the
+file changes. The index holds the vectors decoded, so loading it is a few reads, and no JSON nor hex parsing.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import struct
+import sys
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+VECTORS_DIR = os.path.join(dir_path, 'data', 'eip-2537')
+INDEX_FILE_NAME = 'vectors.idx'
+INDEX_MAGIC = b'EIP2537IDX1'
+
+_default_store = None
+
+
+class Vector(object):
+    """
+    POD object for a test vector, `expected` and `gas` are None for the vectors which must fail, `expected_error`
+    is None for the others
+    """
+
+    __slots__ = ('name', 'input', 'expected', 'gas', 'no_benchmark', 'expected_error')
+
+    def __init__(self, name, input, expected, gas, no_benchmark, expected_error):
+        self.name = name
+        self.input = input
+        self.expected = expected
+        self.gas = gas
+        self.no_benchmark = no_benchmark
+        self.expected_error = expected_error
+
+
+class VectorStore(object):
+    """
+    The vectors of all the sets in `vectors_dir`, by set and name. The index is refreshed on creation
+    """
+
+    def __init__(self, vectors_dir=VECTORS_DIR, index_file=None):
+        self._vectors_dir = vectors_dir
+        self._index_file = index_file or os.path.join(vectors_dir, INDEX_FILE_NAME)
+        self._sets = _refresh_index(vectors_dir, self._index_file)
+        self._by_name = {}
+
+    def vector_sets(self):
+        """
+        The names of all the vector sets
+        """
+        return sorted(self._sets)
+
+    def vectors(self, vector_set):
+        """
+        The vectors of the set, in the order of its file
+        """
+        if vector_set not in self._sets:
+            raise KeyError("no vector set {} in {}".format(vector_set, self._vectors_dir))
+        return self._sets[vector_set]
+
+    def vector(self, vector_set, name):
+        """
+        The vector of the set by its name
+        """
+        if vector_set not in self._by_name:
+            self._by_name[vector_set] = {vector.name: vector for vector in self.vectors(vector_set)}
+        return self._by_name[vector_set][name]
+
+
+def vector_store():
+    """
+    The store of the default vectors directory, loaded once per process
+    """
+    global _default_store
+    if _default_store is None:
+        _default_store = VectorStore()
+    return _default_store
+
+
+def _refresh_index(vectors_dir, index_file):
+    indexed = _read_index(index_file)
+    sets = {}
+    changed = False
+    for path in sorted(glob.glob(os.path.join(vectors_dir, '*.json'))):
+        vector_set = os.path.splitext(os.path.basename(path))[0]
+        with open(path, 'rb') as f:
+            source = f.read()
+        digest = hashlib.sha256(source).digest()
+        if vector_set in indexed and indexed[vector_set][0] == digest:
+            sets[vector_set] = indexed[vector_set]
+        else:
+            sets[vector_set] = (digest, [_parse_vector(vector) for vector in json.loads(source)])
+            changed = True
+
+    if changed or set(sets) != set(indexed):
+        _write_index(index_file, sets)
+    return {vector_set: vectors for vector_set, (_, vectors) in sets.items()}
+
+
+def _parse_vector(vector):
+    expected = vector.get('Expected')
+    return Vector(vector['Name'], bytes.fromhex(vector['Input']),
+                  bytes.fromhex(expected) if expected is not None else None,
+                  vector.get('Gas'), vector.get('NoBenchmark', False), vector.get('ExpectedError'))
+
+
+# Index file: the magic, the number of sets, then for every set its name, the SHA-256 of its file, the number of
+# vectors and the vectors. Strings and bytes are prefixed with their uint32 length, 0xffffffff for None.
+
+_NONE_LENGTH = 0xffffffff
+
+
+def _write_index(index_file, sets):
+    chunks = [INDEX_MAGIC, struct.pack('<I', len(sets))]
+    for vector_set, (digest, vectors) in sorted(sets.items()):
+        chunks += [_blob(vector_set.encode()), digest, struct.pack('<I', len(vectors))]
+        for vector in vectors:
+            chunks += [
+                _blob(vector.name.encode()),
+                _blob(vector.input),
+                _blob(vector.expected),
+                struct.pack('<q?', -1 if vector.gas is None else vector.gas, vector.no_benchmark),
+                _blob(vector.expected_error.encode() if vector.expected_error is not None else None),
+            ]
+
+    # the index is only a cache, so a read-only vectors directory is not an error
+    try:
+        with open(index_file + '.tmp', 'wb') as f:
+            f.write(b''.join(chunks))
+        os.replace(index_file + '.tmp', index_file)
+    except OSError as e:
+        print("could not write the vector index {}: {}".format(index_file, e), file=sys.stderr)
+
+
+def _read_index(index_file):
+    try:
+        with open(index_file, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return {}
+    if not data.startswith(INDEX_MAGIC):
+        return {}
+
+    reader = _Reader(data, len(INDEX_MAGIC))
+    sets = {}
+    try:
+        for _ in range(reader.unpack('<I')):
+            vector_set = reader.blob().decode()
+            digest = reader.take(32)
+            vectors = []
+            for _ in range(reader.unpack('<I')):
+                name = reader.blob().decode()
+                input = reader.blob()
+                expected = reader.blob()
+                gas, no_benchmark = reader.unpack('<q?')
+                expected_error = reader.blob()
+                vectors.append(Vector(name, input, expected, None if gas == -1 else gas, no_benchmark,
+                                      expected_error.decode() if expected_error is not None else None))
+            sets[vector_set] = (digest, vectors)
+    except (struct.error, ValueError):
+        # a truncated or otherwise broken index is built again
+        return {}
+    return sets
+
+
+def _blob(data):
+    if data is None:
+        return struct.pack('<I', _NONE_LENGTH)
+    return struct.pack('<I', len(data)) + data
+
+
+class _Reader(object):
+
+    def __init__(self, data, offset):
+        self._data = data
+        self._offset = offset
+
+    def take(self, size):
+        if self._offset + size > len(self._data):
+            raise ValueError("index truncated")
+        chunk = self._data[self._offset:self._offset + size]
+        self._offset += size
+        return chunk
+
+    def unpack(self, fmt):
+        values = struct.unpack(fmt, self.take(struct.calcsize(fmt)))
+        return values[0] if len(values) == 1 else values
+
+    def blob(self):
+        size = self.unpack('<I')
+        return None if size == _NONE_LENGTH else self.take(size)
@@ -5,20 +5,24 @@ import random
 import sys
 
 import constants
-from common import generate_single_marginal, prepare_opcodes, get_selection, arity, random_value_byte_size_push, byte_size_push
+from common import generate_single_marginal, prepare_opcodes, get_selection, arity, random_value_byte_size_push, byte_size_push, seed_unit, parse_shard, shard_units, generate_units
+from program_checker import ProgramValidator
+from program_record import ProgramRecord
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
 def get(l, index, default=None):
   return l[index] if -len(l) <= index < len(l) else default
 
-class Program(object):
+class Program(ProgramRecord):
   """
   POD object for a program
   """
 
+  __slots__ = ('opcode', 'op_count', 'arg0', 'arg1', 'arg2')
+
   def __init__(self, bytecode, opcode, op_count, args):
-    self.bytecode = bytecode
+    super().__init__(bytecode)
     self.opcode = opcode
     self.op_count = op_count
 
@@ -47,13 +51,14 @@ class ProgramGenerator(object):
 
   def __init__(self, selectionFile='selection_arguments.csv', seed=0):
     random.seed(a=seed, version=2)
+    self._seed = seed
 
     opcodes = prepare_opcodes(os.path.join(dir_path, 'data', 'opcodes.csv'))
     selection = get_selection(os.path.join(dir_path, 'data', selectionFile))
 
     self._operations = [op for op in opcodes if op['Value'] in selection]
 
-  def generate(self, fullCsv=True, count=1, opcode=None, opCount=10):
+  def generate(self, fullCsv=True, count=1, opcode=None, opCount=10, shard=None, jobs=1, validate=False):
     """
     Main entrypoint of the CLI tool. Should dispatch to the desired generation routine and print
     programs to STDOUT
@@ -63,37 +68,42 @@ class ProgramGenerator(object):
     count (int): the number of programs
     opcode (string): if set, will only generate programs for opcode
     opCount (integer): number of measured opcodes, defaults to 10. In total, programs with 0, `opCount` and `2 * opCount` will be generated.
+    shard (string): if set to `i/N`, will only generate the `i`-th of `N` slices of the programs, with the CSV header only in the first one. The shards concatenated are the output without `shard`
+    jobs (integer): number of processes generating the programs, defaults to 1
+    validate (boolean): if set, will check every program with the static simulator of `program_checker.py`, print the invalid ones to STDERR and, once all the programs are printed, exit with 1 if there are any
 
     selectionFile (string): file name of the OPCODE selection file under `data`, defaults to `selection.csv`
     seed: a seed for random number generator, defaults to 0
     """
 
-    programs = self._do_generate(opcode, count, opCount)
+    shard_index, _ = parse_shard(shard)
+    first_idx, programs = self._do_generate(opcode, count, opCount, shard, jobs)
+    validator = ProgramValidator() if validate else None
+    if validator is not None:
+      programs = validator.validate(programs)
 
     if fullCsv:
       writer = csv.writer(sys.stdout, delimiter=',', quotechar='"')
 
-      opcodes = [program.opcode for program in programs]
-      op_counts = [program.op_count for program in programs]
-      arg0s = [program.arg0 for program in programs]
-      arg1s = [program.arg1 for program in programs]
-      arg2s = [program.arg2 for program in programs]
-      program_ids = [program.opcode + '_' + str(idx) for idx, program in enumerate(programs)]
-      bytecodes = [program.bytecode for program in programs]
-
       header = ['program_id', 'opcode', 'op_count', 'arg0', 'arg1', 'arg2', 'bytecode']
-      writer.writerow(header)
+      if shard_index == 0:
+        writer.writerow(header)
 
-      rows = zip(program_ids, opcodes, op_counts, arg0s, arg1s, arg2s, bytecodes)
-      for row in rows:
-        writer.writerow(row)
+      for idx, program in enumerate(programs, first_idx):
+        program_id = program.opcode + '_' + str(idx)
+        writer.writerow([program_id, program.opcode, program.op_count, program.arg0, program.arg1, program.arg2, program.bytecode])
     else:
       for program in programs:
         print(program.bytecode)
 
+    if validator is not None and not validator.report():
+      sys.exit(1)
 
-  def _do_generate(self, opcode, count, op_count):
+
+  def _do_generate(self, opcode, count, op_count, shard, jobs):
     """
+    Returns the index of the first program of the shard and its programs, yielded one by one as they are generated.
+    A unit of generation is a program triplet
     """
     operations = [operation for operation in self._operations if operation['Value'] != '0xfe']
     if opcode:
@@ -101,10 +111,17 @@ class ProgramGenerator(object):
     else:
       pass
 
-    programs = [self._generate_program_triplet(operation, op_count) for operation in operations for _ in range(0, count)]
-    programs = [item for sublist in programs for item in sublist]
+    units = [(operation, i, op_count) for operation in operations for i in range(0, count)]
+    units, first_unit = shard_units(units, shard)
+
+    return first_unit * 3, generate_units(self._generate_unit, units, jobs)
 
-    return programs
+  def _generate_unit(self, unit):
+    operation, i, op_count = unit
+    seed_unit(self._seed, operation['Mnemonic'], i)
+    triplet = self._generate_program_triplet(operation, op_count)
+    assert len(triplet) == 3
+    return triplet
 
   def _generate_program_triplet(self, operation, op_count):
     opcode = operation['Mnemonic']
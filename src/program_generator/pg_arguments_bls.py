@@ -2,7 +2,11 @@ import csv
 import fire
 import random
 import sys
-from py_ecc.bls12_381 import (G1, G2, curve_order, multiply)
+from py_ecc.bls12_381 import curve_order
+from bls_points import BlsPoints, POOL_SIZE
+from common import Assembler, seed_unit, parse_shard, shard_units, generate_units
+from program_checker import ProgramValidator
+from program_record import ProgramRecord
 
 WRAPPING_INSTRUCTIONS_COUNT = 5
 
@@ -10,13 +14,15 @@ WRAPPING_INSTRUCTIONS_COUNT = 5
 def get(l, index, default=None):
   return l[index] if -len(l) <= index < len(l) else default
 
-class Program(object):
+class Program(ProgramRecord):
     """
     POD object for a program
     """
 
+    __slots__ = ('precompile', 'op_count', 'nominal_gas_cost', 'arg0', 'arg1', 'arg2')
+
     def __init__(self, bytecode, precompile, op_count, nominal_gas_cost, args):
-        self.bytecode = bytecode
+        super().__init__(bytecode)
         self.precompile = precompile
         self.op_count = op_count
         self.nominal_gas_cost = nominal_gas_cost
@@ -36,10 +42,12 @@ class ProgramGenerator(object):
 
     """
 
-    def __init__(self, seed=0):
+    def __init__(self, seed=0, pointPool=None):
         random.seed(a=seed, version=2)
+        self._seed = seed
+        self._points = BlsPoints(seed, pointPool)
 
-    def generate(self, fullCsv=True, count=1, opcode=None, opCount=10):
+    def generate(self, fullCsv=True, count=1, opcode=None, opCount=10, shard=None, jobs=1, validate=False):
         """
         Main entrypoint of the CLI tool. Should dispatch to the desired generation routine and print
         programs to STDOUT
@@ -49,53 +57,62 @@ class ProgramGenerator(object):
         count (int): the number of programs
         opcode (string): if set, will only generate programs for opcode
         opCount (integer): number of measured opcodes, defaults to 10. In total, programs with 0, `opCount` and `2 * opCount` will be generated.
+        shard (string): if set to `i/N`, will only generate the `i`-th of `N` slices of the programs, with the CSV header only in the first one. The shards concatenated are the output without `shard`
+        jobs (integer): number of processes generating the programs, defaults to 1
+        validate (boolean): if set, will check every program with the static simulator of `program_checker.py`, print the invalid ones to STDERR and, once all the programs are printed, exit with 1 if there are any
 
         selectionFile (string): file name of the OPCODE selection file under `data`, defaults to `selection.csv`
         seed: a seed for random number generator, defaults to 0
+        pointPool (string): the point pool file of the seed, built by `bls_points.py`. If not set, the points are computed on the fly
         """
 
-        programs = self._do_generate(opcode, count, opCount)
+        shard_index, _ = parse_shard(shard)
+        first_idx, programs = self._do_generate(opcode, count, opCount, shard, jobs)
+        validator = ProgramValidator() if validate else None
+        if validator is not None:
+            programs = validator.validate(programs)
 
         if fullCsv:
             writer = csv.writer(sys.stdout, delimiter=',', quotechar='"')
 
-            opcodes = [program.precompile + program.nominal_gas_cost for program in programs]
-            op_counts = [program.op_count for program in programs]
-            arg0s = [program.arg0 for program in programs]
-            arg1s = [program.arg1 for program in programs]
-            arg2s = [program.arg2 for program in programs]
-            program_ids = [program.precompile + program.nominal_gas_cost + '_' + str(idx) for idx, program in enumerate(programs)]
-            bytecodes = [program.bytecode for program in programs]
-
             header = ['program_id', 'opcode', 'op_count', 'arg0', 'arg1', 'arg2', 'bytecode']
-            writer.writerow(header)
+            if shard_index == 0:
+                writer.writerow(header)
 
-            rows = zip(program_ids, opcodes, op_counts, arg0s, arg1s, arg2s, bytecodes)
-            for row in rows:
-                writer.writerow(row)
+            for idx, program in enumerate(programs, first_idx):
+                opcode = program.precompile + program.nominal_gas_cost
+                program_id = opcode + '_' + str(idx)
+                writer.writerow([program_id, opcode, program.op_count, program.arg0, program.arg1, program.arg2, program.bytecode])
         else:
             for program in programs:
                 print(program.bytecode)
 
-    def _do_generate(self, opcode, count, op_count):
+        if validator is not None and not validator.report():
+            sys.exit(1)
+
+    def _do_generate(self, opcode, count, op_count, shard, jobs):
+        """
+        Returns the index of the first program of the shard and its programs, yielded one by one as they are generated.
+        A unit of generation is the program triplet of a precompile
+        """
         op_counts = [0, op_count, op_count * 2]
-        programs: list[Program] = []
-        if opcode is None or opcode == 'BLS12_PAIRING_CHECK':
-            for _ in range(0, count):
-                programs.extend(_generate_bls12_pairing_check_programs(op_counts, op_count * 2))
-        if opcode is None or opcode == 'BLS12_G1MSM':
-            for _ in range(0, count):
-                programs.extend(_generate_bls12_g1msm_programs(op_counts, op_count * 2))
-        if opcode is None or opcode == 'BLS12_G2MSM':
-            for _ in range(0, count):
-                programs.extend(_generate_bls12_g2msm_programs(op_counts, op_count * 2))
-        if opcode is None or opcode == 'BLS12_G1MSM_S':
-            for _ in range(0, count):
-                programs.extend(_generate_bls12_g1msm_s_programs(op_counts, op_count * 2))
-        if opcode is None or opcode == 'BLS12_G2MSM_S':
-            for _ in range(0, count):
-                programs.extend(_generate_bls12_g2msm_s_programs(op_counts, op_count * 2))
-        return programs
+        precompiles = [
+            ('BLS12_PAIRING_CHECK', _generate_bls12_pairing_check_programs),
+            ('BLS12_G1MSM', _generate_bls12_g1msm_programs),
+            ('BLS12_G2MSM', _generate_bls12_g2msm_programs),
+            ('BLS12_G1MSM_S', _generate_bls12_g1msm_s_programs),
+            ('BLS12_G2MSM_S', _generate_bls12_g2msm_s_programs),
+        ]
+        units = [(generate_programs, i, op_counts) for precompile, generate_programs in precompiles
+                 if opcode is None or opcode == precompile for i in range(0, count)]
+        units, first_unit = shard_units(units, shard)
+
+        return first_unit * len(op_counts), generate_units(self._generate_unit, units, jobs)
+
+    def _generate_unit(self, unit):
+        generate_programs, i, op_counts = unit
+        seed_unit(self._seed, generate_programs.__name__, i)
+        return generate_programs(op_counts, op_counts[-1], self._points)
 
 
 def _generate_programs(op_counts, max_op_count, precompile, nominal_gas_cost, setup_code, args):
@@ -123,48 +140,34 @@ def random_scalar():
     encoded_scalar = hex(scalar)[2:].zfill(64)
     return encoded_scalar
 
-def _random_g1():
-    scalar = random.randrange(1, curve_order - 1)
-    pt = multiply(G1, scalar)
-    x, y = pt
-    encoded_x = hex(x.n)[2:].zfill(128)  # 64 bytes
-    encoded_y = hex(y.n)[2:].zfill(128)  # 64 bytes
-    return encoded_x + encoded_y
+def _random_g1(points):
+    return points.g1(random.randrange(POOL_SIZE))
 
 
-def _random_g2():
-    scalar = random.randrange(1, curve_order - 1)
-    pt = multiply(G2, scalar)
-    x, y = pt
-    x0, x1 = x.coeffs
-    y0, y1 = y.coeffs
-    encoded_x0 = hex(x0.n)[2:].zfill(128)
-    encoded_x1 = hex(x1.n)[2:].zfill(128)
-    encoded_y0 = hex(y0.n)[2:].zfill(128)
-    encoded_y1 = hex(y1.n)[2:].zfill(128)
-    return encoded_x0 + encoded_x1 + encoded_y0 + encoded_y1
+def _random_g2(points):
+    return points.g2(random.randrange(POOL_SIZE))
 
 def _push2(value):
     encoded_value = hex(value)[2:].zfill(4)
     return '61' + encoded_value
 
 def _fill_input_data_memory(start, data):
-    code = ''
-    data_pos = 0
+    code = Assembler()
     memory_pos = start
-    while data_pos < len(data):
-        code = code + '7f' + data[data_pos: data_pos + 64] + _push2(memory_pos) + '52'
-        data_pos = data_pos + 64
+    for data_pos in range(0, len(data), 64):
+        code.append('7f' + data[data_pos: data_pos + 64])
+        code.push(2, memory_pos)
+        code.append('52')
         memory_pos = memory_pos + 32
-    return code
+    return code.hex()
 
 
-def _generate_bls12_pairing_check_programs(op_counts, max_op_count):
+def _generate_bls12_pairing_check_programs(op_counts, max_op_count, points):
     precompile = 'BLS12_PAIRING_CHECK'
     k = random.randint(1, 32)
     input_data = ''
     for _ in range(0, k):
-        input_data = input_data + _random_g1() + _random_g2()
+        input_data = input_data + _random_g1(points) + _random_g2(points)
     input_data = input_data + ('00' * 384 * (32-k))
 
     setup_code = _fill_input_data_memory(0, input_data)
@@ -181,12 +184,12 @@ def _generate_bls12_pairing_check_programs(op_counts, max_op_count):
     return _generate_programs(op_counts, max_op_count, precompile, '', setup_code, [k])
 
 
-def _generate_bls12_g1msm_programs(op_counts, max_op_count):
+def _generate_bls12_g1msm_programs(op_counts, max_op_count, points):
     precompile = 'BLS12_G1MSM'
     k = random.randint(1, 128)
     input_data = ''
     for _ in range(0, k):
-        input_data = input_data + _random_g1() + random_scalar()
+        input_data = input_data + _random_g1(points) + random_scalar()
     input_data = input_data + ('00' * 160 * (128-k))
 
     setup_code = _fill_input_data_memory(0, input_data)
@@ -203,12 +206,12 @@ def _generate_bls12_g1msm_programs(op_counts, max_op_count):
     return _generate_programs(op_counts, max_op_count, precompile, '', setup_code, [k])
 
 
-def _generate_bls12_g2msm_programs(op_counts, max_op_count):
+def _generate_bls12_g2msm_programs(op_counts, max_op_count, points):
     precompile = 'BLS12_G2MSM'
     k = random.randint(1, 128)
     input_data = ''
     for _ in range(0, k):
-        input_data = input_data + _random_g2() + random_scalar()
+        input_data = input_data + _random_g2(points) + random_scalar()
     input_data = input_data + ('00' * 288 * (128-k))
 
     setup_code = _fill_input_data_memory(0, input_data)
@@ -225,12 +228,12 @@ def _generate_bls12_g2msm_programs(op_counts, max_op_count):
     return _generate_programs(op_counts, max_op_count, precompile, '', setup_code, [k])
 
 
-def _generate_bls12_g1msm_s_programs(op_counts, max_op_count):
+def _generate_bls12_g1msm_s_programs(op_counts, max_op_count, points):
     precompile = 'BLS12_G1MSM_S'
     k = random.randint(1, 8)
     input_data = ''
     for _ in range(0, k):
-        input_data = input_data + _random_g1() + random_scalar()
+        input_data = input_data + _random_g1(points) + random_scalar()
     input_data = input_data + ('00' * 160 * (8-k))
 
     setup_code = _fill_input_data_memory(0, input_data)
@@ -247,12 +250,12 @@ def _generate_bls12_g1msm_s_programs(op_counts, max_op_count):
     return _generate_programs(op_counts, max_op_count, precompile, '', setup_code, [k])
 
 
-def _generate_bls12_g2msm_s_programs(op_counts, max_op_count):
+def _generate_bls12_g2msm_s_programs(op_counts, max_op_count, points):
     precompile = 'BLS12_G2MSM_S'
     k = random.randint(1, 8)
     input_data = ''
     for _ in range(0, k):
-        input_data = input_data + _random_g2() + random_scalar()
+        input_data = input_data + _random_g2(points) + random_scalar()
     input_data = input_data + ('00' * 288 * (8-k))
 
     setup_code = _fill_input_data_memory(0, input_data)
@@ -2,6 +2,9 @@ import csv
 import fire
 import random
 import sys
+from common import seed_unit, parse_shard, shard_units, generate_units
+from program_checker import ProgramValidator
+from program_record import ProgramRecord
 
 WRAPPING_INSTRUCTIONS_COUNT = 5
 
@@ -9,13 +12,15 @@ WRAPPING_INSTRUCTIONS_COUNT = 5
 def get(l, index, default=None):
   return l[index] if -len(l) <= index < len(l) else default
 
-class Program(object):
+class Program(ProgramRecord):
     """
     POD object for a program
     """
 
+    __slots__ = ('precompile', 'op_count', 'nominal_gas_cost', 'arg0', 'arg1', 'arg2')
+
     def __init__(self, bytecode, precompile, op_count, nominal_gas_cost, args):
-        self.bytecode = bytecode
+        super().__init__(bytecode)
         self.precompile = precompile
         self.op_count = op_count
         self.nominal_gas_cost = nominal_gas_cost
@@ -37,8 +42,9 @@ class ProgramGenerator(object):
 
     def __init__(self, seed=0):
         random.seed(a=seed, version=2)
+        self._seed = seed
 
-    def generate(self, fullCsv=True, count=1, opcode=None, opCount=10):
+    def generate(self, fullCsv=True, count=1, opcode=None, opCount=10, shard=None, jobs=1, validate=False):
         """
         Main entrypoint of the CLI tool. Should dispatch to the desired generation routine and print
         programs to STDOUT
@@ -48,51 +54,61 @@ class ProgramGenerator(object):
         count (int): the number of programs
         opcode (string): if set, will only generate programs for opcode
         opCount (integer): number of measured opcodes, defaults to 10. In total, programs with 0, `opCount` and `2 * opCount` will be generated.
+        shard (string): if set to `i/N`, will only generate the `i`-th of `N` slices of the programs, with the CSV header only in the first one. The shards concatenated are the output without `shard`
+        jobs (integer): number of processes generating the programs, defaults to 1
+        validate (boolean): if set, will check every program with the static simulator of `program_checker.py`, print the invalid ones to STDERR and, once all the programs are printed, exit with 1 if there are any
 
         selectionFile (string): file name of the OPCODE selection file under `data`, defaults to `selection.csv`
         seed: a seed for random number generator, defaults to 0
         """
 
-        programs = self._do_generate(opcode, count, opCount)
+        shard_index, _ = parse_shard(shard)
+        first_idx, programs = self._do_generate(opcode, count, opCount, shard, jobs)
+        validator = ProgramValidator() if validate else None
+        if validator is not None:
+            programs = validator.validate(programs)
 
         if fullCsv:
             writer = csv.writer(sys.stdout, delimiter=',', quotechar='"')
 
-            opcodes = [program.precompile + program.nominal_gas_cost for program in programs]
-            op_counts = [program.op_count for program in programs]
-            arg0s = [program.arg0 for program in programs]
-            arg1s = [program.arg1 for program in programs]
-            arg2s = [program.arg2 for program in programs]
-            program_ids = [program.precompile + program.nominal_gas_cost + '_' + str(idx) for idx, program in enumerate(programs)]
-            bytecodes = [program.bytecode for program in programs]
-
             header = ['program_id', 'opcode', 'op_count', 'arg0', 'arg1', 'arg2', 'bytecode']
-            writer.writerow(header)
+            if shard_index == 0:
+                writer.writerow(header)
 
-            rows = zip(program_ids, opcodes, op_counts, arg0s, arg1s, arg2s, bytecodes)
-            for row in rows:
-                writer.writerow(row)
+            for idx, program in enumerate(programs, first_idx):
+                opcode = program.precompile + program.nominal_gas_cost
+                program_id = opcode + '_' + str(idx)
+                writer.writerow([program_id, opcode, program.op_count, program.arg0, program.arg1, program.arg2, program.bytecode])
         else:
             for program in programs:
                 print(program.bytecode)
 
-    def _do_generate(self, opcode, count, op_count):
+        if validator is not None and not validator.report():
+            sys.exit(1)
+
+    def _do_generate(self, opcode, count, op_count, shard, jobs):
+        """
+        Returns the index of the first program of the shard and its programs, yielded one by one as they are generated.
+        A unit of generation is the program triplet of a precompile
+        """
         op_counts = [0, op_count, op_count * 2]
-        programs: list[Program] = []
-        if opcode is None or opcode == 'SHA2-256':
-            # _generate_ecrecover_programs(op_counts, max_op_count) + \
-            for _ in range(0, count):
-                programs.extend(_generate_sha2_256_programs(op_counts, op_count * 2))
-        if opcode is None or opcode == 'RIPEMD-160':
-            for _ in range(0, count):
-                programs.extend(_generate_ripemd_160_programs(op_counts, op_count * 2))
-        if opcode is None or opcode == 'IDENTITY':
-            for _ in range(0, count):
-                programs.extend(_generate_identity_programs(op_counts, op_count * 2))
-        if opcode is None or opcode == 'MODEXP':
-            for _ in range(0, count):
-                programs.extend(_generate_modexp_programs(op_counts, op_count * 2))
-        return programs
+        precompiles = [
+            # ('ECRECOVER', _generate_ecrecover_programs),
+            ('SHA2-256', _generate_sha2_256_programs),
+            ('RIPEMD-160', _generate_ripemd_160_programs),
+            ('IDENTITY', _generate_identity_programs),
+            ('MODEXP', _generate_modexp_programs),
+        ]
+        units = [(generate_programs, i, op_counts) for precompile, generate_programs in precompiles
+                 if opcode is None or opcode == precompile for i in range(0, count)]
+        units, first_unit = shard_units(units, shard)
+
+        return first_unit * len(op_counts), generate_units(self._generate_unit, units, jobs)
+
+    def _generate_unit(self, unit):
+        generate_programs, i, op_counts = unit
+        seed_unit(self._seed, generate_programs.__name__, i)
+        return generate_programs(op_counts, op_counts[-1])
 
 
 def _generate_programs(op_counts, max_op_count, precompile, nominal_gas_cost, setup_code, args):
@@ -160,7 +176,6 @@ def _generate_modexp_programs(op_counts, max_op_count):
     precompile = 'MODEXP'
     arg_sizes = [random.randint(1, 32) for _ in range(0, 3)]  # base, exponent, modulo in bytes
     args = [ random.getrandbits(8 * arg_size) for arg_size in arg_sizes]
-    print(args)
     setup_code = '600060ff53' # initial_mem_allocation
     # first we put args, because we use MSTORE for potentially less than 32 bytes
     setup_code = setup_code + ('7f%0.64X' % (args[2])) + ('61%0.4X' % (96 + arg_sizes[0] + arg_sizes[1] + arg_sizes[2] - 32)) + '52' # put modulo to mem
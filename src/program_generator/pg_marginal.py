@@ -5,18 +5,22 @@ import random
 import sys
 
 import constants
-from common import generate_single_marginal, prepare_opcodes, get_selection, arity
+from common import MarginalTemplate, prepare_opcodes, get_selection, arity, seed_unit, parse_shard, shard_units, generate_units
+from program_checker import ProgramValidator
+from program_record import ProgramRecord
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
 
-class Program(object):
+class Program(ProgramRecord):
   """
   POD object for a program
   """
 
+  __slots__ = ('opcode', 'op_count')
+
   def __init__(self, bytecode, opcode, op_count):
-    self.bytecode = bytecode
+    super().__init__(bytecode)
     self.opcode = opcode
     self.op_count = op_count
 
@@ -34,13 +38,16 @@ class ProgramGenerator(object):
 
   def __init__(self, selectionFile='selection.csv', seed=0):
     random.seed(a=seed, version=2)
+    self._seed = seed
 
     opcodes = prepare_opcodes(os.path.join(dir_path, 'data', 'opcodes.csv'))
     selection = get_selection(os.path.join(dir_path, 'data', selectionFile))
 
     self._operations = [op for op in opcodes if op['Value'] in selection]
+    # the templates of the programs of the generic operations, by Mnemonic, which are the same for every op_count
+    self._templates = {}
 
-  def generate(self, fullCsv=True, opcode=None, maxOpCount=50, shuffleCounts=False, stepOpCount=5):
+  def generate(self, fullCsv=True, opcode=None, maxOpCount=50, shuffleCounts=False, stepOpCount=5, shard=None, jobs=1, validate=False):
     """
     Main entrypoint of the CLI tool. Should dispatch to the desired generation routine and print
     programs to STDOUT
@@ -51,34 +58,41 @@ class ProgramGenerator(object):
     maxOpCount (integer): maximum number of measured opcodes, defaults to 50
     shuffleCounts (boolean): if set, will shuffle the op counts used to generate programs for each OPCODE
     stepOpCount (integer): by how much the number of measured opcodes should increase, defaults to 5
+    shard (string): if set to `i/N`, will only generate the `i`-th of `N` slices of the programs, with the CSV header only in the first one. The shards concatenated are the output without `shard`
+    jobs (integer): number of processes generating the programs, defaults to 1
+    validate (boolean): if set, will check every program with the static simulator of `program_checker.py`, print the invalid ones to STDERR and, once all the programs are printed, exit with 1 if there are any
 
     selectionFile (string): file name of the OPCODE selection file under `data`, defaults to `selection.csv`
     seed: a seed for random number generator, defaults to 0
     """
 
-    programs = self._do_generate(opcode, maxOpCount, shuffleCounts, stepOpCount)
+    shard_index, _ = parse_shard(shard)
+    programs = self._do_generate(opcode, maxOpCount, shuffleCounts, stepOpCount, shard, jobs)
+    validator = ProgramValidator() if validate else None
+    if validator is not None:
+      programs = validator.validate(programs)
 
     if fullCsv:
       writer = csv.writer(sys.stdout, delimiter=',', quotechar='"')
 
-      opcodes = [program.opcode for program in programs]
-      op_counts = [program.op_count for program in programs]
-      program_ids = [program.opcode + '_' + str(program.op_count) for program in programs]
-      bytecodes = [program.bytecode for program in programs]
-
       header = ['program_id', 'opcode', 'op_count', 'bytecode']
-      writer.writerow(header)
+      if shard_index == 0:
+        writer.writerow(header)
 
-      rows = zip(program_ids, opcodes, op_counts, bytecodes)
-      for row in rows:
-        writer.writerow(row)
+      for program in programs:
+        program_id = program.opcode + '_' + str(program.op_count)
+        writer.writerow([program_id, program.opcode, program.op_count, program.bytecode])
     else:
       for program in programs:
         print(program.bytecode)
 
+    if validator is not None and not validator.report():
+      sys.exit(1)
+
 
-  def _do_generate(self, opcode, max_op_count, shuffle_counts, step_op_count):
+  def _do_generate(self, opcode, max_op_count, shuffle_counts, step_op_count, shard, jobs):
     """
+    Returns the programs of the shard, yielded one by one as they are generated. A unit of generation is a single program
     """
     operations = self._operations
     if opcode:
@@ -90,9 +104,15 @@ class ProgramGenerator(object):
     if shuffle_counts:
       random.shuffle(op_counts)
       
-    programs = [self._generate_single_program(operation, op_count, max_op_count) for operation in operations for op_count in op_counts]
+    units = [(operation, op_count, max_op_count) for operation in operations for op_count in op_counts]
+    units, _ = shard_units(units, shard)
 
-    return programs
+    return generate_units(self._generate_unit, units, jobs)
+
+  def _generate_unit(self, unit):
+    operation, op_count, max_op_count = unit
+    seed_unit(self._seed, operation['Mnemonic'], op_count)
+    return [self._generate_single_program(operation, op_count, max_op_count)]
 
   def _generate_single_program(self, operation, op_count, max_op_count):
     assert op_count <= constants.MAX_INSTRUCTIONS
@@ -144,11 +164,18 @@ class ProgramGenerator(object):
     if operation['Mnemonic'] == 'TSTORE_EXT':
       return Program(_generate_tstore_ext_program(operation, op_count, max_op_count), operation['Mnemonic'], op_count)
     if operation['Mnemonic'].startswith('PUSH'):
-      return Program(_generate_push_program(operation, op_count, max_op_count), operation['Mnemonic'], op_count)
+      template = self._marginal_template(_push_operation(operation), [])
+      return Program(template.program(op_count), operation['Mnemonic'], op_count)
 
     single_op_pushes = ["6003"] * arity(operation)
+    template = self._marginal_template(operation, single_op_pushes)
+
+    return Program(template.program(op_count), operation['Mnemonic'], op_count)
 
-    return Program(generate_single_marginal(single_op_pushes, operation, op_count), operation['Mnemonic'], op_count)
+  def _marginal_template(self, operation, single_op_pushes):
+    if operation['Mnemonic'] not in self._templates:
+      self._templates[operation['Mnemonic']] = MarginalTemplate(single_op_pushes, operation)
+    return self._templates[operation['Mnemonic']]
 
 def _generate_create_program(create_operation, op_count):
   """
@@ -364,9 +391,9 @@ def _generate_tstore_ext_program(tstore_operation, op_count, max_op_count):
 
   return op_deployment_code + op_address_store + no_op_deployment_code + no_op_calls + op_address_load + op_calls
 
-def _generate_push_program(operation, op_count, max_op_count):
+def _push_operation(operation):
   """
-  Generates a program for PUSH opcodes
+  The PUSH operation with its immediate value, to generate its programs as any other operation
   """
   assert operation['Mnemonic'].startswith('PUSH')
 
@@ -374,9 +401,7 @@ def _generate_push_program(operation, op_count, max_op_count):
   operation = operation.copy()
   operation['Value'] = operation['Value'] + ('03' * push_size)  # just add default value
 
-  single_op_pushes = []
-
-  return generate_single_marginal(single_op_pushes, operation, op_count)
+  return operation
 
 def _generate_subcontext_exit_program(operation, op_count, max_op_count):
   """
@@ -2,18 +2,23 @@ import csv
 import fire
 import random
 import sys
+from common import seed_unit, parse_shard, shard_units, generate_units
+from program_checker import ProgramValidator
+from program_record import ProgramRecord
 
 
 WRAPPING_INSTRUCTIONS_COUNT = 5
 
 
-class Program(object):
+class Program(ProgramRecord):
     """
     POD object for a program
     """
 
+    __slots__ = ('precompile', 'op_count', 'nominal_gas_cost')
+
     def __init__(self, bytecode, precompile, op_count, nominal_gas_cost):
-        self.bytecode = bytecode
+        super().__init__(bytecode)
         self.precompile = precompile
         self.op_count = op_count
         self.nominal_gas_cost = nominal_gas_cost
@@ -32,8 +37,9 @@ class ProgramGenerator(object):
 
     def __init__(self, seed=0):
         random.seed(a=seed, version=2)
+        self._seed = seed
 
-    def generate(self, fullCsv=True, maxOpCount=50, stepOpCount=5):
+    def generate(self, fullCsv=True, maxOpCount=50, stepOpCount=5, shard=None, jobs=1, validate=False):
         """
         Main entrypoint of the CLI tool. Should dispatch to the desired generation routine and print
         programs to STDOUT
@@ -42,45 +48,63 @@ class ProgramGenerator(object):
         fullCsv (boolean): if set, will generate programs with accompanying data in CSV format
         maxOpCount (integer): maximum number of measured opcodes, defaults to 50
         stepOpCount (integer): by how much the number of measured opcodes should increase, defaults to 5
+        shard (string): if set to `i/N`, will only generate the `i`-th of `N` slices of the programs, with the CSV header only in the first one. The shards concatenated are the output without `shard`
+        jobs (integer): number of processes generating the programs, defaults to 1
+        validate (boolean): if set, will check every program with the static simulator of `program_checker.py`, print the invalid ones to STDERR and, once all the programs are printed, exit with 1 if there are any
         """
 
-        programs = self._do_generate(maxOpCount, stepOpCount)
+        shard_index, _ = parse_shard(shard)
+        programs = self._do_generate(maxOpCount, stepOpCount, shard, jobs)
+        validator = ProgramValidator() if validate else None
+        if validator is not None:
+            programs = validator.validate(programs)
 
         if fullCsv:
             writer = csv.writer(sys.stdout, delimiter=',', quotechar='"')
 
-            opcodes = [program.precompile + program.nominal_gas_cost for program in programs]
-            op_counts = [program.op_count for program in programs]
-            program_ids = [program.precompile + program.nominal_gas_cost +
-                           '_' + str(program.op_count) for program in programs]
-            bytecodes = [program.bytecode for program in programs]
-
             header = ['program_id', 'opcode', 'op_count', 'bytecode']
-            writer.writerow(header)
+            if shard_index == 0:
+                writer.writerow(header)
 
-            rows = zip(program_ids, opcodes, op_counts, bytecodes)
-            for row in rows:
-                writer.writerow(row)
+            for program in programs:
+                opcode = program.precompile + program.nominal_gas_cost
+                program_id = opcode + '_' + str(program.op_count)
+                writer.writerow([program_id, opcode, program.op_count, program.bytecode])
         else:
             for program in programs:
                 print(program.bytecode)
 
-    def _do_generate(self, max_op_count, step_op_count):
+        if validator is not None and not validator.report():
+            sys.exit(1)
+
+    def _do_generate(self, max_op_count, step_op_count, shard, jobs):
+        """
+        Returns the programs of the shard, yielded one by one as they are generated. A unit of generation is all the
+        programs of a precompile
+        """
         op_counts = list(range(0, max_op_count + 1, step_op_count))
-        programs: list[Program] = \
-            _generate_ecrecover_programs(op_counts, max_op_count) + \
-            _generate_bls12_g1add_programs(op_counts, max_op_count) + \
-            _generate_bls12_g2add_programs(op_counts, max_op_count) + \
-            _generate_bls12_g1msm_k0_programs(op_counts, max_op_count) + \
-            _generate_bls12_g1msm_k1_programs(op_counts, max_op_count) + \
-            _generate_bls12_g1msm_k2_programs(op_counts, max_op_count) + \
-            _generate_bls12_g2msm_k0_programs(op_counts, max_op_count) + \
-            _generate_bls12_g2msm_k1_programs(op_counts, max_op_count) + \
-            _generate_bls12_g2msm_k2_programs(op_counts, max_op_count) + \
-            _generate_bls12_pairing_check_programs(op_counts, max_op_count) + \
-            _generate_bls12_map_fp_to_g1_programs(op_counts, max_op_count) + \
-            _generate_bls12_map_fp_to_g2_programs(op_counts, max_op_count)
-        return programs
+        units = [
+            (_generate_ecrecover_programs, op_counts, max_op_count),
+            (_generate_bls12_g1add_programs, op_counts, max_op_count),
+            (_generate_bls12_g2add_programs, op_counts, max_op_count),
+            (_generate_bls12_g1msm_k0_programs, op_counts, max_op_count),
+            (_generate_bls12_g1msm_k1_programs, op_counts, max_op_count),
+            (_generate_bls12_g1msm_k2_programs, op_counts, max_op_count),
+            (_generate_bls12_g2msm_k0_programs, op_counts, max_op_count),
+            (_generate_bls12_g2msm_k1_programs, op_counts, max_op_count),
+            (_generate_bls12_g2msm_k2_programs, op_counts, max_op_count),
+            (_generate_bls12_pairing_check_programs, op_counts, max_op_count),
+            (_generate_bls12_map_fp_to_g1_programs, op_counts, max_op_count),
+            (_generate_bls12_map_fp_to_g2_programs, op_counts, max_op_count),
+        ]
+        units, _ = shard_units(units, shard)
+
+        return generate_units(self._generate_unit, units, jobs)
+
+    def _generate_unit(self, unit):
+        generate_programs, op_counts, max_op_count = unit
+        seed_unit(self._seed, generate_programs.__name__)
+        return generate_programs(op_counts, max_op_count)
 
 
 def _generate_programs(op_counts, max_op_count, precompile, nominal_gas_cost, setup_code):
@@ -2,20 +2,24 @@ import csv
 import fire
 import random
 import sys
-import json
+from common import Assembler, seed_unit, parse_shard, shard_units, generate_units
+from program_checker import ProgramValidator
+from eip2537_vectors import vector_store
+from program_record import ProgramRecord
 
 
 WRAPPING_INSTRUCTIONS_COUNT = 5
-TESTS_DIR = 'program_generator/data/'
 
 
-class Program(object):
+class Program(ProgramRecord):
     """
     POD object for a program
     """
 
+    __slots__ = ('precompile', 'op_count', 'nominal_gas_cost')
+
     def __init__(self, bytecode, precompile, op_count, nominal_gas_cost):
-        self.bytecode = bytecode
+        super().__init__(bytecode)
         self.precompile = precompile
         self.op_count = op_count
         self.nominal_gas_cost = nominal_gas_cost
@@ -34,8 +38,9 @@ class ProgramGenerator(object):
 
     def __init__(self, seed=0):
         random.seed(a=seed, version=2)
+        self._seed = seed
 
-    def generate(self, fullCsv=True, maxOpCount=50, stepOpCount=5):
+    def generate(self, fullCsv=True, maxOpCount=50, stepOpCount=5, shard=None, jobs=1, validate=False):
         """
         Main entrypoint of the CLI tool. Should dispatch to the desired generation routine and print
         programs to STDOUT
@@ -44,41 +49,59 @@ class ProgramGenerator(object):
         fullCsv (boolean): if set, will generate programs with accompanying data in CSV format
         maxOpCount (integer): maximum number of measured opcodes, defaults to 50
         stepOpCount (integer): by how much the number of measured opcodes should increase, defaults to 5
+        shard (string): if set to `i/N`, will only generate the `i`-th of `N` slices of the programs, with the CSV header only in the first one. The shards concatenated are the output without `shard`
+        jobs (integer): number of processes generating the programs, defaults to 1
+        validate (boolean): if set, will check every program with the static simulator of `program_checker.py`, print the invalid ones to STDERR and, once all the programs are printed, exit with 1 if there are any
         """
 
-        programs = self._do_generate(maxOpCount, stepOpCount)
+        shard_index, _ = parse_shard(shard)
+        programs = self._do_generate(maxOpCount, stepOpCount, shard, jobs)
+        validator = ProgramValidator() if validate else None
+        if validator is not None:
+            programs = validator.validate(programs)
 
         if fullCsv:
             writer = csv.writer(sys.stdout, delimiter=',', quotechar='"')
 
-            opcodes = [program.precompile + program.nominal_gas_cost for program in programs]
-            op_counts = [program.op_count for program in programs]
-            program_ids = [program.precompile + program.nominal_gas_cost +
-                           '_' + str(program.op_count) for program in programs]
-            bytecodes = [program.bytecode for program in programs]
-
             header = ['program_id', 'opcode', 'op_count', 'bytecode']
-            writer.writerow(header)
+            if shard_index == 0:
+                writer.writerow(header)
 
-            rows = zip(program_ids, opcodes, op_counts, bytecodes)
-            for row in rows:
-                writer.writerow(row)
+            for program in programs:
+                opcode = program.precompile + program.nominal_gas_cost
+                program_id = opcode + '_' + str(program.op_count)
+                writer.writerow([program_id, opcode, program.op_count, program.bytecode])
         else:
             for program in programs:
                 print(program.bytecode)
 
-    def _do_generate(self, max_op_count, step_op_count):
+        if validator is not None and not validator.report():
+            sys.exit(1)
+
+    def _do_generate(self, max_op_count, step_op_count, shard, jobs):
+        """
+        Returns the programs of the shard, yielded one by one as they are generated. A unit of generation is all the
+        programs of a precompile
+        """
         op_counts = list(range(0, max_op_count + 1, step_op_count))
-        programs: list[Program] = \
-            _generate_ecrecover_programs(op_counts, max_op_count) + \
-            _generate_bls12_g1add_programs(op_counts, max_op_count) + \
-            _generate_bls12_g2add_programs(op_counts, max_op_count) + \
-            _generate_bls12_g1msm_programs(op_counts, max_op_count) + \
-            _generate_bls12_g2msm_programs(op_counts, max_op_count) + \
-            _generate_bls12_pairing_check_programs(op_counts, max_op_count) + \
-            _generate_bls12_map_fp_to_g1_programs(op_counts, max_op_count) + \
-            _generate_bls12_map_fp_to_g2_programs(op_counts, max_op_count)
-        return programs
+        units = [
+            (_generate_ecrecover_programs, op_counts, max_op_count),
+            (_generate_bls12_g1add_programs, op_counts, max_op_count),
+            (_generate_bls12_g2add_programs, op_counts, max_op_count),
+            (_generate_bls12_g1msm_programs, op_counts, max_op_count),
+            (_generate_bls12_g2msm_programs, op_counts, max_op_count),
+            (_generate_bls12_pairing_check_programs, op_counts, max_op_count),
+            (_generate_bls12_map_fp_to_g1_programs, op_counts, max_op_count),
+            (_generate_bls12_map_fp_to_g2_programs, op_counts, max_op_count),
+        ]
+        units, _ = shard_units(units, shard)
+
+        return generate_units(self._generate_unit, units, jobs)
+
+    def _generate_unit(self, unit):
+        generate_programs, op_counts, max_op_count = unit
+        seed_unit(self._seed, generate_programs.__name__)
+        return generate_programs(op_counts, max_op_count)
 
 
 def _generate_programs(op_counts, max_op_count, precompile, nominal_gas_cost, setup_code):
@@ -117,18 +140,26 @@ def _push2(value):
     return '61' + encoded_value
 
 def _fill_input_data_memory(start, data):
-    code = ''
-    data_pos = 0
+    code = Assembler()
     memory_pos = start
-    while data_pos < len(data):
+    for data_pos in range(0, len(data), 64):
         data_strip = f'{data[data_pos: data_pos + 64]:<064s}'
-        code = code + '7f' + data_strip + _push2(memory_pos) + '52'
-        data_pos = data_pos + 64
+        code.append('7f' + data_strip)
+        code.push(2, memory_pos)
+        code.append('52')
         memory_pos = memory_pos + 32
-    return code
+    return code.hex()
 
-def _generate_from_json(op_counts, max_op_count, test, precompile, address, expected_output_bytes_len):
-    input_data = test['Input']
+def _generate_from_vector(op_counts, max_op_count, vector_set, test, precompile, address, expected_output_bytes_len):
+    setup_code = _setup_code(vector_set, test.name, address, expected_output_bytes_len)
+    return _generate_programs(op_counts, max_op_count, precompile, '_' + test.name, setup_code)
+
+
+def _setup_code(vector_set, name, address, expected_output_bytes_len):
+    """
+    The code putting the input of the vector in memory and the arguments of the call on the stack
+    """
+    input_data = vector_store().vector(vector_set, name).input.hex()
 
     setup_code = _fill_input_data_memory(0, input_data)
     setup_code = setup_code + \
@@ -139,122 +170,93 @@ def _generate_from_json(op_counts, max_op_count, test, precompile, address, expe
         '6000' + \
         '60' + address + \
         '63002fffff'
-
-    return _generate_programs(op_counts, max_op_count, precompile, '_' + test['Name'], setup_code)
+    return setup_code
 
 
 def _generate_bls12_g1add_programs(op_counts, max_op_count):
     precompile = 'BLS12_G1ADD'
     address = '0b'
     programs = []
-    with open(TESTS_DIR + 'eip-2537/add_G1_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print(precompile + '_' + test['Name'] + ',' + str(test['Gas']) + ',1,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 128)
-    with open(TESTS_DIR + 'eip-2537/fail-add_G1_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print(precompile + '_' + test['Name'] + ',375,2,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 128)
+    for test in vector_store().vectors('add_G1_bls'):
+        # print(precompile + '_' + test.name + ',' + str(test.gas) + ',1,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'add_G1_bls', test, precompile, address, 128)
+    for test in vector_store().vectors('fail-add_G1_bls'):
+        # print(precompile + '_' + test.name + ',375,2,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'fail-add_G1_bls', test, precompile, address, 128)
     return programs
 
 def _generate_bls12_g2add_programs(op_counts, max_op_count):
     precompile = 'BLS12_G2ADD'
     address = '0d'
     programs = []
-    with open(TESTS_DIR + 'eip-2537/add_G2_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print(precompile + '_' + test['Name'] + ',' + str(test['Gas']) + ',3,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 256)
-    with open(TESTS_DIR + 'eip-2537/fail-add_G2_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print(precompile + '_' + test['Name'] + ',600,4,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 256)
+    for test in vector_store().vectors('add_G2_bls'):
+        # print(precompile + '_' + test.name + ',' + str(test.gas) + ',3,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'add_G2_bls', test, precompile, address, 256)
+    for test in vector_store().vectors('fail-add_G2_bls'):
+        # print(precompile + '_' + test.name + ',600,4,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'fail-add_G2_bls', test, precompile, address, 256)
     return programs
 
 def _generate_bls12_g1msm_programs(op_counts, max_op_count):
     precompile = 'BLS12_G1MSM'
     address = '0c'
     programs = []
-    with open(TESTS_DIR + 'eip-2537/msm_G1_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        if 'discount_table' not in test['Name']:
-            # print(precompile + '_' + test['Name'] + ',' + str(test['Gas']) + ',5,0')
-            programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 128)
-    with open(TESTS_DIR + 'eip-2537/fail-msm_G1_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print(precompile + '_' + test['Name'] + ',12000,6,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 128)
+    for test in vector_store().vectors('msm_G1_bls'):
+        if 'discount_table' not in test.name:
+            # print(precompile + '_' + test.name + ',' + str(test.gas) + ',5,0')
+            programs = programs + _generate_from_vector(op_counts, max_op_count, 'msm_G1_bls', test, precompile, address, 128)
+    for test in vector_store().vectors('fail-msm_G1_bls'):
+        # print(precompile + '_' + test.name + ',12000,6,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'fail-msm_G1_bls', test, precompile, address, 128)
     return programs
 
 def _generate_bls12_g2msm_programs(op_counts, max_op_count):
     precompile = 'BLS12_G2MSM'
     address = '0e'
     programs = []
-    with open(TESTS_DIR + 'eip-2537/msm_G2_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        if 'discount_table' not in test['Name']:
-            # print(precompile + '_' + test['Name'] + ',' + str(test['Gas']) + ',7,0')
-            programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 256)
-    with open(TESTS_DIR + 'eip-2537/fail-msm_G2_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print(precompile + '_' + test['Name'] + ',22500,8,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 256)
+    for test in vector_store().vectors('msm_G2_bls'):
+        if 'discount_table' not in test.name:
+            # print(precompile + '_' + test.name + ',' + str(test.gas) + ',7,0')
+            programs = programs + _generate_from_vector(op_counts, max_op_count, 'msm_G2_bls', test, precompile, address, 256)
+    for test in vector_store().vectors('fail-msm_G2_bls'):
+        # print(precompile + '_' + test.name + ',22500,8,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'fail-msm_G2_bls', test, precompile, address, 256)
     return programs
 
 def _generate_bls12_pairing_check_programs(op_counts, max_op_count):
     precompile = 'BLS12_PAIRING_CHECK'
     address = '0f'
     programs = []
-    with open(TESTS_DIR + 'eip-2537/pairing_check_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print('"' + precompile + '_' + test['Name'] + '",' + str(test['Gas']) + ',9,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 32)
-    with open(TESTS_DIR + 'eip-2537/fail-pairing_check_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print('"' + precompile + '_' + test['Name'] + '",70300,10,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 32)
+    for test in vector_store().vectors('pairing_check_bls'):
+        # print('"' + precompile + '_' + test.name + '",' + str(test.gas) + ',9,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'pairing_check_bls', test, precompile, address, 32)
+    for test in vector_store().vectors('fail-pairing_check_bls'):
+        # print('"' + precompile + '_' + test.name + '",70300,10,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'fail-pairing_check_bls', test, precompile, address, 32)
     return programs
 
 def _generate_bls12_map_fp_to_g1_programs(op_counts, max_op_count):
     precompile = 'BLS12_MAP_FP_TO_G1'
     address = '10'
     programs = []
-    with open(TESTS_DIR + 'eip-2537/map_fp_to_G1_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print(precompile + '_' + test['Name'] + ',' + str(test['Gas']) + ',11,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 128)
-    with open(TESTS_DIR + 'eip-2537/fail-map_fp_to_G1_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print(precompile + '_' + test['Name'] + ',5500,12,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 128)
+    for test in vector_store().vectors('map_fp_to_G1_bls'):
+        # print(precompile + '_' + test.name + ',' + str(test.gas) + ',11,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'map_fp_to_G1_bls', test, precompile, address, 128)
+    for test in vector_store().vectors('fail-map_fp_to_G1_bls'):
+        # print(precompile + '_' + test.name + ',5500,12,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'fail-map_fp_to_G1_bls', test, precompile, address, 128)
     return programs
 
 def _generate_bls12_map_fp_to_g2_programs(op_counts, max_op_count):
     precompile = 'BLS12_MAP_FP_TO_G2'
     address = '11'
     programs = []
-    with open(TESTS_DIR + 'eip-2537/map_fp2_to_G2_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print(precompile + '_' + test['Name'] + ',' + str(test['Gas']) + ',13,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 128)
-    with open(TESTS_DIR + 'eip-2537/fail-map_fp2_to_G2_bls.json') as f:
-        tests = json.load(f)
-    for test in tests:
-        # print(precompile + '_' + test['Name'] + ',23800,14,0')
-        programs = programs + _generate_from_json(op_counts, max_op_count, test, precompile, address, 128)
+    for test in vector_store().vectors('map_fp2_to_G2_bls'):
+        # print(precompile + '_' + test.name + ',' + str(test.gas) + ',13,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'map_fp2_to_G2_bls', test, precompile, address, 128)
+    for test in vector_store().vectors('fail-map_fp2_to_G2_bls'):
+        # print(precompile + '_' + test.name + ',23800,14,0')
+        programs = programs + _generate_from_vector(op_counts, max_op_count, 'fail-map_fp2_to_G2_bls', test, precompile, address, 128)
     return programs
 
 
@@ -4,21 +4,29 @@ import csv
 import fire
 import sys
 import random
+from functools import partial
 
 import constants
-from common import prepare_opcodes, get_selection, initial_mstore_bytecode, arity, jump_opcode_combo, byte_size_push
+from common import prepare_opcodes, get_selection, initial_mstore_bytecode, arity, byte_size_push, Assembler, seed_unit, parse_shard, shard_units, generate_units
+from program_checker import ProgramValidator
+from program_record import ProgramRecord
 
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
+# the programs end with the `unreachable` placeholder, so the code is padded to at least 2KB when measured
+PADDED_CODE_SIZE = 1 << 11
 
-class Program(object):
+
+class Program(ProgramRecord):
   """
   POD object for a program
   """
 
+  __slots__ = ('dominant',)
+
   def __init__(self, bytecode, dominant):
-    self.bytecode = bytecode
+    super().__init__(bytecode)
     self.dominant = dominant
 
 
@@ -40,11 +48,17 @@ class ProgramGenerator(object):
 
   def __init__(self, seed=0):
     random.seed(a=seed, version=2)
+    self._seed = seed
 
     opcodes = prepare_opcodes(os.path.join(dir_path, 'data', 'opcodes.csv'))
     selection = get_selection(os.path.join(dir_path, 'data', 'selection.csv'))
 
-    self._operations = {int(op, 16): opcodes[op] for op in selection}
+    # several rows can share a value, e.g. MSTORE and MSTORE_COLD, the first one is taken
+    opcodes_by_value = {}
+    for opcode in opcodes:
+      opcodes_by_value.setdefault(opcode['Value'], opcode)
+
+    self._operations = {int(op, 16): opcodes_by_value[op] for op in selection}
 
   # constant list of arithmetic operations
   arithmetic_ops = [0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0x08, 0x09]  # ADD MUL SUB DIV SDIV MOD SMOD ADDMOD MULMOD
@@ -67,6 +81,7 @@ class ProgramGenerator(object):
 
   # CALLDATALOAD, CALLDATASIZE, CALLDATACOPY, CODECOPY, MLOAD
   memory_ops = [0x35, 0x36, 0x37, 0x39, 0x51]
+  codecopy_ops = [0x39]  # CODECOPY, copies within the padded code
 
   mstore_ops = [0x52, 0x53]  # MSTORE, MSTORE8
   jump_ops = [0x56, 0x57]  # JUMP, JUMPI
@@ -104,7 +119,7 @@ class ProgramGenerator(object):
     else:
       return op
 
-  def generate(self, fullCsv=True, count=1, opsLimit=None, bytecodeLimit=None, dominant=None, push=32, cleanStack=False, randomizePush=False, randomizeOpsLimit=False):
+  def generate(self, fullCsv=True, count=1, opsLimit=None, bytecodeLimit=None, dominant=None, push=32, cleanStack=False, randomizePush=False, randomizeOpsLimit=False, shard=None, jobs=1, validate=False):
     """
     Main entrypoint of the CLI tool. Should dispatch to the desired generation routine and print
     programs to STDOUT. If no limits given then by default opsLimit=100
@@ -118,52 +133,64 @@ class ProgramGenerator(object):
     dominant: an opcode that is picked more often then others, probability ~0.5
     push: the range of default push used in the program, values 1..32, assign ops push1..push32
     randomizePush: whether size of arguments should be randomized, up to the value of push
-    cleanStack: whether to clean stack after every opcode or not, default is not
+    cleanStack: whether to clean stack after every opcode or not, default is not. Without it, no memory OPCODEs are generated
+    shard: if set to `i/N`, will only generate the `i`-th of `N` slices of the programs, with the CSV header only in the first one. The shards concatenated are the output without `shard`
+    jobs: number of processes generating the programs, defaults to 1
+    validate: if set, will check every program with the static simulator of `program_checker.py`, print the invalid ones to STDERR and, once all the programs are printed, exit with 1 if there are any
     """
     
     if not opsLimit and not bytecodeLimit:
       opsLimit = 100
 
-    opsLimitMax = opsLimit
-
     if dominant and dominant != 'random' and dominant not in ProgramGenerator.all_ops:
       raise ValueError(dominant)
-    
-    dominant_choice = dominant
+    if dominant and dominant != 'random' and not cleanStack and self._needs_clean_stack(dominant):
+      raise ValueError("memory OPCODEs require cleanStack: {}".format(dominant))
 
-    programs = []
-    for i in range(count):
-      if randomizeOpsLimit:
-        opsLimit = random.randint(1, opsLimitMax)
-      else:
-        opsLimit = opsLimitMax
-
-      if dominant_choice == 'random':
-        dominant = random.choice(ProgramGenerator.all_ops)
-        dominant = self._resolve_op_class(dominant)
-      else:
-        dominant = dominant_choice
-
-      program = self._generate_random_arithmetic(opsLimit, bytecodeLimit, dominant, push, cleanStack, randomizePush)
-      programs.append(program)
+    shard_index, _ = parse_shard(shard)
+    generate_unit = partial(self._generate_unit, opsLimit, bytecodeLimit, dominant, push, cleanStack, randomizePush, randomizeOpsLimit)
+    program_ids, first_program_id = shard_units(range(count), shard)
+    programs = generate_units(generate_unit, program_ids, jobs)
+    validator = ProgramValidator() if validate else None
+    if validator is not None:
+      programs = validator.validate(programs)
 
     if fullCsv:
       writer = csv.writer(sys.stdout, delimiter=',', quotechar='"')
 
-      program_ids = [i for i, program in enumerate(programs)]
-      bytecodes = [program.bytecode for program in programs]
-      dominants = [program.dominant for program in programs]
-
       header = ['program_id', 'bytecode', 'dominant']
-      writer.writerow(header)
+      if shard_index == 0:
+        writer.writerow(header)
 
-      rows = zip(program_ids, bytecodes, dominants)
-      for row in rows:
-        writer.writerow(row)
+      for program_id, program in enumerate(programs, first_program_id):
+        writer.writerow([program_id, program.bytecode, program.dominant])
     else:
       for program in programs:
         print(program.bytecode)
 
+    if validator is not None and not validator.report():
+      sys.exit(1)
+
+  def _generate_unit(self, opsLimitMax, bytecodeLimit, dominant_choice, push, cleanStack, randomizePush, randomizeOpsLimit, program_id):
+    """
+    Generates the program `program_id`, a unit of generation is a single program
+    """
+    seed_unit(self._seed, program_id)
+    if randomizeOpsLimit:
+      opsLimit = random.randint(1, opsLimitMax)
+    else:
+      opsLimit = opsLimitMax
+
+    if dominant_choice == 'random':
+      dominant = random.choice(ProgramGenerator.all_ops)
+      dominant = self._resolve_op_class(dominant)
+      while not cleanStack and self._needs_clean_stack(dominant):
+        dominant = self._resolve_op_class(random.choice(ProgramGenerator.all_ops))
+    else:
+      dominant = dominant_choice
+
+    return [self._generate_random_arithmetic(opsLimit, bytecodeLimit, dominant, push, cleanStack, randomizePush)]
+
   def _generate_random_arithmetic(self, opsLimit, bytecodeLimit, dominant, pushMax, cleanStack, randomizePush):
     """
     Generates one large programs with multiple arithmetic operations
@@ -173,17 +200,17 @@ class ProgramGenerator(object):
       raise ValueError(pushMax)
 
     # generated bytecode
-    bytecode = ''
+    bytecode = Assembler()
     # always preallocate memory to avoid uneven amount of allocation later
-    bytecode += initial_mstore_bytecode()
+    bytecode.append(initial_mstore_bytecode())
     # always include at least one JUMP
-    bytecode += jump_opcode_combo(bytecode, "56")
+    bytecode.jump_combo("56")
     # number of operations including pushes
     ops_count = 0
     if not cleanStack:
       previous_nreturns = 0
 
-    while (not opsLimit or ops_count < opsLimit) and (not bytecodeLimit or len(bytecode)<2*bytecodeLimit):
+    while (not opsLimit or ops_count < opsLimit) and (not bytecodeLimit or bytecode.pc < bytecodeLimit):
       if dominant:
         if random.random() < 0.5:
           op = dominant
@@ -193,6 +220,8 @@ class ProgramGenerator(object):
         op = random.choice(ProgramGenerator.all_ops)
 
       op = self._resolve_op_class(op)
+      if not cleanStack and self._needs_clean_stack(op):
+        continue
 
       operation = self._operations[op]
       nreturns = int(operation['Added to stack'])
@@ -203,51 +232,65 @@ class ProgramGenerator(object):
       # i.e. 23 from 0x23
       opcode = operation['Value'][2:4]
       if op in ProgramGenerator.byte_ops:  # BYTE SIGNEXTEND needs 0-31 value on the top of the stack
-        bytecode += self._random_push(pushMax, randomizePush) if cleanStack or previous_nreturns == 0 else ""
-        bytecode += self._random_push_less_32()
+        bytecode.append(self._random_push(pushMax, randomizePush) if cleanStack or previous_nreturns == 0 else "")
+        bytecode.append(self._random_push_less_32())
       elif op in ProgramGenerator.shift_ops:  # SHL, SHR, SAR need 0-255 value on the top of the stack
-        bytecode += self._random_push(pushMax, randomizePush) if cleanStack or previous_nreturns == 0 else ""
-        bytecode += self._random_push(1, False)
+        bytecode.append(self._random_push(pushMax, randomizePush) if cleanStack or previous_nreturns == 0 else "")
+        bytecode.append(self._random_push(1, False))
+      elif op in ProgramGenerator.codecopy_ops:
+        # `cleanStack` is assumed here, as for the other memory OPCODEs
+        assert cleanStack
+        # size and offset within the padded code, then the memory offset btw 0 and 16KB
+        size = random.randint(0, PADDED_CODE_SIZE)
+        offset = random.randint(0, PADDED_CODE_SIZE - size)
+        bytecode.append(byte_size_push(2, size) + byte_size_push(2, offset) + byte_size_push(2, random.randint(0, (1<<14) - 1)))
       elif op in ProgramGenerator.memory_ops:
         # `cleanStack` is assumed here, otherwise memory OPCODEs might malfunction on arbitrarily large arguments
         assert cleanStack
         # argument btw 0 and 16KB
-        bytecode += ''.join([byte_size_push(2, random.randint(0, (1<<14) - 1)) for _ in range(needed_pushes)])
+        bytecode.append(''.join([byte_size_push(2, random.randint(0, (1<<14) - 1)) for _ in range(needed_pushes)]))
       elif op in ProgramGenerator.mstore_ops:
         # `cleanStack` is assumed here, otherwise memory OPCODEs might malfunction on arbitrarily large arguments
         assert cleanStack
         # first arg is the stored value, then offset
-        bytecode += self._random_push(pushMax, randomizePush)
-        bytecode += byte_size_push(2, random.randint(0, (1<<14) - 1))
+        bytecode.append(self._random_push(pushMax, randomizePush))
+        bytecode.append(byte_size_push(2, random.randint(0, (1<<14) - 1)))
       else:
         # JUMP AND JUMPI are happy to fall in here, as they have their arity (needed pushes) reduced
         # we'll push their destinations later
-        bytecode += ''.join([self._random_push(pushMax, randomizePush) for _ in range(needed_pushes)])
+        bytecode.append(''.join([self._random_push(pushMax, randomizePush) for _ in range(needed_pushes)]))
       ops_count += needed_pushes
 
       if op in ProgramGenerator.jump_ops:
-        bytecode += jump_opcode_combo(bytecode, opcode)
+        bytecode.jump_combo(opcode)
         ops_count += 3
       else:
-        bytecode += opcode
+        bytecode.append(opcode)
         ops_count += 1
 
       if op in ProgramGenerator.push_ops:
-        bytecode += operation['Parameter']
+        # the immediate value of the PUSH, without its opcode
+        bytecode.append(self._random_push(op - 0x5f, False)[2:])
 
       # Pop any results to keep the stack clean for the next iteration. Otherwise mark how many returns remain on
       # the stack after the OPCODE executed.
       if cleanStack:
         # empty the stack
-        bytecode += '50' * nreturns  # POP
+        bytecode.append('50', nreturns)  # POP
         ops_count += nreturns
       else:
         previous_nreturns = nreturns
 
     final_unreachable_placeholder = 'unreachable'
-    bytecode += final_unreachable_placeholder
 
-    return Program(bytecode, self._operations[dominant]['Mnemonic'] if dominant else None)
+    return Program(bytecode.hex() + final_unreachable_placeholder, self._operations[dominant]['Mnemonic'] if dominant else None)
+
+  def _needs_clean_stack(self, op):
+    """
+    Memory OPCODEs might malfunction on arbitrarily large arguments left on the stack, so they are only
+    generated with `cleanStack`
+    """
+    return op in ProgramGenerator.memory_ops or op in ProgramGenerator.mstore_ops
 
   # TODO deprecate in favor of functions from common.py
   def _random_push(self, pushMax, randomizePush):
@@ -0,0 +1,424 @@
+"""
+Static checks of the generated programs, before they are measured.
+
+The checker is an abstract interpreter of the bytecode over the opcode table of `prepare_opcodes`. It follows every
+path of the program, tracking the depth of the stack, the values on it which are constants (pushed or PC, then
+DUPed, SWAPed, added, subtracted or multiplied), the size of the memory and the static gas, i.e. the constant part of
+the `Gas Used` of the table plus the memory expansion. It reports the programs which would fail in the EVM, or would
+not measure what they should:
+
+- stack underflow or overflow,
+- jumps to a location which is not a JUMPDEST, or to a location which is not a constant,
+- opcodes not in the table, if they are executed,
+- a different stack depth at a JUMPDEST, depending on the path,
+- for the programs ending with the `unreachable` placeholder, a CODECOPY reading past the padded code.
+"""
+
+import csv
+import fire
+import os
+import re
+import sys
+
+from common import prepare_opcodes
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+STACK_LIMIT = 1024
+UNREACHABLE_PLACEHOLDER = 'unreachable'
+
+# the opcodes which end the execution
+TERMINATING_OPCODES = ['STOP', 'RETURN', 'REVERT', 'INVALID', 'SELFDESTRUCT']
+
+# the arithmetic on constants, for jumps relative to the PC, e.g. `PC PUSH1 6 ADD JUMPI`
+FOLDED_OPCODES = {
+  'ADD': lambda a, b: a + b,
+  'SUB': lambda a, b: a - b,
+  'MUL': lambda a, b: a * b,
+}
+
+# the memory ranges the opcodes access, as positions of the (offset, size) arguments, 0 is the top of the stack
+MEMORY_ARGUMENTS = {
+  'KECCAK256': [(0, 1)],
+  'CALLDATACOPY': [(0, 2)],
+  'CODECOPY': [(0, 2)],
+  'RETURNDATACOPY': [(0, 2)],
+  'EXTCODECOPY': [(1, 3)],
+  'MCOPY': [(0, 2), (1, 2)],
+  'LOG0': [(0, 1)],
+  'LOG1': [(0, 1)],
+  'LOG2': [(0, 1)],
+  'LOG3': [(0, 1)],
+  'LOG4': [(0, 1)],
+  'CREATE': [(1, 2)],
+  'CALL': [(3, 4), (5, 6)],
+  'CALLCODE': [(3, 4), (5, 6)],
+  'DELEGATECALL': [(2, 3), (4, 5)],
+  'STATICCALL': [(2, 3), (4, 5)],
+  'RETURN': [(0, 1)],
+  'REVERT': [(0, 1)],
+}
+# ...and the ones which access a fixed number of bytes at the offset on the top of the stack
+MEMORY_WORD_ACCESSES = {
+  'MLOAD': 32,
+  'MSTORE': 32,
+  'MSTORE8': 1,
+}
+
+
+class Simulation(object):
+  """
+  POD object for the result of the simulation of a program. `gas` is the static gas of the costliest path, None if the
+  program loops, and `memory_size` the largest memory, in bytes. Memory accessed at offsets which are not constants
+  is not counted
+  """
+
+  __slots__ = ('errors', 'max_stack_depth', 'jumpdests', 'memory_size', 'gas')
+
+  def __init__(self, errors, max_stack_depth, jumpdests, memory_size, gas):
+    self.errors = errors
+    self.max_stack_depth = max_stack_depth
+    self.jumpdests = jumpdests
+    self.memory_size = memory_size
+    self.gas = gas
+
+  @property
+  def valid(self):
+    return not self.errors
+
+
+class StaticSimulator(object):
+  """
+  Simulates programs over an opcode table, as returned by `prepare_opcodes`
+  """
+
+  def __init__(self, opcodes):
+    self._opcodes = _opcode_table(opcodes)
+
+  def simulate(self, bytecode):
+    """
+    Simulates the hex `bytecode`, which can end with the `unreachable` placeholder, and returns a `Simulation`
+    """
+    try:
+      code, padded = _expand_unreachable_code(bytecode)
+    except ValueError:
+      return Simulation(["not a hex bytecode"], 0, [], 0, 0)
+
+    run = _Run(self._opcodes, code, padded)
+    run.simulate()
+    return Simulation(run.errors, run.max_stack_depth, sorted(run.jumpdests), run.memory_words * 32,
+                      None if run.loops else run.gas)
+
+
+class ProgramChecker(object):
+  """
+  Checks programs generated by the `pg_*.py` generators
+
+  Reads the programs' CSV from STDIN and prints out a CSV in the following format:
+  ```
+  | program_id | valid | max_stack_depth | memory_size | static_gas | errors |
+  ```
+  """
+
+  def __init__(self):
+    self._simulator = default_simulator()
+
+  def check(self, onlyInvalid=False):
+    """
+    Main entrypoint of the CLI tool. Exits with 1 if any of the programs is invalid
+
+    Parameters:
+    onlyInvalid (boolean): if set, will only print the invalid programs
+    """
+    reader = csv.DictReader(sys.stdin, delimiter=',', quotechar='"')
+    writer = csv.writer(sys.stdout, delimiter=',', quotechar='"')
+    writer.writerow(['program_id', 'valid', 'max_stack_depth', 'memory_size', 'static_gas', 'errors'])
+
+    invalid_count = 0
+    for row in reader:
+      simulation = self._simulator.simulate(row['bytecode'])
+      if not simulation.valid:
+        invalid_count += 1
+      elif onlyInvalid:
+        continue
+      writer.writerow([row['program_id'], simulation.valid, simulation.max_stack_depth, simulation.memory_size,
+                       simulation.gas if simulation.gas is not None else '', '; '.join(simulation.errors)])
+
+    if invalid_count:
+      sys.exit(1)
+
+
+def default_simulator():
+  """
+  The simulator over the opcode table of the generators, `data/opcodes.csv`
+  """
+  return StaticSimulator(prepare_opcodes(os.path.join(dir_path, 'data', 'opcodes.csv')))
+
+
+class ProgramValidator(object):
+  """
+  The `validate` stage of the generators. `validate` yields the programs unchanged and prints the errors of the invalid
+  ones on STDERR, by their position in the output, starting with 1. When the programs are written, `report` prints the
+  number of invalid programs and tells whether all are valid, the generator decides how to exit
+  """
+
+  def __init__(self, simulator=None):
+    self._simulator = simulator or default_simulator()
+    self.count = 0
+    self.invalid_count = 0
+
+  def validate(self, programs):
+    for program in programs:
+      self.count += 1
+      simulation = self._simulator.simulate(program.bytecode)
+      if not simulation.valid:
+        self.invalid_count += 1
+        print("program {}: {}".format(self.count, '; '.join(simulation.errors)), file=sys.stderr)
+      yield program
+
+  def report(self):
+    print("validated {} programs, {} invalid".format(self.count, self.invalid_count), file=sys.stderr)
+    return self.invalid_count == 0
+
+
+def memory_expansion_cost(words):
+  """
+  The gas of a memory of `words` 32-byte words
+  """
+  return 3 * words + words * words // 512
+
+
+def _opcode_table(opcodes):
+  # the opcodes by value. Several rows can share a value, e.g. SLOAD_COLD and SLOAD_WARM, then the first one is taken.
+  # DUPs and SWAPs are simulated by value, and their gas is in the rows of value ranges, e.g. `0x80 -- 0x8f`
+  table = {}
+  range_gas = {}
+  for opcode in opcodes:
+    values = opcode['Value'].split(' -- ')
+    gas = _static_gas(opcode.get('Gas Used'))
+    if len(values) == 2:
+      for value in range(int(values[0], 16), int(values[1], 16) + 1):
+        range_gas[value] = gas
+      continue
+
+    value = int(values[0], 16)
+    if value in table:
+      continue
+    try:
+      removed, added = int(opcode['Removed from stack']), int(opcode['Added to stack'])
+    except (ValueError, TypeError):
+      continue
+    table[value] = _Opcode(opcode['Mnemonic'], removed, added, gas)
+
+  for value, opcode in table.items():
+    if opcode.gas is None:
+      opcode.gas = range_gas.get(value, 0)
+  return table
+
+
+def _static_gas(gas_used):
+  # the constant part of the formula, e.g. 30 of `30 + 6 * (size of input in words)`
+  match = re.match(r'\s*(\d+)', gas_used) if gas_used is not None else None
+  return int(match.group(1)) if match else None
+
+
+def _expand_unreachable_code(bytecode):
+  # the same code as `_expand_unreachable_code` of `measurements.py` executes
+  if not bytecode.endswith(UNREACHABLE_PLACEHOLDER):
+    return bytes.fromhex(bytecode), False
+
+  code = bytes.fromhex(bytecode[:-len(UNREACHABLE_PLACEHOLDER)])
+  return code + b'\x00' + b'\x03' * ((1 << 11) - len(code) - 1), True
+
+
+def _jumpdests(code):
+  jumpdests = set()
+  pc = 0
+  while pc < len(code):
+    if code[pc] == 0x5b:
+      jumpdests.add(pc)
+    elif 0x60 <= code[pc] <= 0x7f:
+      pc += code[pc] - 0x5f
+    pc += 1
+  return jumpdests
+
+
+class _Opcode(object):
+
+  __slots__ = ('mnemonic', 'removed', 'added', 'gas')
+
+  def __init__(self, mnemonic, removed, added, gas):
+    self.mnemonic = mnemonic
+    self.removed = removed
+    self.added = added
+    self.gas = gas
+
+
+class _State(object):
+  # the stack holds the constant values, None for the others
+
+  __slots__ = ('stack', 'gas', 'memory_words')
+
+  def __init__(self, stack, gas, memory_words):
+    self.stack = stack
+    self.gas = gas
+    self.memory_words = memory_words
+
+  def copy(self):
+    return _State(list(self.stack), self.gas, self.memory_words)
+
+
+class _Run(object):
+  # a simulation of a single program, following the paths from a worklist of (pc, state)
+
+  def __init__(self, opcodes, code, padded):
+    self._opcodes = opcodes
+    self._code = code
+    self._padded = padded
+    self._entries = {}
+    self.jumpdests = _jumpdests(code)
+    self.errors = []
+    self.max_stack_depth = 0
+    self.memory_words = 0
+    self.gas = 0
+    self.loops = False
+
+  def simulate(self):
+    worklist = [(0, _State([], 0, 0))]
+    while worklist:
+      pc, state = worklist.pop()
+      worklist.extend(self._run_path(pc, state))
+
+  def _run_path(self, pc, state):
+    # runs the instructions from pc until the path ends, returns the paths branching off it
+    code = self._code
+    branches = []
+    while True:
+      if pc >= len(code):
+        return self._end(state, branches)
+
+      value = code[pc]
+      if value == 0x5b:
+        state = self._enter(pc, state)
+        if state is None:
+          return branches
+
+      opcode = self._opcodes.get(value)
+      if opcode is None:
+        self._error(pc, "0x{:02x} is not in the opcode table".format(value))
+        return branches
+
+      stack = state.stack
+      if len(stack) < opcode.removed:
+        self._error(pc, "stack underflow, {} needs {} values, {} on the stack".format(opcode.mnemonic, opcode.removed,
+                                                                                      len(stack)))
+        return branches
+
+      state.gas += opcode.gas
+      mnemonic = opcode.mnemonic
+      if mnemonic in MEMORY_ARGUMENTS or mnemonic in MEMORY_WORD_ACCESSES:
+        self._access_memory(pc, opcode, state)
+
+      if 0x60 <= value <= 0x7f:
+        size = value - 0x5f
+        # push data past the end of the code is zeros
+        stack.append(int.from_bytes(code[pc + 1:pc + 1 + size].ljust(size, b'\x00'), 'big'))
+        pc += size
+      elif value == 0x5f:
+        stack.append(0)
+      elif 0x80 <= value <= 0x8f:
+        stack.append(stack[-(value - 0x7f)])
+      elif 0x90 <= value <= 0x9f:
+        depth = value - 0x8f + 1
+        stack[-1], stack[-depth] = stack[-depth], stack[-1]
+      else:
+        arguments = [stack.pop() for _ in range(0, opcode.removed)]
+        if mnemonic in ['JUMP', 'JUMPI']:
+          target = arguments[0]
+          if target is None:
+            self._error(pc, "the target of {} is not a constant".format(mnemonic))
+          elif target not in self.jumpdests:
+            self._error(pc, "{} to {}, which is not a JUMPDEST".format(mnemonic, target))
+          else:
+            if target <= pc:
+              self.loops = True
+            branches.append((target, state.copy() if mnemonic == 'JUMPI' else state))
+          if mnemonic == 'JUMP':
+            return self._end(state, branches)
+        elif mnemonic in TERMINATING_OPCODES:
+          return self._end(state, branches)
+
+        if mnemonic == 'PC':
+          stack.append(pc)
+        elif mnemonic in FOLDED_OPCODES and None not in arguments:
+          stack.append(FOLDED_OPCODES[mnemonic](*arguments) % (1 << 256))
+        else:
+          stack.extend([None] * opcode.added)
+
+      if len(stack) > STACK_LIMIT:
+        self._error(pc, "stack overflow, {} values on the stack".format(len(stack)))
+        return branches
+      self.max_stack_depth = max(self.max_stack_depth, len(stack))
+      pc += 1
+
+  def _enter(self, pc, state):
+    # merges the state into the one seen at the JUMPDEST before, returns None if nothing new is reached
+    seen = self._entries.get(pc)
+    if seen is None:
+      self._entries[pc] = state.copy()
+      return state
+
+    if len(seen.stack) != len(state.stack):
+      self._error(pc, "the stack depth at the JUMPDEST is either {} or {}".format(len(seen.stack), len(state.stack)))
+      return None
+
+    changed = False
+    for i, (a, b) in enumerate(zip(seen.stack, state.stack)):
+      if a is not None and a != b:
+        seen.stack[i] = None
+        changed = True
+    # the gas of a loop is not bounded, so it is not a reason to go around again
+    if state.gas > seen.gas and not self.loops:
+      seen.gas = state.gas
+      changed = True
+    if state.memory_words > seen.memory_words:
+      seen.memory_words = state.memory_words
+      changed = True
+    return seen.copy() if changed else None
+
+  def _access_memory(self, pc, opcode, state):
+    stack = state.stack
+    if opcode.mnemonic in MEMORY_WORD_ACCESSES:
+      ranges = [(stack[-1], MEMORY_WORD_ACCESSES[opcode.mnemonic])]
+    else:
+      ranges = [(stack[-1 - offset], stack[-1 - size]) for offset, size in MEMORY_ARGUMENTS[opcode.mnemonic]]
+
+    if opcode.mnemonic == 'CODECOPY' and self._padded:
+      offset, size = stack[-2], stack[-3]
+      if offset is not None and size is not None and offset + size > len(self._code):
+        self._error(pc, "CODECOPY reads {} bytes past the end of the padded code".format(offset + size - len(self._code)))
+
+    for offset, size in ranges:
+      if offset is None or size is None or size == 0:
+        continue
+      words = (offset + size + 31) // 32
+      if words > state.memory_words:
+        state.gas += memory_expansion_cost(words) - memory_expansion_cost(state.memory_words)
+        state.memory_words = words
+
+  def _end(self, state, branches):
+    self.gas = max(self.gas, state.gas)
+    self.memory_words = max(self.memory_words, state.memory_words)
+    return branches
+
+  def _error(self, pc, message):
+    error = "pc {}: {}".format(pc, message)
+    if error not in self.errors:
+      self.errors.append(error)
+
+
+def main():
+  fire.Fire(ProgramChecker, name='check')
+
+if __name__ == '__main__':
+  main()
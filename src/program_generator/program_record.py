@@ -0,0 +1,38 @@
+"""
+The base of the program POD objects of the generators and of `measurements.py`.
+
+A program keeps its bytecode as raw bytes, half the size of the hex, and declares `__slots__`, so it has no
+`__dict__`. `bytecode` gives the hex, computed on the first access and kept for the following ones.
+"""
+
+
+class ProgramRecord(object):
+  """
+  POD object for a program's bytecode, subclasses add their own `__slots__`
+  """
+
+  __slots__ = ('_code', '_hex')
+
+  def __init__(self, bytecode):
+    self._code = pack_bytecode(bytecode)
+    self._hex = None
+
+  @property
+  def bytecode(self):
+    if self._hex is None:
+      self._hex = self._code.hex() if isinstance(self._code, bytes) else self._code
+    return self._hex
+
+
+def pack_bytecode(bytecode):
+  """
+  The hex bytecode as bytes. Only the lowercase hex is packed, any other spelling (uppercase digits, `0x`)
+  is kept as it is, so the programs are printed exactly as generated
+  """
+  if isinstance(bytecode, bytes):
+    return bytecode
+  try:
+    code = bytes.fromhex(bytecode)
+  except ValueError:
+    return bytecode
+  return code if code.hex() == bytecode else bytecode